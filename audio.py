@@ -1,13 +1,28 @@
 #!/usr/bin/python3
 
+import io
 import os
 import math
 import wave
 import numpy
-import random
 import string
+import struct
+import zlib
 from math import ceil
 from chunk import Chunk
+from collections import namedtuple
+
+from buffers import Buffers, BufferReader
+from files import Files
+from metrics import Metrics
+from parallel import Parallel
+from payload import Payload
+from profiling import Profiler
+from scatter import Scatter
+
+
+# lsb_bits - number of LSB, offset - byte offset in LSB stream, confidence - probability it isn't a random match
+Detection = namedtuple('Detection', ['lsb_bits', 'offset', 'confidence', 'method'])
 
 
 class Audio(object):
@@ -15,6 +30,13 @@ class Audio(object):
     The steganography class working with audio file in WAV format.
 
     """
+    # memory needed per byte of audio block (raw frames, modified copy, payload chunks)
+    BLOCK_MEMORY_FACTOR = 4
+    # PCM sample widths in bytes (8, 16, 24 and 32-bit)
+    SAMPLE_WIDTHS = range(1, 5)
+    # frames per block when secret is recovered to file
+    STREAM_FRAMES = 1 << 16
+
     @staticmethod
     def get_file_capacity(file_path, lsb_bits=1):
         """
@@ -29,9 +51,9 @@ class Audio(object):
         sample_width = audio.getsampwidth()
         sample_count = frame_count * channel_count
 
-        # wave doesn't support more than 2 channels
-        if sample_width not in range(1, 3):
-            raise ValueError('Sample width must be 1 or 2!')
+        # LSB live in the first (low) byte of little-endian samples, any channel count
+        if sample_width not in Audio.SAMPLE_WIDTHS:
+            raise ValueError('Sample width must be 1 to 4 bytes!')
 
         # max available space
         max_bytes = (sample_count * lsb_bits) / 8
@@ -75,181 +97,978 @@ class Audio(object):
         Generate a random string of fixed length.
 
         """
-        letters_digits = string.ascii_letters + string.digits
-        return ''.join(random.choice(letters_digits) for i in range(length))
+        letters_digits = numpy.frombuffer((string.ascii_letters + string.digits).encode(), dtype=numpy.uint8)
+        return letters_digits[numpy.random.randint(0, len(letters_digits), length)].tobytes().decode()
 
     @staticmethod
-    def hide_data(secret, input_file, output_file=None, lsb_bits=1):
+    def get_block_frames(file_path, max_memory=None):
         """
-        Hide secret in audio. Creates copy of file with specific file extension.
+        Returns number of frames processed at once, so one block fits into max_memory bytes.
 
-        :param secret: string data to hide
-        :param input_file: the file for hiding secret
-        :param output_file: output file path, *_secret.wav by default
+        :param file_path: audio file
+        :param max_memory: memory limit in bytes, None for whole file in one block
+        :return: number of frames (multiple of 8) or None
+        """
+        if not max_memory:
+            return None
+
+        audio = wave.open(file_path)
+        frame_size = audio.getnchannels() * audio.getsampwidth()
+        audio.close()
+
+        # raw frames, modified copy and payload chunks per frame
+        block_frames = int(max_memory) // (frame_size * Audio.BLOCK_MEMORY_FACTOR)
+        return max(8, block_frames // 8 * 8)
+
+    @staticmethod
+    def find_data_chunk(file_path):
+        """
+        Locates data chunk in RIFF WAVE file.
+
+        :param file_path: audio file path or seekable binary file object positioned at its start
+        :return: offset and size of audio frames in bytes
+        """
+        if not Buffers.is_path(file_path):
+            return Audio.read_data_chunk(file_path)
+        with open(file_path, 'rb') as file:
+            return Audio.read_data_chunk(file)
+
+    @staticmethod
+    def read_data_chunk(file):
+        riff, riff_size, wave_id = struct.unpack('<4sI4s', file.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError('File is not RIFF WAVE!')
+        while True:
+            chunk_header = file.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError('Data chunk not found!')
+            chunk_name, chunk_size = struct.unpack('<4sI', chunk_header)
+            if chunk_name == b'data':
+                return file.tell(), chunk_size
+            file.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)  # chunks are word aligned
+
+    @staticmethod
+    def get_stream_bytes(header, data, position, count):
+        """
+        Returns count bytes of LSB stream (header, secret, random filler) from position.
+
+        :param header: payload header
+        :param data: secret bytes
+        :param position: byte offset in LSB stream
+        :param count: number of bytes
+        :return: bytes
+        """
+        payload = b''
+        if position < len(header):
+            payload = header[position:position + count]
+        start = max(position - len(header), 0)
+        payload += data[start:start + count - len(payload)]
+        return payload + os.urandom(count - len(payload))
+
+    @staticmethod
+    def split_bits(payload, lsb_bits, count):
+        """
+        Splits payload bytes to lsb_bits wide integers (bits in the order of the stream, MSB first).
+
+        Every 8 integers take lsb_bits bytes, so rows of lsb_bits bytes are read as one 64-bit word and
+        the integers are shifted out of it.
+
+        :param payload: bytes
+        :param lsb_bits: number of lsb bits
+        :param count: number of integers, at most ceil(len(payload) * 8 / lsb_bits)
+        :return: uint8 array of count integers
+        """
+        if lsb_bits == 8:
+            return numpy.frombuffer(payload, dtype=numpy.uint8)[:count]
+        if lsb_bits == 1:
+            return numpy.unpackbits(numpy.frombuffer(payload, dtype=numpy.uint8))[:count]
+
+        rows = int(ceil(len(payload) / lsb_bits))
+        padded = numpy.zeros(rows * lsb_bits, dtype=numpy.uint8)
+        padded[:len(payload)] = numpy.frombuffer(payload, dtype=numpy.uint8)
+        words = numpy.zeros((rows, 8), dtype=numpy.uint8)
+        words[:, 8 - lsb_bits:] = padded.reshape(rows, lsb_bits)
+        words = words.view('>u8').reshape(rows)
+
+        mask = (1 << lsb_bits) - 1
+        chunks = numpy.empty((rows, 8), dtype=numpy.uint8)
+        for index in range(8):
+            chunks[:, index] = (words >> (lsb_bits * (7 - index))) & mask
+        return chunks.reshape(-1)[:count]
+
+    @staticmethod
+    def join_bits(chunks, lsb_bits):
+        """
+        Joins lsb_bits wide integers to bytes, inverse of split_bits.
+
+        :param chunks: uint8 array of integers
+        :param lsb_bits: number of lsb bits
+        :return: bytes, (len(chunks) * lsb_bits) / 8
+        """
+        if lsb_bits == 8:
+            return chunks.tobytes()
+        if lsb_bits == 1:
+            return numpy.packbits(chunks).tobytes()[:len(chunks) // 8]
+
+        count = len(chunks)
+        rows = int(ceil(count / 8))
+        padded = numpy.zeros(rows * 8, dtype=numpy.uint8)
+        padded[:count] = chunks
+        padded = padded.reshape(rows, 8)
+
+        words = numpy.zeros(rows, dtype=numpy.uint64)
+        for index in range(8):
+            words |= padded[:, index].astype(numpy.uint64) << (lsb_bits * (7 - index))
+        data = words.astype('>u8').view(numpy.uint8).reshape(rows, 8)[:, 8 - lsb_bits:]
+        return data.tobytes()[:count * lsb_bits // 8]
+
+    @staticmethod
+    def embed_samples(samples, payload, sample_width, lsb_bits):
+        """
+        Hides payload bytes in lsb_bits of first samples in place, only the low byte of samples is touched.
+
+        :param samples: writable uint8 array of raw frames
+        :param payload: bytes to hide, at most (samples * lsb_bits) / 8
+        :param sample_width: sample width in bytes
         :param lsb_bits: number of lsb bits to use
         """
+        if not payload:
+            return
 
-        buffer = '2qlmRnoPQkreX45Qmt93dr86AfAG68Awd78'
+        bit_height = int(ceil(len(payload) * 8 / lsb_bits))  # Number of used samples
+        with Profiler.span('audio.unpack', len(payload)):
+            chunks = Audio.split_bits(payload, lsb_bits, bit_height)
 
-        if not output_file:
-            output_file = str(input_file).replace('.wav', '_secret.wav')
+        with Profiler.span('audio.embed', bit_height * sample_width):
+            low_bytes = samples[:bit_height * sample_width:sample_width]
+            low_bytes &= 0xFF ^ ((1 << lsb_bits) - 1)
+            low_bytes |= chunks
 
-        # input audio parameters
-        audio = wave.open(input_file)
-        channel_count = audio.getnchannels()
-        frame_count = audio.getnframes()
-        sample_width = audio.getsampwidth()
-        sample_count = frame_count * channel_count
-        audio_frames = audio.readframes(frame_count)
+    @staticmethod
+    def extract_samples(samples, sample_width, lsb_bits):
+        """
+        Reads lsb_bits of all samples.
+
+        :param samples: uint8 array of raw frames
+        :param sample_width: sample width in bytes
+        :param lsb_bits: number of used lsb bits
+        :return: bytes, (samples * lsb_bits) / 8
+        """
+        sample_count = len(samples) // sample_width
+
+        with Profiler.span('audio.unpack', sample_count * sample_width):
+            chunks = samples[:sample_count * sample_width:sample_width] & ((1 << lsb_bits) - 1)
+
+        with Profiler.span('audio.pack', sample_count * sample_width):
+            return Audio.join_bits(chunks, lsb_bits)
+
+    @staticmethod
+    def embed_block(frames, payload, sample_width, lsb_bits):
+        """
+        Hides payload bytes in lsb_bits of first samples of block, the rest of the block is untouched.
+
+        :param frames: raw audio frames
+        :param payload: bytes to hide, at most (samples * lsb_bits) / 8
+        :param sample_width: sample width in bytes
+        :param lsb_bits: number of lsb bits to use
+        :return: modified frames
+        """
+        if not payload:
+            return frames
+
+        frames = bytearray(frames)
+        Audio.embed_samples(numpy.frombuffer(frames, dtype=numpy.uint8), payload, sample_width, lsb_bits)
+        return frames
+
+    @staticmethod
+    def extract_block(frames, sample_width, lsb_bits):
+        """
+        Reads lsb_bits of all samples in block.
+
+        :param frames: raw audio frames
+        :param sample_width: sample width in bytes
+        :param lsb_bits: number of used lsb bits
+        :return: bytes, (samples * lsb_bits) / 8
+        """
+        return Audio.extract_samples(numpy.frombuffer(frames, dtype=numpy.uint8), sample_width, lsb_bits)
+
+    @staticmethod
+    def prepare_payload(secret, sample_count, lsb_bits=1, fill=False, compression=None, flags=0):
+        """
+        Packs secret with header and checks capacity, number of LSB is increased when the secret doesn't fit.
+
+        :param secret: string, bytes or binary file object (stdin or file, read block by block) to hide
+        :param sample_count: number of samples of carrier
+        :param lsb_bits: number of lsb bits to use
+        :param fill: LSB stream covers the whole capacity
+        :param compression: codec compressing the secret (zlib, bz2, lzma or auto), uncompressed by default
+        :param flags: payload flags of secret compressed by caller (see Payload.compress)
+        :return: header, secret bytes, number of lsb bits, length of LSB stream in bytes
+        """
+        if isinstance(secret, str):
+            data = secret.encode()
+        elif hasattr(secret, 'read'):
+            data = Payload.open_file(secret)
+        else:
+            data = bytes(secret)
 
-        # wave doesn't support more than 2 channels
-        if sample_width not in range(1, 3):
-            raise ValueError('Sample width must be 1 or 2!')
         if lsb_bits > 8:
             raise ValueError('You cannot use more than 8 LSB!')
 
+        if compression:
+            flags, data = Payload.compress(data, compression, capacity=sample_count // 8)
+
         # max available bytes for defined lsb_bits
         max_bytes = (sample_count * lsb_bits) // 8
 
-        # data - secret, cipher, buffers
-        secret_bytes_size = len(buffer) + len(secret) + len(buffer)
+        # data - header, secret
+        secret_bytes_size = Payload.HEADER_SIZE + len(data)
 
         if max_bytes < secret_bytes_size:
             required_bits = math.ceil(secret_bytes_size * 8 / sample_count)
             if required_bits > 8:
                 raise ValueError('File capacity is not sufficient!')
             lsb_bits = required_bits
-            max_bytes = (sample_count * lsb_bits) / 8
+            max_bytes = (sample_count * lsb_bits) // 8
             print('Target is too small to hide data! It requires at least {} LSB bits. Current file offers {} kB only. '
                   'Increasing number of LSB bits to {}, available space {} kB'.format(str(required_bits),
                                                                                       str(max_bytes / 1024),
                                                                                       str(required_bits),
                                                                                       str(max_bytes / 1024)))
-        rest_space = int(max_bytes - secret_bytes_size)
+        if not fill:
+            max_bytes = secret_bytes_size
 
-        # append start_buffer and end_buffer, add random salt to the end
-        secret_string = buffer + secret + buffer + Audio.random_string(rest_space)
-        secret_bytes = secret_string.encode()
-        secret_bit_size = len(secret_bytes) * 8
-        secret_byte_size = int(ceil(len(secret_bytes) / lsb_bits)) * lsb_bits  # Rounded up
+        return Payload.pack_header(data, lsb_bits, flags), data, lsb_bits, max_bytes
 
-        secret_bits = numpy.zeros(shape=(secret_byte_size, 8), dtype=numpy.uint8)
-        secret_bits[:secret_byte_size, :] = numpy\
-            .unpackbits(numpy.frombuffer(secret_bytes, dtype=numpy.uint8, count=secret_byte_size))\
-            .reshape(secret_byte_size, 8)
+    @staticmethod
+    def hide_data(secret, input_file, output_file=None, lsb_bits=1, block_frames=None, fill=False, mmap=False,
+                  compression=None, flags=0, scatter_key=None, workers=None):
+        """
+        Hide secret in audio. Creates copy of file with specific file extension.
 
-        if sample_width == 1:
-            audio_dtype = numpy.uint8
-        else:
-            audio_dtype = numpy.uint16
+        The secret is stored with binary header (see Payload) at the start of LSB stream.
+
+        :param secret: string, bytes or binary file object (stdin or file, read block by block) to hide
+        :param input_file: the file for hiding secret, path or readable binary file object
+        :param output_file: output file path or writable binary file object, *_secret.wav by default
+        :param lsb_bits: number of lsb bits to use
+        :param block_frames: number of frames processed at once (multiple of 8), whole file by default
+        :param fill: fill the rest of the capacity by random bytes, samples after secret are untouched by default
+        :param mmap: copy the file and rewrite only samples holding the secret through memory map
+        :param compression: codec compressing the secret (zlib, bz2, lzma or auto), uncompressed by default
+        :param flags: payload flags of secret compressed by caller (see Payload.compress)
+        :param scatter_key: key bytes, LSB stream is scattered over samples chosen by the key (see Scatter)
+        :param workers: number of processes embedding segments of the file in place (see Parallel)
+        :return: output file path
+        """
+
+        if not output_file:
+            if not Buffers.is_path(input_file):
+                raise ValueError('Output file is required when carrier isn\'t a file path!')
+            output_file = str(input_file).replace('.wav', '_secret.wav')
+
+        # input audio parameters
+        audio = wave.open(input_file)
+        channel_count = audio.getnchannels()
+        frame_count = audio.getnframes()
+        sample_width = audio.getsampwidth()
+        sample_count = frame_count * channel_count
+
+        # LSB live in the first (low) byte of little-endian samples, any channel count
+        if sample_width not in Audio.SAMPLE_WIDTHS:
+            raise ValueError('Sample width must be 1 to 4 bytes!')
+        if block_frames is None:
+            block_frames = max(frame_count, 1)
+        elif block_frames % 8:
+            raise ValueError('Block size must be multiple of 8 frames!')
 
-        bit_height = int(ceil(secret_bit_size / lsb_bits))  # Number of used LSB bits
+        header, data, lsb_bits, max_bytes = Audio.prepare_payload(secret, sample_count, lsb_bits, fill, compression,
+                                                                  flags)
 
-        audio_bits = numpy.unpackbits(numpy.frombuffer(audio_frames, dtype=audio_dtype,
-                                                       count=bit_height).view(numpy.uint8)).reshape(bit_height,
-                                                                                                    8 * sample_width)
-        audio_bits[:, 8 - lsb_bits:8] = secret_bits.reshape(bit_height, lsb_bits)
+        if scatter_key is not None:
+            audio.close()
+            Audio.hide_data_scattered(header, data, input_file, output_file, lsb_bits, scatter_key)
+            print('Secret was successfully hidden! LSB: {}. Destination file: {}.'.format(str(lsb_bits),
+                                                                                      str(output_file)))
+            return output_file
 
-        stego = numpy.packbits(audio_bits).tobytes()
+        if mmap or workers and workers > 1:
+            audio.close()
+            if workers and workers > 1:
+                Audio.hide_data_parallel(header, data, input_file, output_file, lsb_bits, max_bytes, workers)
+            else:
+                Audio.hide_data_mmap(header, data, input_file, output_file, lsb_bits, max_bytes, block_frames)
+            print('Secret was successfully hidden! LSB: {}. Destination file: {}.'.format(str(lsb_bits),
+                                                                                      str(output_file)))
+            return output_file
 
-        # modified bytes
         stego_audio = wave.open(output_file, "w")
         stego_audio.setparams(audio.getparams())
-        stego_audio.writeframes(stego)
+
+        # byte cursor in hidden data, blocks of 8*n frames always hold whole bytes
+        position = 0
+        while True:
+            with Profiler.span('audio.read') as span:
+                frames = audio.readframes(block_frames)
+                span['bytes'] = len(frames)
+            if not frames:
+                break
+            Profiler.count('audio.blocks')
+            block_bytes = min((len(frames) // sample_width * lsb_bits) // 8, max_bytes - position)
+            with Profiler.span('audio.filler', block_bytes):
+                payload = Audio.get_stream_bytes(header, data, position, block_bytes)
+            frames = Audio.embed_block(frames, payload, sample_width, lsb_bits)
+            with Profiler.span('audio.write', len(frames)):
+                stego_audio.writeframes(frames)
+            position += block_bytes
+
         stego_audio.close()
+        audio.close()
+
+        if Buffers.is_path(output_file):
+            print('Secret was successfully hidden! LSB: {}. Destination file: {}.'.format(str(lsb_bits),
+                                                                                      str(output_file)))
+        else:
+            print('Secret was successfully hidden! LSB: {}.'.format(str(lsb_bits)))
+        return output_file
+
+    @staticmethod
+    def hide_buffer(secret, carrier, output=None, lsb_bits=1, fill=False, compression=None, flags=0,
+                    scatter_key=None):
+        """
+        Hide secret in WAV held in memory or read from a stream, nothing is written to disk.
+
+        WAV in bytes-like object is copied once to the returned bytearray and the secret is embedded there in
+        place. Streams are read and written block by block (STREAM_FRAMES), only the output is kept in memory.
+
+        :param secret: string, bytes or binary file object to hide
+        :param carrier: WAV as bytes, bytearray, memoryview or readable binary file object (BytesIO,
+                        socket.makefile('rb'), pipe)
+        :param output: writable binary file object the stego WAV is written to, returned buffer by default
+        :param lsb_bits: number of lsb bits to use
+        :param fill: fill the rest of the capacity by random bytes
+        :param compression: codec compressing the secret (zlib, bz2, lzma or auto), uncompressed by default
+        :param flags: payload flags of secret compressed by caller (see Payload.compress)
+        :param scatter_key: key bytes, LSB stream is scattered over samples chosen by the key (bytes-like carrier)
+        :return: stego WAV as bytearray (bytes-like carrier) or memoryview (stream), output if given
+        """
+        if Buffers.is_buffer(carrier) and output is None:
+            stego = bytearray(carrier)
+            samples, sample_width, sample_count = Audio.open_samples(stego)
+            header, data, lsb_bits, max_bytes = Audio.prepare_payload(secret, sample_count, lsb_bits, fill,
+                                                                      compression, flags)
+            if scatter_key is not None:
+                Audio.embed_scattered(samples, header, data, sample_width, lsb_bits, scatter_key)
+            else:
+                Audio.embed_stream(samples, header, data, sample_width, lsb_bits, max_bytes, Audio.STREAM_FRAMES)
+            del samples
+            print('Secret was successfully hidden! LSB: {}.'.format(str(lsb_bits)))
+            return stego
+
+        if scatter_key is not None:
+            raise ValueError('Scattering needs random access to samples, pass the carrier as bytes!')
+        stream = output if output is not None else io.BytesIO()
+        Audio.hide_data(secret, Buffers.open(carrier), stream, lsb_bits, Audio.STREAM_FRAMES, fill,
+                        compression=compression, flags=flags)
+        return output if output is not None else stream.getbuffer()
+
+    @staticmethod
+    def hide_data_mmap(header, data, input_file, output_file, lsb_bits, max_bytes, block_frames):
+        """
+        Copies input file and modifies only samples holding LSB stream in place through numpy.memmap.
+
+        :param header: payload header
+        :param data: secret bytes
+        :param input_file: the file for hiding secret
+        :param output_file: output file path
+        :param lsb_bits: number of lsb bits to use
+        :param max_bytes: length of LSB stream in bytes
+        :param block_frames: number of frames processed at once (multiple of 8)
+        """
+        audio = wave.open(input_file)
+        channel_count = audio.getnchannels()
+        sample_width = audio.getsampwidth()
+        sample_count = audio.getnframes() * channel_count
+        audio.close()
+
+        if os.path.abspath(input_file) == os.path.abspath(output_file):
+            raise ValueError('Output file must differ from input file!')
+        with Profiler.span('audio.copy', os.path.getsize(input_file)):
+            Files.copy_file(input_file, output_file)
+        offset, size = Audio.find_data_chunk(output_file)
+
+        used_samples = min(sample_count, int(ceil(max_bytes * 8 / lsb_bits)))
+        samples = numpy.memmap(output_file, dtype=numpy.uint8, mode='r+', offset=offset,
+                               shape=(used_samples * sample_width,))
+        Audio.embed_stream(samples, header, data, sample_width, lsb_bits, max_bytes,
+                           block_frames * channel_count if block_frames else None)
+        with Profiler.span('audio.write'):
+            samples.flush()
+        del samples
+
+    @staticmethod
+    def embed_stream(samples, header, data, sample_width, lsb_bits, max_bytes, block_samples=None):
+        """
+        Hides LSB stream in samples in place, block by block.
+
+        :param samples: writable uint8 array of raw frames
+        :param header: payload header
+        :param data: secret bytes
+        :param sample_width: sample width in bytes
+        :param lsb_bits: number of lsb bits to use
+        :param max_bytes: length of LSB stream in bytes
+        :param block_samples: number of samples processed at once (multiple of 8), all used samples by default
+        """
+        used_samples = min(len(samples) // sample_width, int(ceil(max_bytes * 8 / lsb_bits)))
+        block_samples = block_samples or max(used_samples, 1)
+        position = 0
+        for first in range(0, used_samples, block_samples):
+            last = min(first + block_samples, used_samples)
+            Profiler.count('audio.blocks')
+            region = samples[first * sample_width:last * sample_width]
+            block_bytes = min(((last - first) * lsb_bits) // 8, max_bytes - position)
+            with Profiler.span('audio.filler', block_bytes):
+                payload = Audio.get_stream_bytes(header, data, position, block_bytes)
+            Audio.embed_samples(region, payload, sample_width, lsb_bits)
+            position += block_bytes
 
-        print('Secret was successfully hidden! LSB: {}. Destination file: {}.'.format(str(lsb_bits), str(output_file)))
+    @staticmethod
+    def hide_data_parallel(header, data, input_file, output_file, lsb_bits, max_bytes, workers):
+        """
+        Copies input file and embeds LSB stream by a process pool. Samples holding the stream are split into
+        contiguous segments, every worker maps its segment of the output file and embeds its part of the stream
+        in place. Random filler is generated by workers.
+
+        :param header: payload header
+        :param data: secret bytes
+        :param input_file: the file for hiding secret
+        :param output_file: output file path
+        :param lsb_bits: number of lsb bits to use
+        :param max_bytes: length of LSB stream in bytes
+        :param workers: number of processes
+        """
+        if os.path.abspath(input_file) == os.path.abspath(output_file):
+            raise ValueError('Output file must differ from input file!')
+        with Profiler.span('audio.copy', os.path.getsize(input_file)):
+            Files.copy_file(input_file, output_file)
+        samples, sample_width, sample_count = Audio.open_samples(output_file)
+        offset = samples.offset
+        del samples
+
+        # segments of multiples of 8 samples hold whole bytes of the stream
+        stream_bytes = len(header) + len(data)
+        used_samples = min(sample_count, int(ceil(max_bytes * 8 / lsb_bits)))
+        arguments = []
+        for first, last in Parallel.split(used_samples, workers, 8):
+            position = first * lsb_bits // 8
+            count = min((last - first) * lsb_bits // 8, max_bytes - position)
+            payload = Audio.get_stream_bytes(header, data, position, max(min(count, stream_bytes - position), 0))
+            arguments.append((output_file, offset + first * sample_width, (last - first) * sample_width, payload,
+                              count, sample_width, lsb_bits))
+        with Profiler.span('audio.embed', used_samples * sample_width):
+            Parallel.map(Audio.embed_segment, arguments, workers)
+
+    @staticmethod
+    def embed_segment(file_path, offset, size, payload, count, sample_width, lsb_bits):
+        """
+        Embeds part of LSB stream into segment of audio file in place (in worker process).
+
+        :param file_path: audio file
+        :param offset: file offset of the first sample of segment
+        :param size: segment size in bytes
+        :param payload: stream bytes of segment without filler
+        :param count: stream bytes of segment, the rest after payload is random
+        :param sample_width: sample width in bytes
+        :param lsb_bits: number of lsb bits
+        """
+        samples = numpy.memmap(file_path, dtype=numpy.uint8, mode='r+', offset=offset, shape=(size,))
+        Audio.embed_samples(samples, payload + os.urandom(count - len(payload)), sample_width, lsb_bits)
+        samples.flush()
+        del samples
+
+    @staticmethod
+    def extract_segment(file_path, offset, size, sample_width, lsb_bits):
+        """
+        Reads LSB stream of segment of audio file (in worker process).
+
+        :return: bytes
+        """
+        samples = numpy.memmap(file_path, dtype=numpy.uint8, mode='r', offset=offset, shape=(size,))
+        try:
+            return Audio.extract_samples(samples, sample_width, lsb_bits)
+        finally:
+            del samples
+
+    @staticmethod
+    def recover_parallel(input_file, lsb_bits=None, workers=None):
+        """
+        Recover header and payload, segments of samples holding the payload are read by a process pool.
+
+        :param input_file: the file with hidden secret
+        :param lsb_bits: the number of used lsb bits, detected from header by default
+        :param workers: number of processes
+        :return: Header and payload bytes or None if the file doesn't start with header
+        """
+        blocks = Audio.iter_payload(input_file, lsb_bits, 8)
+        header = next(blocks)
+        blocks.close()
+        if header is None:
+            return None
+
+        samples, sample_width, sample_count = Audio.open_samples(input_file)
+        offset = samples.offset
+        del samples
+        total_bytes = Payload.HEADER_SIZE + header.length
+        used_samples = min(sample_count, int(ceil(total_bytes * 8 / header.lsb_bits / 8)) * 8)
+        arguments = [(input_file, offset + first * sample_width, (last - first) * sample_width, sample_width,
+                      header.lsb_bits) for first, last in Parallel.split(used_samples, workers or 1, 8)]
+        with Profiler.span('audio.extract', used_samples * sample_width):
+            output = b''.join(Parallel.map(Audio.extract_segment, arguments, workers))
+        data = output[Payload.HEADER_SIZE:total_bytes]
+        Payload.verify(header, data)
+        return header, data
+
+    @staticmethod
+    def open_samples(file_path, mode='r'):
+        """
+        Memory maps audio frames of file, frames of WAV held in memory are viewed without copy.
+
+        :param file_path: audio file path, bytes, bytearray or memoryview
+        :param mode: 'r' or 'r+' (file path only)
+        :return: uint8 memmap (array for buffers) of frames, sample width, number of samples
+        """
+        buffer = Buffers.is_buffer(file_path)
+        audio = wave.open(BufferReader(file_path) if buffer else file_path)
+        sample_width = audio.getsampwidth()
+        sample_count = audio.getnframes() * audio.getnchannels()
+        audio.close()
+        if sample_width not in Audio.SAMPLE_WIDTHS:
+            raise ValueError('Sample width must be 1 to 4 bytes!')
+        offset, size = Audio.find_data_chunk(BufferReader(file_path) if buffer else file_path)
+        if buffer:
+            # view of the buffer, writable for bytearray
+            return numpy.frombuffer(file_path, dtype=numpy.uint8, count=sample_count * sample_width,
+                                    offset=offset), sample_width, sample_count
+        samples = numpy.memmap(file_path, dtype=numpy.uint8, mode=mode, offset=offset,
+                               shape=(sample_count * sample_width,))
+        return samples, sample_width, sample_count
+
+    @staticmethod
+    def hide_data_scattered(header, data, input_file, output_file, lsb_bits, scatter_key):
+        """
+        Copies input file and hides LSB stream in samples chosen by keyed permutation (see Scatter). Only samples
+        holding header and secret are read and written, in blocks of Scatter.BLOCK samples.
+
+        :param header: payload header
+        :param data: secret bytes
+        :param input_file: the file for hiding secret
+        :param output_file: output file path
+        :param lsb_bits: number of lsb bits to use
+        :param scatter_key: key bytes
+        """
+        if os.path.abspath(input_file) == os.path.abspath(output_file):
+            raise ValueError('Output file must differ from input file!')
+        with Profiler.span('audio.copy', os.path.getsize(input_file)):
+            Files.copy_file(input_file, output_file)
+        samples, sample_width, sample_count = Audio.open_samples(output_file, 'r+')
+        Audio.embed_scattered(samples, header, data, sample_width, lsb_bits, scatter_key)
+        with Profiler.span('audio.write'):
+            samples.flush()
+        del samples
+
+    @staticmethod
+    def embed_scattered(samples, header, data, sample_width, lsb_bits, scatter_key):
+        """
+        Hides LSB stream in samples chosen by keyed permutation in place, in blocks of Scatter.BLOCK samples.
+
+        :param samples: writable uint8 array of raw frames
+        :param header: payload header
+        :param data: secret bytes
+        :param sample_width: sample width in bytes
+        :param lsb_bits: number of lsb bits to use
+        :param scatter_key: key bytes
+        """
+        sample_count = len(samples) // sample_width
+        # low bytes of samples, positions of Scatter are sample indices
+        low_bytes = samples[::sample_width]
+        total_bytes = len(header) + len(data)
+        scatter = Scatter(scatter_key, sample_count)
+        for start, positions in scatter.iter_positions(int(ceil(total_bytes * 8 / lsb_bits))):
+            Profiler.count('audio.blocks')
+            position = start * lsb_bits // 8
+            payload = Audio.get_stream_bytes(header, data, position,
+                                             min(len(positions) * lsb_bits // 8, total_bytes - position))
+            chunks = Audio.split_bits(payload, lsb_bits, len(positions))
+            with Profiler.span('audio.embed', len(positions) * sample_width):
+                values = low_bytes[positions]
+                values &= 0xFF ^ ((1 << lsb_bits) - 1)
+                values |= chunks
+                low_bytes[positions] = values
+
+    @staticmethod
+    def recover_scattered(input_file, scatter_key, lsb_bits=None):
+        """
+        Recover header and payload hidden by hide_data_scattered, only samples holding them are read.
+
+        :param input_file: the file with hidden secret
+        :param scatter_key: key bytes
+        :param lsb_bits: the number of used lsb bits, detected from header by default
+        :return: Header and payload bytes or None if no header is found at positions of the key
+        """
+        samples, sample_width, sample_count = Audio.open_samples(input_file)
+        low_bytes = samples[::sample_width]
+        scatter = Scatter(scatter_key, sample_count)
+
+        header = None
+        for bits in ([lsb_bits] if lsb_bits else range(1, 9)):
+            count = int(ceil(Payload.HEADER_SIZE * 8 / bits))
+            if count > sample_count:
+                continue
+            chunks = low_bytes[scatter.get_positions(0, count)] & ((1 << bits) - 1)
+            header = Payload.parse_header(Audio.join_bits(chunks, bits))
+            if header and header.lsb_bits == bits:
+                break
+            header = None
+        if header is None:
+            return None
+
+        total_bytes = Payload.HEADER_SIZE + header.length
+        output = bytearray()
+        for start, positions in scatter.iter_positions(int(ceil(total_bytes * 8 / header.lsb_bits))):
+            Profiler.count('audio.blocks')
+            with Profiler.span('audio.extract', len(positions) * sample_width):
+                output += Audio.join_bits(low_bytes[positions] & ((1 << header.lsb_bits) - 1), header.lsb_bits)
+        del low_bytes, samples
+        data = bytes(output[Payload.HEADER_SIZE:total_bytes])
+        Payload.verify(header, data)
+        return header, data
+
+    @staticmethod
+    def recover_payload(input_file, lsb_bits=None, block_frames=None, scatter_key=None, workers=None):
+        """
+        Recover data stored with binary header, compressed payload is decompressed.
+
+        :param input_file: the file with hidden secret
+        :param lsb_bits: the number of used lsb bits, detected from header by default
+        :param block_frames: number of frames processed at once (multiple of 8), whole payload by default
+        :param scatter_key: key bytes of secret hidden with scatter_key
+        :param workers: number of processes reading segments of the file
+        :return: payload bytes or None if the file doesn't start with header
+        """
+        frame = Audio.recover_frame(input_file, lsb_bits, block_frames, scatter_key, workers)
+        if frame is None:
+            return None
+        header, data = frame
+        return Payload.decompress(data, header.flags)
+
+    @staticmethod
+    def recover_buffer(carrier, lsb_bits=None, scatter_key=None):
+        """
+        Recover data stored with binary header from WAV held in memory or read from a stream, compressed payload is
+        decompressed. The stream is read only up to the end of payload.
+
+        :param carrier: WAV as bytes, bytearray, memoryview or readable binary file object
+        :param lsb_bits: the number of used lsb bits, detected from header by default
+        :param scatter_key: key bytes of secret hidden with scatter_key (bytes-like carrier)
+        :return: payload bytes or None if the carrier doesn't start with header
+        """
+        if scatter_key is None:
+            carrier = Buffers.open(carrier)
+        elif not Buffers.is_buffer(carrier):
+            raise ValueError('Scattering needs random access to samples, pass the carrier as bytes!')
+        return Audio.recover_payload(carrier, lsb_bits, Audio.STREAM_FRAMES, scatter_key)
 
     @staticmethod
-    def recover_data(input_file, lsb_bits=1):
+    def recover_frame(input_file, lsb_bits=None, block_frames=None, scatter_key=None, workers=None):
+        """
+        Recover header and payload as stored. Reads only the header and payload length bytes.
+
+        Encrypted payloads are decompressed by caller after decryption.
+
+        :param input_file: the file with hidden secret
+        :param lsb_bits: the number of used lsb bits, detected from header by default
+        :param block_frames: number of frames processed at once (multiple of 8), whole payload by default
+        :param scatter_key: key bytes of secret hidden with scatter_key
+        :param workers: number of processes reading segments of the file
+        :return: Header and payload bytes or None if the file doesn't start with header
+        """
+        if scatter_key is not None:
+            return Audio.recover_scattered(input_file, scatter_key, lsb_bits)
+        if workers and workers > 1:
+            return Audio.recover_parallel(input_file, lsb_bits, workers)
+        blocks = Audio.iter_payload(input_file, lsb_bits, block_frames)
+        header = next(blocks)
+        if header is None:
+            return None
+        return header, b''.join(blocks)
+
+    @staticmethod
+    def iter_payload(input_file, lsb_bits=None, block_frames=None):
+        """
+        Recover payload stored with binary header block by block. Length and checksum are verified after the last
+        block.
+
+        :param input_file: the file with hidden secret
+        :param lsb_bits: the number of used lsb bits, detected from header by default
+        :param block_frames: number of frames processed at once (multiple of 8), whole payload by default
+        :return: generator of Header (None if the file doesn't start with header) followed by payload blocks
+        """
+
+        # input stego audio parameters
+        stego_audio = wave.open(input_file)
+        try:
+            channel_count = stego_audio.getnchannels()
+            sample_width = stego_audio.getsampwidth()
+
+            # LSB live in the first (low) byte of little-endian samples, any channel count
+            if sample_width not in Audio.SAMPLE_WIDTHS:
+                raise ValueError('Sample width must be 1 to 4 bytes!')
+            if block_frames is not None and block_frames % 8:
+                raise ValueError('Block size must be multiple of 8 frames!')
+
+            # frames holding header for 1 LSB, other LSB counts need less, multiple of 8 holds whole bytes
+            header_frames = int(ceil(Payload.HEADER_SIZE * 8 / channel_count / 8)) * 8
+            with Profiler.span('audio.read') as span:
+                frames = stego_audio.readframes(header_frames)
+                span['bytes'] = len(frames)
+
+            header = None
+            for bits in ([lsb_bits] if lsb_bits else range(1, 9)):
+                header = Payload.parse_header(Audio.extract_block(frames, sample_width, bits))
+                if header and header.lsb_bits == bits:
+                    break
+                header = None
+            yield header
+            if header is None:
+                return
+
+            # frames holding header and payload
+            total_bytes = Payload.HEADER_SIZE + header.length
+            remaining_frames = int(ceil(ceil(total_bytes * 8 / header.lsb_bits) / channel_count))
+            if block_frames is None:
+                block_frames = max(remaining_frames, 1)
+
+            # byte cursor in LSB stream, length and checksum of yielded payload
+            position = 0
+            length = 0
+            checksum = 0
+            # frames holding header are the first block, the file is read once (pipes and sockets can't rewind)
+            while frames:
+                Profiler.count('audio.blocks')
+                remaining_frames -= len(frames) // (sample_width * channel_count)
+                output = Audio.extract_block(frames, sample_width, header.lsb_bits)
+                block = output[max(Payload.HEADER_SIZE - position, 0):max(total_bytes - position, 0)]
+                position += len(output)
+                if block:
+                    length += len(block)
+                    checksum = zlib.crc32(block, checksum)
+                    yield block
+                if remaining_frames <= 0:
+                    break
+                with Profiler.span('audio.read') as span:
+                    frames = stego_audio.readframes(min(block_frames, remaining_frames))
+                    span['bytes'] = len(frames)
+        finally:
+            stego_audio.close()
+
+        Payload.verify_checksum(header, length, checksum)
+
+    @staticmethod
+    def recover_to_file(input_file, output, lsb_bits=None, block_frames=None, scatter_key=None):
+        """
+        Recover data stored with binary header to binary file (e.g. stdout) block by block, compressed payload is
+        decompressed on the fly. Files hidden by older versions are searched for buffers.
+
+        :param input_file: the file with hidden secret, path or binary file object (seekable for older versions)
+        :param output: binary file object
+        :param lsb_bits: the number of used lsb bits, detected from header by default
+        :param block_frames: number of frames processed at once (multiple of 8), STREAM_FRAMES by default
+        :param scatter_key: key bytes of secret hidden with scatter_key
+        :return: number of written bytes
+        """
+        if scatter_key is not None:
+            secret = Audio.recover_payload(input_file, lsb_bits, scatter_key=scatter_key)
+            if secret is None:
+                raise ValueError('This file doesn\'t contain any hidden secret!')
+            output.write(secret)
+            output.flush()
+            return len(secret)
+
+        # file objects are read again from the start for secrets hidden by older versions
+        start = None
+        if not Buffers.is_path(input_file) and input_file.seekable():
+            start = input_file.tell()
+        blocks = Audio.iter_payload(input_file, lsb_bits, block_frames or Audio.STREAM_FRAMES)
+        header = next(blocks)
+        if header is None:
+            blocks.close()
+            if not Buffers.is_path(input_file):
+                if start is None:
+                    raise ValueError('Secrets hidden by older versions can\'t be recovered from unseekable streams!')
+                input_file.seek(start)
+            secret = Audio.recover_buffered_data(input_file, lsb_bits or 1, block_frames).encode()
+            output.write(secret)
+            return len(secret)
+
+        written = 0
+        decompressor = Payload.get_decompressor(header.flags)
+        for block in blocks:
+            if decompressor is not None:
+                with Profiler.span('payload.decompress', len(block)):
+                    block = decompressor.decompress(block)
+            with Profiler.span('audio.output', len(block)):
+                output.write(block)
+            written += len(block)
+        if hasattr(decompressor, 'flush'):
+            block = decompressor.flush()
+            output.write(block)
+            written += len(block)
+        output.flush()
+        return written
+
+    @staticmethod
+    def recover_data(input_file, lsb_bits=None, block_frames=None, scatter_key=None, workers=None):
         """
         Recover data from the file at input_file
 
+        Files with binary header are read up to payload length, files hidden by older versions are searched for
+        buffers.
+
+        :param input_file: the file with hidden secret
+        :param lsb_bits: the number of used lsb bits, detected from header by default
+        :param block_frames: number of frames processed at once (multiple of 8), whole file by default
+        :param scatter_key: key bytes of secret hidden with scatter_key
+        :param workers: number of processes reading segments of the file
+        :return: secret
+        """
+
+        data = Audio.recover_payload(input_file, lsb_bits, block_frames, scatter_key, workers)
+        if data is not None:
+            secret = data.decode()
+            print('Hidden secret was successfully recovered from target file.')
+            print('Hidden secret: {}'.format(secret))
+            return secret
+        if scatter_key is not None:
+            raise ValueError('This file doesn\'t contain any hidden secret!')
+
+        return Audio.recover_buffered_data(input_file, lsb_bits or 1, block_frames)
+
+    @staticmethod
+    def recover_buffered_data(input_file, lsb_bits=1, block_frames=None):
+        """
+        Recover data framed by buffers (files hidden by older versions).
+
         :param input_file: the file with hidden secret
         :param lsb_bits: the number of used lsb bits
+        :param block_frames: number of frames processed at once (multiple of 8), whole file by default
         :return: secret
         """
 
-        buffer = '2qlmRnoPQkreX45Qmt93dr86AfAG68Awd78'
+        buffer = b'2qlmRnoPQkreX45Qmt93dr86AfAG68Awd78'
 
         # input stego audio parameters
         stego_audio = wave.open(input_file)
         frame_count = stego_audio.getnframes()
-        channel_count = stego_audio.getnchannels()
         sample_width = stego_audio.getsampwidth()
-        sample_count = frame_count * channel_count
-        audio_frames = stego_audio.readframes(frame_count)
-
-        # wave doesn't support more than 2 channels
-        if sample_width not in range(1, 3):
-            raise ValueError('Sample width must be 1 or 2!')
 
-        # max possible LSB bits
-        max_bits = sample_count * lsb_bits
-        max_secret_bits = int(ceil(max_bits / lsb_bits))
+        # LSB live in the first (low) byte of little-endian samples, any channel count
+        if sample_width not in Audio.SAMPLE_WIDTHS:
+            raise ValueError('Sample width must be 1 to 4 bytes!')
+        if block_frames is None:
+            block_frames = max(frame_count, 1)
+        elif block_frames % 8:
+            raise ValueError('Block size must be multiple of 8 frames!')
 
-        if sample_width == 1:
-            audio_dtype = numpy.uint8
-        else:
-            audio_dtype = numpy.uint16
-
-        secret_bits = numpy.unpackbits(
-            numpy.frombuffer(audio_frames, dtype=audio_dtype, count=max_secret_bits).view(numpy.uint8)
-        ).reshape(max_secret_bits, 8 * sample_width)[:, 8 - lsb_bits:8]
-
-        output = numpy.packbits(secret_bits).tobytes()[:max_secret_bits // 8]
+        # reads block by block until the second buffer, only the secret is kept in memory
+        output = bytearray()
+        start = -1
+        secret = None
+        while secret is None:
+            with Profiler.span('audio.read') as span:
+                frames = stego_audio.readframes(block_frames)
+                span['bytes'] = len(frames)
+            if not frames:
+                break
+            Profiler.count('audio.blocks')
+            output += Audio.extract_block(frames, sample_width, lsb_bits)
+            if start == -1:
+                start = output.find(buffer)
+                if start == -1:
+                    del output[:-(len(buffer) - 1)]
+                    continue
+                print('Buffer found!')
+                del output[:start + len(buffer)]
+            end = output.find(buffer)
+            if end != -1:
+                secret = bytes(output[:end]).decode()
+        stego_audio.close()
 
-        if buffer in str(output):
-            print('Buffer found!')
-            output_string = str(output)
-            byte_buffer, secret, byte_buffer = output_string.split(buffer)
+        if secret is not None:
             print('Hidden secret was successfully recovered from target file.')
             print('Hidden secret: {}'.format(secret))
             return secret
         else:
             raise ValueError('This file doesn\'t contain any hidden secret!')
 
+    @staticmethod
+    def compare_audio(file_path1, file_path2, workers=None):
+        """
+        Prints SNR of stego audio against carrier, computed in blocks on a thread pool (see Metrics).
+
+        :param workers: number of threads, number of cores by default
+        :return: AudioMetrics
+        """
+        metrics = Metrics.compare_audio(file_path1, file_path2, workers)
+        print('SNR: {} dB'.format(str(metrics.snr)))
+        print('Root mean square of noise: {}'.format(str(metrics.rms)))
+        print('Peak error: {}'.format(str(metrics.peak_error)))
+        return metrics
+
     @staticmethod
     def detect_data(input_file):
         """
         Detect Recover data from the file at input_file
 
+        Only the start of LSB stream is read (where header or buffer lives), all LSB planes are derived from these
+        samples.
+
         :param input_file: the file with hidden secret
-        :return: boolean if exist or not
+        :return: Detection or None if nothing was found
         """
 
-        buffer = '2qlmRnoPQkreX45Qmt93dr86AfAG68Awd78'
+        buffer = b'2qlmRnoPQkreX45Qmt93dr86AfAG68Awd78'
 
         # input stego audio parameters
         stego_audio = wave.open(input_file)
-        frame_count = stego_audio.getnframes()
         channel_count = stego_audio.getnchannels()
         sample_width = stego_audio.getsampwidth()
-        sample_count = frame_count * channel_count
-        audio_frames = stego_audio.readframes(frame_count)
 
-        # wave doesn't support more than 2 channels
-        if sample_width not in range(1, 3):
-            raise ValueError('Sample width must be 1 or 2!')
+        # LSB live in the first (low) byte of little-endian samples, any channel count
+        if sample_width not in Audio.SAMPLE_WIDTHS:
+            raise ValueError('Sample width must be 1 to 4 bytes!')
 
-        if sample_width == 1:
-            audio_dtype = numpy.uint8
-        else:
-            audio_dtype = numpy.uint16
+        # prefix holding header or buffer for 1 LSB, other LSB counts need less
+        prefix_bytes = max(Payload.HEADER_SIZE, len(buffer))
+        prefix_frames = int(ceil(prefix_bytes * 8 / channel_count))
+        with Profiler.span('audio.read') as span:
+            audio_frames = stego_audio.readframes(prefix_frames)
+            span['bytes'] = len(audio_frames)
+        stego_audio.close()
+        samples = numpy.frombuffer(audio_frames, dtype=numpy.uint8)
 
         for lsb_bits in range(1, 9):
-            # max possible lsb bits
-            max_bits = sample_count * lsb_bits
-            max_secret_bits = int(ceil(max_bits / lsb_bits))
-
-            secret_bits = numpy.unpackbits(
-                numpy.frombuffer(audio_frames, dtype=audio_dtype, count=max_secret_bits).view(numpy.uint8)
-            ).reshape(max_secret_bits, 8 * sample_width)[:, 8 - lsb_bits:8]
+            output = Audio.extract_samples(samples, sample_width, lsb_bits)
 
-            output = numpy.packbits(secret_bits).tobytes()[:max_secret_bits // 8]
+            header = Payload.parse_header(output)
+            if header and header.lsb_bits == lsb_bits:
+                # magic, version and lsb count have to match
+                detection = Detection(lsb_bits, 0, 1 - 2.0 ** -(8 * (len(Payload.MAGIC) + 2)), 'header')
+            elif output.startswith(buffer):
+                detection = Detection(lsb_bits, 0, 1 - 2.0 ** -(8 * len(buffer)), 'buffer')
+            else:
+                continue
 
-            if buffer in str(output):
-                print('Hidden secret was detect in target file. Detected from {} LSBs.'.format(str(lsb_bits)))
-                return True
+            print('Hidden secret was detect in target file. Detected from {} LSBs.'.format(str(lsb_bits)))
+            return detection
         print('Nothing found!')
-        return False
+        return None
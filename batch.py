@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+
+import io
+import os
+import glob
+import json
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from payload import Payload
+from plugins import Plugins
+
+
+class Batch(object):
+    """
+    Runs hide/recover/detect jobs for many carriers on a process pool.
+
+    Job is a dict with keys: action (hide, recover, detect), carrier, secret, output, bits and optionally
+    algorithm (aead or ecc) with key_env or key_file. Key providers are shared in the worker process, so the key
+    is derived once per worker. ECC hide jobs need pubkey of recipient, loaded public keys are cached as well.
+    Secrets of hide jobs are compressed by codec in compress (zlib, bz2, lzma, auto). Audio jobs can read the
+    secret from secret_file and recover jobs with output write the secret to that file.
+
+    """
+    ACTIONS = ('hide', 'recover', 'detect')
+
+    @staticmethod
+    def load_jobs(source, action='recover', secret=None, bits=None, algorithm=None, key_env=None, key_file=None,
+                  pub_key=None, compression=None):
+        """
+        Creates jobs from directory, glob pattern or manifest (JSON lines with carrier, secret, output).
+
+        :param source: directory, glob or manifest file
+        :param action: default action for all jobs
+        :param secret: default secret for hide jobs
+        :param bits: default number of LSB
+        :param algorithm: default encryption algorithm (aead, ecc)
+        :param key_env: default environment variable with passphrase or private key
+        :param key_file: default file with passphrase or private key
+        :param pub_key: default ECC recipient public key (hex or file)
+        :param compression: default compression codec of hide jobs
+        :return: list of jobs
+        """
+        defaults = {'action': action, 'secret': secret, 'output': None, 'bits': bits, 'algorithm': algorithm,
+                    'key_env': key_env, 'key_file': key_file, 'pubkey': pub_key,
+                    'compress': compression}
+
+        extensions = Plugins.get_extensions()
+        if os.path.isdir(source):
+            paths = sorted(os.path.join(source, name) for name in os.listdir(source)
+                           if name.lower().endswith(extensions))
+        elif os.path.isfile(source) and not source.lower().endswith(extensions):
+            jobs = []
+            with open(source) as manifest:
+                for line in manifest:
+                    if line.strip():
+                        job = dict(defaults)
+                        job.update(json.loads(line))
+                        jobs.append(job)
+            return jobs
+        else:
+            paths = sorted(glob.glob(source))
+
+        jobs = []
+        for path in paths:
+            job = dict(defaults)
+            job['carrier'] = path
+            jobs.append(job)
+        return jobs
+
+    @staticmethod
+    def get_key_provider(job):
+        """
+        Returns key provider of job (shared in the process).
+
+        :param job: job dict
+        :return: KeyProvider
+        """
+        from crypto import KeyProvider
+        if job.get('key_env'):
+            return KeyProvider.from_env(job['key_env'])
+        elif job.get('key_file'):
+            return KeyProvider.from_file(job['key_file'])
+        raise ValueError('Encrypted jobs need key_env or key_file!')
+
+    @staticmethod
+    def execute(job):
+        """
+        Executes one job in the current process.
+
+        :param job: job dict
+        :return: output file for hide, secret (or its output file) for recover, detection for detect
+        """
+        action = job.get('action') or 'recover'
+        carrier = job['carrier']
+        bits = int(job['bits']) if job.get('bits') else None
+        algorithm = job.get('algorithm')
+
+        if action not in Batch.ACTIONS:
+            raise ValueError('Unknown action {}!'.format(str(action)))
+        if algorithm not in (None, 'aead', 'ecc'):
+            raise ValueError('Batch mode supports only aead and ecc encryption!')
+
+        # carrier format by magic bytes, formats and ciphers are imported on first use
+        carrier_format = Plugins.detect_format(carrier)
+        Crypto = Plugins.get_cipher(algorithm) if algorithm else None
+        if carrier_format == 'wav':
+            Audio = Plugins.get_format('wav')
+            if action == 'hide' and not algorithm and job.get('secret_file'):
+                with open(job['secret_file'], 'rb') as secret:
+                    return Audio.hide_data(secret, carrier, job.get('output'), lsb_bits=bits or 1,
+                                           compression=job.get('compress'))
+            elif action == 'hide' and not algorithm:
+                return Audio.hide_data(job['secret'], carrier, job.get('output'), lsb_bits=bits or 1,
+                                       compression=job.get('compress'))
+            elif action == 'hide':
+                if job.get('secret_file'):
+                    with open(job['secret_file'], 'rb') as secret_file:
+                        flags, secret = 0, secret_file.read()
+                else:
+                    flags, secret = 0, job['secret'].encode()
+                if job.get('compress'):
+                    flags, secret = Payload.compress(secret, job['compress'])
+                if algorithm == 'ecc':
+                    if not job.get('pubkey'):
+                        raise ValueError('ECC jobs need pubkey of recipient!')
+                    secret = Crypto.ecc_encrypt_bytes(secret, job['pubkey'])
+                else:
+                    secret = Crypto.aead_encrypt(secret, Batch.get_key_provider(job))
+                return Audio.hide_data(secret, carrier, job.get('output'), lsb_bits=bits or 1, flags=flags)
+            elif action == 'recover' and algorithm:
+                frame = Audio.recover_frame(carrier, lsb_bits=bits)
+                if frame is None:
+                    raise ValueError('This file doesn\'t contain any hidden secret!')
+                header, secret = frame
+                if algorithm == 'ecc':
+                    secret = Crypto.ecc_decrypt_bytes(secret, Batch.get_key_provider(job))
+                else:
+                    secret = Crypto.aead_decrypt(secret, Batch.get_key_provider(job))
+                secret = Payload.decompress(secret, header.flags)
+                if job.get('output'):
+                    with open(job['output'], 'wb') as output:
+                        output.write(secret)
+                    return job['output']
+                return secret.decode()
+            elif action == 'recover' and job.get('output'):
+                with open(job['output'], 'wb') as output:
+                    Audio.recover_to_file(carrier, output, lsb_bits=bits)
+                return job['output']
+            elif action == 'recover':
+                return Audio.recover_data(carrier, lsb_bits=bits)
+            detection = Audio.detect_data(carrier)
+            return detection._asdict() if detection else None
+        # PNG and uncompressed pictures (see Raster) share the interface of Picture
+        Picture = Plugins.get_format(carrier_format)
+        if algorithm:
+            raise ValueError('Encryption is not supported for {}!'.format(str(carrier_format)))
+        if action == 'hide':
+            return Picture(carrier, job['secret'], bits or 1, compression=job.get('compress')).hide_secret(
+                job.get('output'))
+        elif action == 'recover':
+            return Picture(carrier, num_of_bits=bits or 1).extract_secret()
+        # LSB embedding by any tool, as -d in CLI
+        from steganalysis import Steganalysis
+        return Steganalysis.detect(carrier)._asdict()
+
+    @staticmethod
+    def run_job(job):
+        """
+        Executes one job, errors and console output of the job are captured in result.
+
+        :param job: job dict
+        :return: result dict with status, result or error and elapsed time in seconds
+        """
+        result = {'carrier': job.get('carrier'), 'action': job.get('action')}
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result['result'] = Batch.execute(job)
+            result['status'] = 'ok'
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        result['elapsed'] = time.perf_counter() - start
+        return result
+
+    @staticmethod
+    def run(jobs, log_file=None, workers=None):
+        """
+        Runs jobs on a process pool, results are written to log_file as JSON lines when jobs finish.
+
+        :param jobs: list of job dicts
+        :param log_file: path of JSON lines result log
+        :param workers: number of processes, number of cores by default
+        :return: list of results in order of jobs
+        """
+        results = [None] * len(jobs)
+        log = open(log_file, 'a') if log_file else None
+        try:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                futures = {executor.submit(Batch.run_job, job): index for index, job in enumerate(jobs)}
+                for future in as_completed(futures):
+                    index = futures[future]
+                    result = future.result()
+                    result['index'] = index
+                    results[index] = result
+                    if log:
+                        log.write(json.dumps(result) + '\n')
+                        log.flush()
+        finally:
+            if log:
+                log.close()
+        return results
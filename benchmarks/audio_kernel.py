@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+"""
+Throughput and peak allocations of the bit-matrix kernel (unpackbits/packbits, used by older versions)
+and the mask/shift kernel of Audio.
+
+    python3 benchmarks/audio_kernel.py --seconds 60 --sample-width 2 --channels 2 --bits 2
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from math import ceil
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from audio import Audio  # noqa: E402
+
+
+def matrix_embed(frames, payload, sample_width, lsb_bits):
+    bit_height = int(ceil(len(payload) * 8 / lsb_bits))
+    payload_bits = numpy.unpackbits(numpy.frombuffer(payload, dtype=numpy.uint8))
+    secret_bits = numpy.zeros(bit_height * lsb_bits, dtype=numpy.uint8)
+    secret_bits[:len(payload_bits)] = payload_bits
+    audio_bits = numpy.unpackbits(numpy.frombuffer(frames, dtype=numpy.uint8, count=bit_height * sample_width))\
+        .reshape(bit_height, 8 * sample_width)
+    audio_bits[:, 8 - lsb_bits:8] = secret_bits.reshape(bit_height, lsb_bits)
+    return numpy.packbits(audio_bits).tobytes() + frames[bit_height * sample_width:]
+
+
+def matrix_extract(frames, sample_width, lsb_bits):
+    sample_count = len(frames) // sample_width
+    secret_bits = numpy.unpackbits(numpy.frombuffer(frames, dtype=numpy.uint8, count=sample_count * sample_width))\
+        .reshape(sample_count, 8 * sample_width)[:, 8 - lsb_bits:8]
+    return numpy.packbits(secret_bits).tobytes()[:sample_count * lsb_bits // 8]
+
+
+def measure(function, *args):
+    """
+    Returns result, best time of 3 runs and peak allocations in bytes.
+    """
+    tracemalloc.start()
+    result = function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    seconds = []
+    for _ in range(3):
+        start = time.perf_counter()
+        function(*args)
+        seconds.append(time.perf_counter() - start)
+    return result, min(seconds), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Audio kernel benchmark')
+    parser.add_argument('--seconds', type=int, default=60, help='length of the synthetic audio')
+    parser.add_argument('--sample-width', type=int, default=2, help='sample width in bytes (1-4)')
+    parser.add_argument('--channels', type=int, default=2, help='number of channels')
+    parser.add_argument('--bits', type=int, default=1, help='number of LSB')
+    args = parser.parse_args()
+
+    frames = numpy.random.randint(0, 256, args.seconds * 44100 * args.channels * args.sample_width,
+                                  dtype=numpy.uint8).tobytes()
+    megabytes = len(frames) / 1024 / 1024
+    # payload filling the whole block
+    payload = os.urandom(len(frames) // args.sample_width * args.bits // 8)
+
+    rows = (('hide', matrix_embed, Audio.embed_block, (frames, payload, args.sample_width, args.bits)),
+            ('extract', matrix_extract, Audio.extract_block, (frames, args.sample_width, args.bits)))
+    for name, before, after, arguments in rows:
+        before_result, before_time, before_peak = measure(before, *arguments)
+        after_result, after_time, after_peak = measure(after, *arguments)
+        print('{:8} matrix: {:7.3f} s {:8.2f} MB/s {:8.1f} MB peak | mask/shift: {:7.3f} s {:8.2f} MB/s {:8.1f} MB '
+              'peak | x{:.1f} | identical: {}'
+              .format(name, before_time, megabytes / before_time, before_peak / 1024 / 1024, after_time,
+                      megabytes / after_time, after_peak / 1024 / 1024, before_time / after_time,
+                      bytes(before_result) == bytes(after_result)))
+
+
+if __name__ == '__main__':
+    main()
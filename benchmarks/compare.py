@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+"""
+Compares two JSON lines outputs of benchmarks/suite.py.
+
+    python3 benchmarks/compare.py old.jsonl new.jsonl
+"""
+
+import json
+import argparse
+
+KEY = ('suite', 'carrier', 'operation', 'lsb_bits', 'payload_bytes')
+
+
+def load(path):
+    results = {}
+    with open(path) as file:
+        for line in file:
+            record = json.loads(line)
+            if record.get('suite') != 'meta' and record.get('status') == 'ok':
+                results[tuple(record.get(key) for key in KEY)] = record
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark runs')
+    parser.add_argument('old', help='JSON lines of the old run')
+    parser.add_argument('new', help='JSON lines of the new run')
+    args = parser.parse_args()
+
+    old, new = load(args.old), load(args.new)
+    print('{:8} {:24} {:8} {:>4} {:>8} {:>10} {:>10} {:>8} {:>10}'.format(
+        'suite', 'carrier', 'op', 'lsb', 'payload', 'old MB/s', 'new MB/s', 'speedup', 'RSS kB'))
+    for key in sorted(set(old) & set(new), key=str):
+        speedup = old[key]['seconds'] / new[key]['seconds'] if new[key]['seconds'] else float('inf')
+        rss = new[key]['peak_rss_kb'] - old[key]['peak_rss_kb']
+        print('{:8} {:24} {:8} {:>4} {:>8} {:>10.2f} {:>10.2f} {:>7.2f}x {:>+10}'.format(
+            key[0], key[1], key[2], key[3], key[4], old[key]['mb_per_s'], new[key]['mb_per_s'], speedup, rss))
+
+
+if __name__ == '__main__':
+    main()
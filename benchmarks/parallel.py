@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+Scaling of hiding and recovery within one carrier by the number of worker processes (Audio.hide_data and
+Picture with workers). One worker is the sequential path. WAV is embedded with --fill, so every sample is
+rewritten, the secret takes half of the capacity.
+
+    python3 benchmarks/parallel.py --seconds 600 --size 4096 --workers 1,2,4,8 --output parallel.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from suite import create_wav, create_png, create_secret  # noqa: E402
+from audio import Audio  # noqa: E402
+from picture import Picture  # noqa: E402
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def measure_wav(directory, seconds, workers):
+    carrier = os.path.join(directory, 'carrier.wav')
+    output = os.path.join(directory, 'carrier_secret.wav')
+    if not os.path.exists(carrier):
+        create_wav(carrier, seconds, 2, 2)
+    secret = create_secret(seconds * 44100 * 2 // 16)
+    _, hide_time = timed(Audio.hide_data, secret, carrier, output, fill=True,
+                         workers=workers if workers > 1 else None)
+    recovered, recover_time = timed(Audio.recover_payload, output, workers=workers if workers > 1 else None)
+    return hide_time, recover_time, os.path.getsize(carrier), recovered == secret.encode()
+
+
+def measure_png(directory, size, workers):
+    carrier = os.path.join(directory, 'carrier.png')
+    output = os.path.join(directory, 'carrier_secret.png')
+    if not os.path.exists(carrier):
+        create_png(carrier, size)
+    secret = create_secret(size * size * 3 // 28)
+    _, hide_time = timed(Picture(carrier, secret, workers=workers).hide_secret, output)
+    recovered, recover_time = timed(Picture(output, workers=workers).extract_secret)
+    return hide_time, recover_time, size * size * 3, recovered == secret
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Intra-file parallel scaling benchmark')
+    parser.add_argument('--seconds', type=int, default=600, help='length of stereo 16-bit WAV carrier')
+    parser.add_argument('--size', type=int, default=2048, help='width and height of PNG carrier')
+    parser.add_argument('--workers', default='1,2,4,8', help='comma separated numbers of processes')
+    parser.add_argument('--output', help='JSON lines results')
+    args = parser.parse_args()
+
+    output = open(args.output, 'a') if args.output else None
+    with tempfile.TemporaryDirectory() as directory:
+        for carrier_format, measure, size in (('wav', measure_wav, args.seconds), ('png', measure_png, args.size)):
+            baseline = None
+            for workers in [int(value) for value in args.workers.split(',')]:
+                hide_time, recover_time, carrier_bytes, recovered = measure(directory, size, workers)
+                baseline = baseline or (hide_time, recover_time)
+                megabytes = carrier_bytes / 1024 / 1024
+                print('{} workers {:2}: hide {:8.3f} s {:8.1f} MB/s x{:.2f} | recover {:8.3f} s x{:.2f} | '
+                      'recovered: {}'.format(carrier_format, workers, hide_time, megabytes / hide_time,
+                                             baseline[0] / hide_time, recover_time, baseline[1] / recover_time,
+                                             recovered))
+                if output:
+                    output.write(json.dumps({'format': carrier_format, 'workers': workers, 'hide': hide_time,
+                                             'recover': recover_time, 'bytes': carrier_bytes,
+                                             'cpus': os.cpu_count()}) + '\n')
+    if output:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
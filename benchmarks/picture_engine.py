@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+"""
+Throughput comparison of the pixel loop and the numpy engine of Picture. The strip engine is compared with
+the numpy engine on whole files (decode, embed and encode), with peak of traced allocations. The packed codec
+is compared with hex characters of older versions on a secret taking half of the hex capacity.
+
+    python3 benchmarks/picture_engine.py --size 512 --bits 2
+    python3 benchmarks/picture_engine.py --size 4096 --skip-loop --strip-rows 256
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from picture import Picture  # noqa: E402
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def traced(function, *args):
+    tracemalloc.start()
+    try:
+        result, seconds = timed(function, *args)
+        return result, seconds, tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def compare_strips(path, args, megabytes):
+    """
+    Hides and extracts the secret as whole files by the numpy and the strip engine.
+    """
+    results = {}
+    for engine in ('numpy', 'strips'):
+        output = path.replace('.png', '_{}.png'.format(engine))
+        picture = Picture(path, args.secret, args.bits, engine=engine, strip_rows=args.strip_rows)
+        _, hide_time, hide_peak = traced(picture.hide_secret, output)
+        picture = Picture(output, num_of_bits=args.bits, engine=engine, strip_rows=args.strip_rows)
+        secret, extract_time, extract_peak = traced(picture.extract_bytes)
+        results[engine] = (hide_time, hide_peak, extract_time, extract_peak, secret == args.secret.encode())
+    for engine, (hide_time, hide_peak, extract_time, extract_peak, recovered) in results.items():
+        print('{:7} hide: {:8.3f} s {:8.2f} MB/s peak {:8.1f} MB | extract: {:8.3f} s peak {:8.1f} MB | '
+              'recovered: {}'.format(engine, hide_time, megabytes / hide_time, hide_peak, extract_time,
+                                     extract_peak, recovered))
+
+
+def compare_codecs(path, args, megabytes):
+    """
+    Hides and extracts the same secret with both codecs by the numpy engine, decodes the bitstream of the pixel
+    loop by per-character decoding of older versions (hex) and by read_payload (packed).
+    """
+    values = args.size * args.size * 3
+    secret = os.urandom(values * args.bits // 28)
+    for codec in ('hex', 'packed'):
+        output = path.replace('.png', '_{}.png'.format(codec))
+        picture = Picture(path, secret, args.bits, codec=codec)
+        _, hide_time = timed(picture.hide_secret, output)
+        picture = Picture(output, num_of_bits=args.bits)
+        recovered, extract_time = timed(picture.extract_bytes)
+        hidden = picture.extract_loop() if not args.skip_loop else None
+        if hidden is None:
+            decode_time = float('nan')
+        elif codec == 'hex':
+            _, decode_time = timed(lambda: picture.decode_bytes(picture.get_chars(hidden)))
+        else:
+            bits = numpy.frombuffer(hidden.encode('ascii'), dtype=numpy.uint8) - ord('0')
+            _, decode_time = timed(picture.read_payload, iter([bits]))
+        print('{:7} LSB used: {:6.1%} | hide: {:8.3f} s {:8.2f} MB/s | extract: {:8.3f} s | decode loop bits: '
+              '{:8.3f} s | recovered: {}'.format(codec, Picture(path, secret, args.bits, codec=codec)
+                                                  .get_required_bits() / (values * args.bits), hide_time,
+                                                  megabytes / hide_time, extract_time, decode_time,
+                                                  recovered == secret))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Picture engine benchmark')
+    parser.add_argument('--size', type=int, default=512, help='width and height of the synthetic picture')
+    parser.add_argument('--bits', type=int, default=1, help='number of LSB')
+    parser.add_argument('--secret', default='HelloWorld', help='secret to hide')
+    parser.add_argument('--strip-rows', type=int, default=256, help='rows per strip of the strip engine')
+    parser.add_argument('--skip-loop', action='store_true', help='compare only the numpy and the strip engine')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'carrier.png')
+        pixels = numpy.random.randint(0, 256, (args.size, args.size, 3), dtype=numpy.uint8)
+        Image.fromarray(pixels, 'RGB').save(path)
+        megabytes = pixels.nbytes / 1024 / 1024
+        compare_strips(path, args, megabytes)
+        compare_codecs(path, args, megabytes)
+        if args.skip_loop:
+            return
+
+        picture = Picture(path, args.secret, args.bits)
+        bitstream = picture.create_bitstream()
+        bits = numpy.frombuffer(bitstream.encode('ascii'), dtype=numpy.uint8) - ord('0')
+
+        loop_image, loop_time = timed(picture.embed_loop, iter(bitstream))
+        array_image, array_time = timed(picture.embed_array, bits)
+        identical = numpy.array_equal(numpy.asarray(loop_image), numpy.asarray(array_image))
+        print('hide     loop: {:8.3f} s {:8.2f} MB/s | numpy: {:8.3f} s {:8.2f} MB/s | x{:.0f} | identical: {}'
+              .format(loop_time, megabytes / loop_time, array_time, megabytes / array_time,
+                      loop_time / array_time, identical))
+
+        array_image.save(path)
+        picture = Picture(path, num_of_bits=args.bits)
+        hidden, loop_time = timed(picture.extract_loop)
+        secret, array_time = timed(picture.extract_array)
+        bits = numpy.frombuffer(hidden.encode('ascii'), dtype=numpy.uint8) - ord('0')
+        identical = picture.read_payload(iter([bits])) == secret
+        print('extract  loop: {:8.3f} s {:8.2f} MB/s | numpy: {:8.3f} s {:8.2f} MB/s | x{:.0f} | identical: {}'
+              .format(loop_time, megabytes / loop_time, array_time, megabytes / array_time,
+                      loop_time / array_time, identical))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+"""
+Hiding and extraction of a small secret in PNG (Picture, numpy engine) and in uncompressed BMP, PPM and TIFF
+(Raster, memory-mapped) versions of the same picture. Raster copies the carrier and rewrites only the rows
+holding the secret, so its time is the file copy and a few rows.
+
+    python3 benchmarks/raster.py --size 4096 --secret 1024
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+import numpy
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from suite import create_png, create_secret  # noqa: E402
+from picture import Picture  # noqa: E402
+from raster import Raster  # noqa: E402
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PNG versus memory-mapped uncompressed pictures')
+    parser.add_argument('--size', type=int, default=2048, help='width and height of RGB carrier')
+    parser.add_argument('--secret', type=int, default=1024, help='length of secret')
+    parser.add_argument('--bits', type=int, default=1, help='number of LSB bits')
+    args = parser.parse_args()
+
+    secret = create_secret(args.secret)
+    with tempfile.TemporaryDirectory() as directory:
+        carrier = os.path.join(directory, 'carrier.png')
+        create_png(carrier, args.size)
+        pixels = numpy.asarray(Image.open(carrier))
+        for extension, carrier_class in (('png', Picture), ('bmp', Raster), ('ppm', Raster), ('tif', Raster)):
+            path = os.path.join(directory, 'carrier.' + extension)
+            if extension != 'png':
+                Image.fromarray(pixels).save(path)
+            output = os.path.join(directory, 'carrier_secret.' + extension)
+            _, hide_time = timed(carrier_class(path, secret, args.bits).hide_secret, output)
+            recovered, extract_time = timed(carrier_class(output, num_of_bits=args.bits).extract_secret)
+            megabytes = os.path.getsize(path) / 1024 / 1024
+            print('{:4} {:8.1f} MB | hide: {:8.3f} s {:9.1f} MB/s | extract: {:8.3f} s | recovered: {}'.format(
+                extension, megabytes, hide_time, megabytes / hide_time, extract_time, recovered == secret))
+
+
+if __name__ == '__main__':
+    main()
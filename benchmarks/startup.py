@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+"""
+Cold start of pystego.py commands: wall time of a fresh interpreter (median of runs) and time spent importing
+modules (-X importtime). With --baseline the same commands run from another checkout, e.g. a version importing
+every format and cipher at start:
+
+    git worktree add /tmp/pystego-old <commit>
+    python3 benchmarks/startup.py --baseline /tmp/pystego-old --runs 10
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from suite import create_wav, create_png  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+KEY_ENV = 'PYSTEGO_STARTUP_KEY'
+
+
+def get_commands(directory):
+    """
+    Creates carriers and returns (name, arguments) of measured commands. Stego files are created by setup
+    commands of each checkout.
+    """
+    wav = os.path.join(directory, 'carrier.wav')
+    png = os.path.join(directory, 'carrier.png')
+    create_wav(wav, 1, 2, 2)
+    create_png(png, 128)
+    setup = [['-f', wav, '-s', 'secret'], ['-f', png, '-s', 'secret'],
+             ['-f', os.path.join(directory, 'aead.wav'), '-s', 'secret', '-a', 'aead', '--key-env', KEY_ENV]]
+    commands = [('help', ['--help']),
+                ('wav-info', ['-f', wav, '-i']),
+                ('wav-hide', ['-f', wav, '-s', 'secret']),
+                ('wav-recover', ['-f', os.path.join(directory, 'carrier_secret.wav')]),
+                ('wav-detect', ['-f', os.path.join(directory, 'carrier_secret.wav'), '-d']),
+                ('aead-recover', ['-f', os.path.join(directory, 'aead_secret.wav'), '-a', 'aead', '--key-env',
+                                  KEY_ENV]),
+                ('png-info', ['-f', png, '-i']),
+                ('png-recover', ['-f', os.path.join(directory, 'carrier_secret.png')]),
+                ('batch-help', ['batch', '--help']),
+                ('shard-help', ['shard', '--help']),
+                ('index-find', ['index', 'find', '-n', '1', '--db', os.path.join(directory, 'index.sqlite')]),
+                ('keygen-help', ['keygen', '--help'])]
+    with open(os.path.join(directory, 'aead.wav'), 'wb') as file, open(wav, 'rb') as carrier:
+        file.write(carrier.read())
+    return setup, commands
+
+
+def import_time(output):
+    """
+    Sums cumulative time of top level imports in -X importtime output.
+
+    :return: milliseconds
+    """
+    total = 0
+    for line in output.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            self_time, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit() and not name[1:].startswith(' '):
+                total += int(cumulative)
+    return total / 1000
+
+
+def measure(root, arguments, runs):
+    """
+    Runs command in fresh interpreters.
+
+    :return: median wall time and import time in milliseconds, None if the command fails in this checkout
+    """
+    command = [sys.executable, os.path.join(root, 'pystego.py')] + arguments
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=root)
+        seconds.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None, None
+    traced = subprocess.run([sys.executable, '-X', 'importtime'] + command[1:], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, cwd=root, universal_newlines=True)
+    return median(seconds) * 1000, import_time(traced.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLI cold start benchmark')
+    parser.add_argument('--baseline', help='checkout of another version measured first')
+    parser.add_argument('--runs', type=int, default=5, help='runs per command')
+    parser.add_argument('--output', help='JSON lines results')
+    args = parser.parse_args()
+
+    os.environ.setdefault(KEY_ENV, 'startup benchmark')
+    roots = [('baseline', args.baseline)] if args.baseline else []
+    roots.append(('current', ROOT))
+    directory = tempfile.mkdtemp(prefix='pystego-startup-')
+    setup, commands = get_commands(directory)
+
+    results = dict((name, {}) for name, arguments in commands)
+    for label, root in roots:
+        for arguments in setup:
+            subprocess.run([sys.executable, os.path.join(root, 'pystego.py')] + arguments, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, cwd=root)
+        for name, arguments in commands:
+            results[name][label] = measure(root, arguments, args.runs)
+
+    output = open(args.output, 'a') if args.output else None
+    for name, arguments in commands:
+        cells = []
+        for label, root in roots:
+            wall, imports = results[name][label]
+            cells.append('{:>8} {:7.1f} ms (imports {:6.1f} ms)'.format(label, wall, imports) if wall is not None
+                         else '{:>8}     n/a'.format(label))
+        if args.baseline and None not in results[name]['baseline'] + results[name]['current']:
+            cells.append('x{:.1f}'.format(results[name]['baseline'][0] / results[name]['current'][0]))
+        print('{:13} {}'.format(name, ' | '.join(cells)))
+        if output:
+            output.write(json.dumps({'command': name, 'arguments': arguments,
+                                     'results': dict((label, dict(zip(('wall_ms', 'import_ms'), value)))
+                                                     for label, value in results[name].items())}) + '\n')
+    if output:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+"""
+Reproducible benchmark suite for audio and image embed/extract/detect.
+
+Carriers (and stego files for extraction) are synthesized from a fixed seed, every case runs in a
+fresh process so peak RSS belongs to the measured operation only. Results are written as JSON lines
+(one record per case), so runs of different versions can be diffed:
+
+    python3 benchmarks/suite.py --output bench.jsonl
+    python3 benchmarks/suite.py --durations 1,3600 --sizes 256,32768 --lsb 1,2 --payloads 16,65536
+    python3 benchmarks/compare.py old.jsonl new.jsonl
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+
+import numpy
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from audio import Audio  # noqa: E402
+from picture import Picture  # noqa: E402
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def create_wav(path, seconds, sample_width, channels, rate=44100, seed=0):
+    """
+    Synthesizes WAV carrier with noise, written in blocks so hours of audio fit into memory.
+    """
+    random = numpy.random.RandomState(seed)
+    audio = wave.open(path, 'w')
+    audio.setnchannels(channels)
+    audio.setsampwidth(sample_width)
+    audio.setframerate(rate)
+    remaining = seconds * rate
+    while remaining > 0:
+        frames = min(remaining, rate * 60)
+        audio.writeframes(random.randint(0, 256, frames * channels * sample_width, dtype=numpy.uint8).tobytes())
+        remaining -= frames
+    audio.close()
+
+
+def create_png(path, size, seed=0):
+    """
+    Synthesizes square RGB PNG carrier with noise.
+    """
+    random = numpy.random.RandomState(seed)
+    Image.fromarray(random.randint(0, 256, (size, size, 3), dtype=numpy.uint8), 'RGB').save(path)
+
+
+def create_secret(size, seed=0):
+    random = numpy.random.RandomState(seed)
+    letters = numpy.frombuffer(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', dtype=numpy.uint8)
+    return letters[random.randint(0, len(letters), size)].tobytes().decode()
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_operation(case):
+    """
+    Runs one operation of case in the current process.
+    """
+    operation = case['operation']
+    carrier = case['carrier_path']
+    output = case['output_path']
+    secret = create_secret(case['payload_bytes'], case['seed'])
+
+    start = time.perf_counter()
+    if operation == 'hide' and case['suite'] == 'audio':
+        Audio.hide_data(secret, carrier, output, lsb_bits=case['lsb_bits'])
+    elif operation == 'recover':
+        Audio.recover_data(output, lsb_bits=case['lsb_bits'])
+    elif operation == 'detect':
+        Audio.detect_data(output)
+    elif operation == 'hide':
+        Picture(carrier, secret, case['lsb_bits']).hide_secret(output)
+    elif operation == 'extract':
+        Picture(output, num_of_bits=case['lsb_bits']).extract_secret()
+    elif operation == 'compare':
+        Picture.compare_pictures(carrier, output)
+    return time.perf_counter() - start
+
+
+def run_case(case):
+    """
+    Runs case (in a fresh process) and returns result record.
+    """
+    result = dict((key, value) for key, value in case.items() if not key.endswith('_path'))
+    baseline = peak_rss_kb()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = min(run_operation(case) for _ in range(case['repeat']))
+        result['status'] = 'ok'
+        result['seconds'] = seconds
+        result['mb_per_s'] = case['carrier_bytes'] / 1024 / 1024 / seconds if seconds else None
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['baseline_rss_kb'] = baseline
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+
+def prepare_case(case):
+    """
+    Creates stego file for extracting operations, outside of the measured process.
+    """
+    secret = create_secret(case['payload_bytes'], case['seed'])
+    name = '{}_{}_{}'.format(case['carrier'], case['lsb_bits'], case['payload_bytes'])
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if case['operation'] in ('recover', 'detect'):
+                case['output_path'] = os.path.join(os.path.dirname(case['carrier_path']), name + '.wav')
+                if not os.path.exists(case['output_path']):
+                    Audio.hide_data(secret, case['carrier_path'], case['output_path'], lsb_bits=case['lsb_bits'])
+            elif case['operation'] in ('extract', 'compare'):
+                case['output_path'] = os.path.join(os.path.dirname(case['carrier_path']), name + '.png')
+                if not os.path.exists(case['output_path']):
+                    Picture(case['carrier_path'], secret, case['lsb_bits']).hide_secret(case['output_path'])
+    except Exception:
+        # payload doesn't fit, the case reports the error
+        pass
+
+
+def create_cases(args, directory):
+    """
+    Synthesizes carriers and returns list of cases.
+    """
+    cases = []
+    for sample_width in args.sample_widths:
+        for channels in args.channels:
+            for seconds in args.durations:
+                name = 'audio_{}b_{}ch_{}s'.format(8 * sample_width, channels, seconds)
+                path = os.path.join(directory, name + '.wav')
+                create_wav(path, seconds, sample_width, channels, seed=args.seed)
+                carrier = {'suite': 'audio', 'carrier': name, 'carrier_bytes': os.path.getsize(path),
+                           'carrier_path': path, 'output_path': os.path.join(directory, name + '_secret.wav')}
+                for operation in ('hide', 'recover', 'detect'):
+                    cases.extend(dict(carrier, operation=operation, lsb_bits=lsb_bits, payload_bytes=payload)
+                                 for lsb_bits in args.lsb for payload in args.payloads)
+    for size in args.sizes:
+        name = 'picture_{}x{}'.format(size, size)
+        path = os.path.join(directory, name + '.png')
+        create_png(path, size, seed=args.seed)
+        carrier = {'suite': 'picture', 'carrier': name, 'carrier_bytes': size * size * 3,
+                   'carrier_path': path, 'output_path': os.path.join(directory, name + '_secret.png')}
+        for operation in ('hide', 'extract', 'compare'):
+            cases.extend(dict(carrier, operation=operation, lsb_bits=lsb_bits, payload_bytes=payload)
+                         for lsb_bits in args.lsb for payload in args.payloads)
+    for case in cases:
+        case['repeat'] = args.repeat
+        case['seed'] = args.seed
+        prepare_case(case)
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pystego benchmark suite')
+    parser.add_argument('--durations', type=int_list, default=[1, 10], help='WAV lengths in seconds, e.g. 1,60,3600')
+    parser.add_argument('--sample-widths', type=int_list, default=[1, 2], help='WAV sample widths in bytes')
+    parser.add_argument('--channels', type=int_list, default=[1, 2], help='WAV channel counts')
+    parser.add_argument('--sizes', type=int_list, default=[256, 1024], help='PNG width and height, e.g. 256,32768')
+    parser.add_argument('--lsb', type=int_list, default=[1, 2, 4], help='numbers of LSB')
+    parser.add_argument('--payloads', type=int_list, default=[16, 1024, 16384], help='secret sizes in bytes')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions per case, the best time is reported')
+    parser.add_argument('--seed', type=int, default=0, help='seed for carriers and secrets')
+    parser.add_argument('--output', default=None, help='JSON lines output, stdout by default')
+    args = parser.parse_args()
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    meta = {'suite': 'meta', 'python': platform.python_version(), 'numpy': numpy.__version__,
+            'pillow': Image.__version__, 'machine': platform.machine(), 'cpu_count': os.cpu_count(),
+            'args': vars(args)}
+    meta['args'].pop('output')
+    output.write(json.dumps(meta) + '\n')
+
+    with tempfile.TemporaryDirectory() as directory:
+        cases = create_cases(args, directory)
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes=1, maxtasksperchild=1) as pool:
+            for result in pool.imap(run_case, cases):
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+
+    if output is not sys.stdout:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
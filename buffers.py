@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+import io
+import os
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only seekable file over bytes, bytearray or memoryview. Unlike io.BytesIO the buffer isn't copied,
+    reads copy only the requested bytes.
+
+    """
+
+    def __init__(self, buffer):
+        """
+        :param buffer: object supporting buffer protocol
+        """
+        super(BufferReader, self).__init__()
+        self.view = memoryview(buffer).cast('B')
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, target):
+        count = min(len(target), max(len(self.view) - self.position, 0))
+        target[:count] = self.view[self.position:self.position + count]
+        self.position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise ValueError('Negative seek position {}!'.format(offset))
+        self.position = offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.view.release()
+        super(BufferReader, self).close()
+
+
+class Buffers(object):
+    """
+    In-memory carriers: bytes, bytearray and memoryview are read through BufferReader, file objects (BytesIO,
+    socket.makefile, pipes) are used as they are.
+
+    """
+
+    @staticmethod
+    def is_buffer(carrier):
+        return isinstance(carrier, (bytes, bytearray, memoryview))
+
+    @staticmethod
+    def open(carrier):
+        """
+        :param carrier: bytes, bytearray, memoryview or readable binary file object
+        :return: readable binary file object
+        """
+        if Buffers.is_buffer(carrier):
+            return BufferReader(carrier)
+        if not hasattr(carrier, 'read'):
+            raise ValueError('Carrier must be bytes-like or a readable binary file object!')
+        return carrier
+
+    @staticmethod
+    def is_path(file):
+        return isinstance(file, (str, os.PathLike))
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import socket
+import argparse
+
+
+class Client(object):
+    """
+    Thin client of Server (see server.py). Uses only standard library, so starting it costs no numpy/PIL/crypto
+    imports.
+
+    """
+    PATH_KEYS = ('carrier', 'output', 'secret_file', 'key_file')
+
+    def __init__(self, socket_path, timeout=None):
+        """
+        :param socket_path: path of Unix domain socket of the server
+        :param timeout: socket timeout in seconds, no timeout by default
+        """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(socket_path)
+        self.file = self.socket.makefile('rwb')
+        self.next_id = 0
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def send(self, job):
+        """
+        Sends request without waiting for response, requests can be pipelined.
+
+        :param job: job dict (see Batch), relative paths are resolved against the client directory
+        :return: request id
+        """
+        job = dict(job)
+        for key in Client.PATH_KEYS:
+            if job.get(key):
+                job[key] = os.path.abspath(job[key])
+        # public key is hex or file
+        if job.get('pubkey') and os.path.isfile(job['pubkey']):
+            job['pubkey'] = os.path.abspath(job['pubkey'])
+        if job.get('id') is None:
+            self.next_id += 1
+            job['id'] = self.next_id
+        self.file.write(json.dumps(job).encode() + b'\n')
+        self.file.flush()
+        return job['id']
+
+    def receive(self):
+        """
+        Returns the next response, responses come in order of completion.
+
+        :return: response dict
+        """
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError('Server closed the connection!')
+        return json.loads(line)
+
+    def request(self, job):
+        self.send(job)
+        return self.receive()
+
+    def hide(self, carrier, secret, output=None, bits=1, **options):
+        return self.request(dict(options, action='hide', carrier=carrier, secret=secret, output=output, bits=bits))
+
+    def recover(self, carrier, output=None, bits=None, **options):
+        return self.request(dict(options, action='recover', carrier=carrier, output=output, bits=bits))
+
+    def detect(self, carrier, **options):
+        return self.request(dict(options, action='detect', carrier=carrier))
+
+    def ping(self):
+        return self.request({'action': 'ping'})
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='client.py', description='Steganography tool - daemon client',
+                                     add_help=True)
+    parser.add_argument('action', action='store', choices=('hide', 'recover', 'detect', 'ping'),
+                        help='action of request')
+    parser.add_argument('carriers', action='store', nargs='*', help='carrier files, one request per file')
+    parser.add_argument('--socket', action='store', dest='socket', default='pystego.sock',
+                        help='--socket PATH Unix socket of the server', required=False)
+    parser.add_argument('-s', '--secret', action='store', dest='secret', help='-s secret (hide)', required=False)
+    parser.add_argument('-o', '--output', action='store', dest='output', help='-o output file (one carrier only)',
+                        required=False)
+    parser.add_argument('-b', '--bits', action='store', dest='bits', help='-b number of LSB', required=False)
+    parser.add_argument('--algorithm', action='store', dest='algorithm', choices=('aead', 'ecc'),
+                        help='--algorithm encryption (aead, ecc)', required=False)
+    parser.add_argument('--key-env', action='store', dest='key_env', help='--key-env NAME passphrase from environment '
+                                                                          'variable of the server', required=False)
+    parser.add_argument('--key-file', action='store', dest='key_file', help='--key-file FILE passphrase or private key '
+                                                                            'from file', required=False)
+    parser.add_argument('--pubkey', action='store', dest='pub_key', help='--pubkey HEX_OR_FILE ECC recipient public '
+                                                                          'key', required=False)
+    parser.add_argument('-z', '--compress', action='store', dest='compression', choices=('zlib', 'bz2', 'lzma', 'auto'),
+                        help='-z compress secret (zlib, bz2, lzma, auto)', required=False)
+    parser.add_argument('-t', '--timeout', action='store', dest='timeout', type=float,
+                        help='-t request timeout in seconds, server default otherwise', required=False)
+    args = parser.parse_args()
+
+    if args.output and len(args.carriers) > 1:
+        parser.error('-o needs exactly one carrier')
+    client = Client(args.socket)
+    if args.action == 'ping':
+        print(json.dumps(client.ping()))
+        client.close()
+        sys.exit(0)
+
+    # all requests are pipelined, the server runs them concurrently
+    for carrier in args.carriers:
+        job = {'action': args.action, 'carrier': carrier, 'secret': args.secret, 'output': args.output,
+               'bits': args.bits, 'algorithm': args.algorithm, 'key_env': args.key_env, 'key_file': args.key_file,
+               'pubkey': args.pub_key, 'compress': args.compression, 'timeout': args.timeout}
+        client.send(dict((key, value) for key, value in job.items() if value is not None))
+    failed = 0
+    for _ in args.carriers:
+        response = client.receive()
+        failed += response['status'] != 'ok'
+        print(json.dumps(response))
+    client.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,69 +1,230 @@
 #!/usr/bin/python3
 
-import pyelliptic
+import os
+import struct
+import hashlib
 from hashlib import md5
+from functools import lru_cache
 from Crypto.Cipher import AES
 from binascii import hexlify, unhexlify
 from base64 import b64encode, b64decode
 import Padding
 
+from profiling import Profiler
+
+
+class KeyProvider(object):
+    """
+    Supplies passphrase or private key without interactive prompt (env var, key file, callback).
+
+    Keys derived by KDF are cached per provider, providers created by from_env/from_file are shared
+    in the process, so a batch of jobs derives the key once.
+
+    """
+    # scrypt parameters
+    KDF_N = 2 ** 14
+    KDF_R = 8
+    KDF_P = 1
+    SALT_SIZE = 16
+
+    providers = {}
+
+    def __init__(self, callback):
+        """
+        :param callback: function returning passphrase string
+        """
+        self.callback = callback
+        self.passphrase = None
+        self.salt = os.urandom(KeyProvider.SALT_SIZE)
+        self.keys = {}
+
+    @staticmethod
+    def from_env(name):
+        """
+        Passphrase from environment variable.
+
+        :param name: variable name
+        """
+        def read_env():
+            if name not in os.environ:
+                raise ValueError('Environment variable {} is not set!'.format(name))
+            return os.environ[name]
+        return KeyProvider.providers.setdefault(('env', name), KeyProvider(read_env))
+
+    @staticmethod
+    def from_file(path):
+        """
+        Passphrase from the first line of key file.
+
+        :param path: key file path
+        """
+        def read_file():
+            with open(path) as file:
+                return file.readline().rstrip('\r\n')
+        return KeyProvider.providers.setdefault(('file', os.path.abspath(path)), KeyProvider(read_file))
+
+    @staticmethod
+    def from_callback(callback):
+        """
+        Passphrase from in-process callback.
+
+        :param callback: function returning passphrase string
+        """
+        return KeyProvider(callback)
+
+    @staticmethod
+    def prompt(text='Passphrase? '):
+        """
+        Interactive passphrase (asked once per provider).
+
+        :param text: prompt text
+        """
+        return KeyProvider(lambda: input(text))
+
+    def get_passphrase(self):
+        """
+        :return: passphrase string
+        """
+        if self.passphrase is None:
+            self.passphrase = self.callback()
+        return self.passphrase
+
+    def derive_key(self, salt=None):
+        """
+        Derives 256bit key by scrypt, cached per salt.
+
+        :param salt: salt bytes, salt of the provider by default
+        :return: key bytes
+        """
+        salt = salt or self.salt
+        if salt not in self.keys:
+            with Profiler.span('crypto.kdf'):
+                self.keys[salt] = hashlib.scrypt(self.get_passphrase().encode('utf8'), salt=salt, n=KeyProvider.KDF_N,
+                                                 r=KeyProvider.KDF_R, p=KeyProvider.KDF_P, dklen=32)
+        return self.keys[salt]
+
 
 class Crypto(object):
+    # version, salt, nonce, tag
+    AEAD_VERSION = 1
+    AEAD_HEADER = struct.Struct('<B16s12s16s')
+    # version, length of recipient public key
+    ECC_VERSION = 1
+    ECC_HEADER = struct.Struct('<BH')
+    ECC_CURVE = 'secp384r1'
 
     @staticmethod
-    def aes_encrypt(plaintext):
+    def aead_encrypt(plaintext, key_provider=None):
+        """
+        Encrypts secret by AES 256bit GCM with scrypt derived key.
+
+        :param plaintext: string or bytes to encrypt
+        :param key_provider: KeyProvider, interactive prompt by default
+        :return: raw bytes - version, salt, nonce, tag, ciphertext
+        """
+        key_provider = key_provider or KeyProvider.prompt()
+        if isinstance(plaintext, str):
+            plaintext = plaintext.encode()
+        key = key_provider.derive_key()
+        with Profiler.span('crypto.aead_encrypt', len(plaintext)):
+            nonce = os.urandom(12)
+            cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+            ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+            return Crypto.AEAD_HEADER.pack(Crypto.AEAD_VERSION, key_provider.salt, nonce, tag) + ciphertext
+
+    @staticmethod
+    def aead_decrypt(data, key_provider=None):
+        """
+        Decrypts and authenticates secret encrypted by aead_encrypt.
+
+        :param data: raw bytes from aead_encrypt
+        :param key_provider: KeyProvider, interactive prompt by default
+        :return: plaintext bytes
+        """
+        key_provider = key_provider or KeyProvider.prompt()
+        if len(data) < Crypto.AEAD_HEADER.size:
+            raise ValueError('Ciphertext is too short!')
+        version, salt, nonce, tag = Crypto.AEAD_HEADER.unpack(bytes(data[:Crypto.AEAD_HEADER.size]))
+        if version != Crypto.AEAD_VERSION:
+            raise ValueError('Unsupported ciphertext version {}!'.format(str(version)))
+        key = key_provider.derive_key(salt)
+        with Profiler.span('crypto.aead_decrypt', len(data)):
+            cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+            try:
+                return cipher.decrypt_and_verify(bytes(data[Crypto.AEAD_HEADER.size:]), tag)
+            except ValueError:
+                raise ValueError('Wrong passphrase or corrupted secret!')
+
+    @staticmethod
+    def aes_encrypt(plaintext, key_provider=None):
         """
         Encrypts secret by AES 256bit ECB
 
         :param plaintext: string to encrypt
+        :param key_provider: KeyProvider, interactive prompt by default
         :return: string cipher
         """
-        passphrase = input('Passphrase? ')
-        passphrase = md5(passphrase.encode('utf8')).hexdigest()  # helps via MD5 to convert pass on 32 bytes string
+        passphrase = (key_provider or KeyProvider.prompt()).get_passphrase()
+        with Profiler.span('crypto.aes_encrypt', len(plaintext)):
+            # MD5 hex digest of passphrase is the 32 bytes key
+            key = md5(passphrase.encode('utf8')).hexdigest().encode('ascii')
 
-        # encodes by base64
-        plaintext = b64encode(plaintext.encode())
+            # encodes by base64
+            plaintext = b64encode(plaintext.encode())
 
-        # appends padding for default size
-        plaintext = Padding.appendPadding(plaintext.decode(), AES.block_size, mode='CMS')
+            # appends padding for default size
+            plaintext = Padding.appendPadding(plaintext.decode(), AES.block_size, mode='CMS')
 
-        cipher = AES.new(passphrase, AES.MODE_ECB)
+            cipher = AES.new(key, AES.MODE_ECB)
 
-        return hexlify(cipher.encrypt(plaintext)).decode()
+            return hexlify(cipher.encrypt(plaintext.encode('ascii'))).decode()
 
     @staticmethod
-    def aes_decrypt(ciphertext):
+    def aes_decrypt(ciphertext, key_provider=None):
         """
         Decrypts secret by AES 256bit ECB
 
         :param ciphertext: string cipher to decrypt
+        :param key_provider: KeyProvider, interactive prompt by default
         :return: string plaintext
         """
-        passphrase = input('Passphrase? ')
-        passphrase = md5(passphrase.encode('utf8')).hexdigest()  # helps via MD5 to convert on 32 bytes string
-        ciphertext = unhexlify(ciphertext.encode())
-        cipher = AES.new(passphrase, AES.MODE_ECB)
-        # decrypts cipher
-        plaintext = cipher.decrypt(ciphertext).decode('utf-8')
-        # removes padding
-        plaintext = Padding.removePadding(plaintext, AES.block_size, mode='CMS')
-        # decodes plaintext
-        plaintext = b64decode(plaintext.encode())
+        passphrase = (key_provider or KeyProvider.prompt()).get_passphrase()
+        with Profiler.span('crypto.aes_decrypt', len(ciphertext)):
+            key = md5(passphrase.encode('utf8')).hexdigest().encode('ascii')
+            ciphertext = unhexlify(ciphertext.encode())
+            cipher = AES.new(key, AES.MODE_ECB)
+            # decrypts cipher
+            plaintext = cipher.decrypt(ciphertext).decode('utf-8')
+            # removes padding
+            plaintext = Padding.removePadding(plaintext, AES.block_size, mode='CMS')
+            # decodes plaintext
+            plaintext = b64decode(plaintext.encode())
 
         return plaintext.decode()
 
     @staticmethod
-    def ecc_encrypt(plaintext):
+    def ecc_encrypt(plaintext, pub_key=None):
         """
         Encrypts secret by ECC
 
         :param plaintext: string to encrypt
+        :param pub_key: hex string or path of file with recipient public key, new key pair by default
         :return: hex string of public key, cipher
         """
+        # pyelliptic loads OpenSSL, only ECC imports it
+        import pyelliptic
 
         plaintext = plaintext.encode()
-        ecc_object = pyelliptic.ECC(curve='secp384r1')
-        cipher = hexlify(ecc_object.encrypt(plaintext, ecc_object.get_pubkey(), ephemcurve='secp384r1')).decode()
+        if pub_key:
+            pub_key = Crypto.load_public_key(pub_key)
+            with Profiler.span('crypto.ecc_encrypt', len(plaintext)):
+                cipher = hexlify(pyelliptic.ECC.encrypt(plaintext, pub_key, ephemcurve=Crypto.ECC_CURVE)).decode()
+            return hexlify(pub_key).decode(), cipher
+
+        with Profiler.span('crypto.ecc_keygen'):
+            ecc_object = pyelliptic.ECC(curve='secp384r1')
+        with Profiler.span('crypto.ecc_encrypt', len(plaintext)):
+            cipher = hexlify(ecc_object.encrypt(plaintext, ecc_object.get_pubkey(), ephemcurve='secp384r1')).decode()
         pub_key = hexlify(ecc_object.get_pubkey()).decode()
         priv_key = hexlify(ecc_object.get_privkey()).decode()
 
@@ -78,21 +239,133 @@ class Crypto(object):
         return pub_key, cipher
 
     @staticmethod
-    def ecc_decrypt(pub_key, ciphertext):
+    def ecc_decrypt(pub_key, ciphertext, key_provider=None):
         """
         Decrypts secret by ECC
 
         :param pub_key: string public key
         :param ciphertext: string ciphertext
+        :param key_provider: KeyProvider of hex private key, interactive prompt by default
         :return: string plaintext
         """
+        import pyelliptic
 
         pub_key = unhexlify(pub_key.encode())
         ciphertext = unhexlify(ciphertext.encode())
 
-        priv_key = input('Private? ')
+        priv_key = (key_provider or KeyProvider.prompt('Private? ')).get_passphrase()
         priv_key = bytes.fromhex(priv_key)
-        ecc_object = pyelliptic.ECC(pubkey=pub_key, privkey=priv_key, curve='secp384r1')
-        plaintext = ecc_object.decrypt(ciphertext).decode()
+        with Profiler.span('crypto.ecc_decrypt', len(ciphertext)):
+            ecc_object = pyelliptic.ECC(pubkey=pub_key, privkey=priv_key, curve='secp384r1')
+            plaintext = ecc_object.decrypt(ciphertext).decode()
 
         return plaintext
+
+    @staticmethod
+    def ecc_generate_keys(file_prefix=None):
+        """
+        Generates reusable ECC recipient keys.
+
+        :param file_prefix: writes hex keys to <file_prefix>.pub and <file_prefix>.key
+        :return: hex string of public key, private key
+        """
+        import pyelliptic
+        with Profiler.span('crypto.ecc_keygen'):
+            ecc_object = pyelliptic.ECC(curve=Crypto.ECC_CURVE)
+        pub_key = hexlify(ecc_object.get_pubkey()).decode()
+        priv_key = hexlify(ecc_object.get_privkey()).decode()
+
+        if file_prefix:
+            with open(file_prefix + '.pub', 'w') as file:
+                file.write(pub_key + '\n')
+            with open(file_prefix + '.key', 'w') as file:
+                file.write(priv_key + '\n')
+            os.chmod(file_prefix + '.key', 0o600)
+
+        return pub_key, priv_key
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def load_public_key(key):
+        """
+        Loads recipient public key once per process.
+
+        :param key: hex string or path of file with hex public key
+        :return: public key bytes
+        """
+        if os.path.isfile(key):
+            with open(key) as file:
+                key = file.read()
+        return unhexlify(key.strip().encode())
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_ecc(pub_key, priv_key):
+        """
+        Returns ECC object of recipient keys, cached per process.
+
+        :param pub_key: public key bytes
+        :param priv_key: private key bytes
+        """
+        import pyelliptic
+        return pyelliptic.ECC(pubkey=pub_key, privkey=priv_key, curve=Crypto.ECC_CURVE)
+
+    @staticmethod
+    def ecc_encrypt_bytes(plaintext, pub_key):
+        """
+        Encrypts secret by ECC to recipient public key, no key is generated except the ephemeral one.
+
+        :param plaintext: string or bytes to encrypt
+        :param pub_key: hex string or path of file with recipient public key
+        :return: raw bytes - version, public key length, public key, cipher
+        """
+        return Crypto.ecc_encrypt_batch([plaintext], pub_key)[0]
+
+    @staticmethod
+    def ecc_encrypt_batch(plaintexts, pub_key):
+        """
+        Encrypts many secrets to the same recipient.
+
+        :param plaintexts: list of strings or bytes
+        :param pub_key: hex string or path of file with recipient public key
+        :return: list of raw bytes, see ecc_encrypt_bytes
+        """
+        import pyelliptic
+        pub_key = Crypto.load_public_key(pub_key)
+        header = Crypto.ECC_HEADER.pack(Crypto.ECC_VERSION, len(pub_key)) + pub_key
+
+        ciphers = []
+        for plaintext in plaintexts:
+            if isinstance(plaintext, str):
+                plaintext = plaintext.encode()
+            with Profiler.span('crypto.ecc_encrypt', len(plaintext)):
+                ciphers.append(header + pyelliptic.ECC.encrypt(plaintext, pub_key, ephemcurve=Crypto.ECC_CURVE))
+        return ciphers
+
+    @staticmethod
+    def is_ecc_bytes(data):
+        """
+        Checks if data is binary ECC cipher (older ciphers are hex strings).
+
+        :param data: bytes
+        """
+        return len(data) > Crypto.ECC_HEADER.size and data[0] == Crypto.ECC_VERSION
+
+    @staticmethod
+    def ecc_decrypt_bytes(data, key_provider=None):
+        """
+        Decrypts secret encrypted by ecc_encrypt_bytes.
+
+        :param data: raw bytes
+        :param key_provider: KeyProvider of hex private key, interactive prompt by default
+        :return: plaintext bytes
+        """
+        version, key_length = Crypto.ECC_HEADER.unpack(bytes(data[:Crypto.ECC_HEADER.size]))
+        if version != Crypto.ECC_VERSION:
+            raise ValueError('Unsupported ciphertext version {}!'.format(str(version)))
+        pub_key = bytes(data[Crypto.ECC_HEADER.size:Crypto.ECC_HEADER.size + key_length])
+        ciphertext = bytes(data[Crypto.ECC_HEADER.size + key_length:])
+
+        priv_key = bytes.fromhex((key_provider or KeyProvider.prompt('Private? ')).get_passphrase().strip())
+        with Profiler.span('crypto.ecc_decrypt', len(ciphertext)):
+            return Crypto.get_ecc(pub_key, priv_key).decrypt(ciphertext)
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class Files(object):
+    """
+    File operations shared by carrier formats which rewrite a copy of the carrier in place (Audio, Raster).
+
+    """
+    # ioctl for reflink copy (Btrfs, XFS)
+    FICLONE = 0x40049409
+    # bytes copied at once by plain copy
+    COPY_BLOCK = 1024 * 1024
+
+    @staticmethod
+    def copy_file(source, destination):
+        """
+        Fast file copy: reflink where the file system supports it, copy_file_range in kernel, plain copy otherwise.
+
+        :param source: source file path
+        :param destination: destination file path
+        """
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            if fcntl:
+                try:
+                    fcntl.ioctl(dst.fileno(), Files.FICLONE, src.fileno())
+                    return
+                except OSError:
+                    pass
+            if hasattr(os, 'copy_file_range'):
+                size = os.fstat(src.fileno()).st_size
+                copied = 0
+                try:
+                    while copied < size:
+                        count = os.copy_file_range(src.fileno(), dst.fileno(), size - copied)
+                        if not count:
+                            break
+                        copied += count
+                except OSError:
+                    pass
+                if copied == size:
+                    return
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+            shutil.copyfileobj(src, dst, Files.COPY_BLOCK)
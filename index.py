@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+
+import os
+import wave
+import struct
+import sqlite3
+from collections import namedtuple
+
+from payload import Payload
+from plugins import Plugins
+from profiling import Profiler
+
+
+# path and parameters of carrier, lsb_bits - the lowest number of LSB holding the requested size
+Carrier = namedtuple('Carrier', ['path', 'format', 'size', 'width', 'height', 'frames', 'channels', 'sample_width',
+                                 'rate', 'lsb_bits', 'capacity'])
+
+
+class CarrierIndex(object):
+    """
+    Local SQLite index of carriers (WAV, PNG, uncompressed pictures): parameters read from file headers and
+    capacity per number of LSB.
+
+    Files are probed only when new or changed (mtime, size), so updates of big collections are cheap. Capacities
+    of an index written by a version with other capacity formulas (VERSION) are recomputed when it is opened.
+
+    """
+    # version of capacity formulas stored in PRAGMA user_version, 2 - packed codec of pictures
+    VERSION = 2
+    # pictures (Picture, Raster) store at most 7 LSB
+    MAX_BITS = {'wav': 8}
+    PICTURE_BITS = 7
+    PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS carriers (
+            path TEXT PRIMARY KEY, mtime REAL, size INTEGER, format TEXT, width INTEGER, height INTEGER,
+            frames INTEGER, channels INTEGER, sample_width INTEGER, rate INTEGER);
+        CREATE TABLE IF NOT EXISTS capacities (
+            path TEXT, lsb_bits INTEGER, bytes INTEGER, PRIMARY KEY (path, lsb_bits));
+        CREATE INDEX IF NOT EXISTS capacities_fit ON capacities (lsb_bits, bytes);
+    '''
+
+    def __init__(self, db_path='carriers.sqlite'):
+        """
+        :param db_path: SQLite database file, created when missing
+        """
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(CarrierIndex.SCHEMA)
+        self.migrate()
+
+    def close(self):
+        self.db.close()
+
+    def migrate(self):
+        """
+        Recomputes capacities of indexed carriers from their stored parameters when the index was written with
+        other capacity formulas, files aren't probed again.
+        """
+        if self.db.execute('PRAGMA user_version').fetchone()[0] == CarrierIndex.VERSION:
+            return
+        cursor = self.db.execute('SELECT * FROM carriers')
+        columns = [column[0] for column in cursor.description]
+        capacities = []
+        for row in cursor.fetchall():
+            params = dict(zip(columns, row))
+            capacities.extend((params['path'], bits, capacity)
+                              for bits, capacity in CarrierIndex.get_capacities(params).items())
+        with self.db:
+            self.db.execute('DELETE FROM capacities')
+            self.db.executemany('INSERT INTO capacities VALUES (?, ?, ?)', capacities)
+            self.db.execute('PRAGMA user_version = {}'.format(CarrierIndex.VERSION))
+
+    @staticmethod
+    def probe(file_path):
+        """
+        Reads carrier parameters from file header only.
+
+        :param file_path: WAV, PNG or uncompressed picture (see Raster)
+        :return: dict with format, width, height, frames, channels, sample_width, rate
+        """
+        carrier_format = Plugins.detect_format(file_path)
+        if carrier_format == 'wav':
+            audio = wave.open(file_path)
+            try:
+                return {'format': 'wav', 'width': None, 'height': None, 'frames': audio.getnframes(),
+                        'channels': audio.getnchannels(), 'sample_width': audio.getsampwidth(),
+                        'rate': audio.getframerate()}
+            finally:
+                audio.close()
+        if carrier_format != 'png':
+            # BMP, PPM, PGM and TIFF header, the plugin is imported only when such carrier is indexed
+            from raster import Raster
+            layout = Raster.read_layout(file_path)
+            return {'format': layout.format, 'width': layout.width, 'height': layout.height, 'frames': None,
+                    'channels': layout.channels, 'sample_width': 1, 'rate': None}
+
+        # PNG signature and IHDR chunk (width, height) - the first 24 bytes
+        with open(file_path, 'rb') as file:
+            header = file.read(24)
+        if len(header) < 24 or header[:8] != CarrierIndex.PNG_SIGNATURE or header[12:16] != b'IHDR':
+            raise ValueError('File is not PNG!')
+        width, height = struct.unpack('>II', header[16:24])
+        return {'format': 'png', 'width': width, 'height': height, 'frames': None, 'channels': 3,
+                'sample_width': 1, 'rate': None}
+
+    @staticmethod
+    def get_capacities(params):
+        """
+        Returns secret capacity in bytes for every number of LSB (same as Audio.get_file_capacity,
+        Picture.get_file_capacity and Raster.get_file_capacity, minus the payload header).
+
+        :param params: probed parameters
+        :return: dict number of LSB -> bytes
+        """
+        if params['format'] == 'wav':
+            samples = params['frames'] * params['channels']
+            return dict((bits, max(samples * bits // 8 - Payload.HEADER_SIZE, 0)) for bits in range(1, 9))
+        values = params['width'] * params['height'] * params['channels']
+        return dict((bits, max(values * bits // 8 - Payload.HEADER_SIZE, 0))
+                    for bits in range(1, CarrierIndex.PICTURE_BITS + 1))
+
+    @staticmethod
+    def scan(sources):
+        """
+        Yields carrier files with stat results of files and directories (recursively).
+
+        :param sources: list of paths
+        """
+        extensions = Plugins.get_extensions()
+        for source in sources:
+            if os.path.isdir(source):
+                for root, directories, files in os.walk(source):
+                    for name in files:
+                        if name.lower().endswith(extensions):
+                            path = os.path.abspath(os.path.join(root, name))
+                            yield path, os.stat(path)
+            elif os.path.isfile(source) and source.lower().endswith(extensions):
+                path = os.path.abspath(source)
+                yield path, os.stat(path)
+
+    def update(self, sources, prune=True):
+        """
+        Adds new and changed carriers, unchanged files are only stat'ed.
+
+        :param sources: list of files or directories
+        :param prune: remove indexed files under the directories which don't exist anymore
+        :return: dict with numbers of probed, unchanged, failed and removed files
+        """
+        known = dict((path, (mtime, size)) for path, mtime, size in
+                     self.db.execute('SELECT path, mtime, size FROM carriers'))
+        stats = {'probed': 0, 'unchanged': 0, 'failed': 0, 'removed': 0}
+        seen = set()
+        carriers = []
+        capacities = []
+        removed = []
+
+        with Profiler.span('index.probe') as span:
+            for path, stat in CarrierIndex.scan(sources):
+                seen.add(path)
+                if known.get(path) == (stat.st_mtime, stat.st_size):
+                    stats['unchanged'] += 1
+                    continue
+                try:
+                    params = CarrierIndex.probe(path)
+                except Exception:
+                    stats['failed'] += 1
+                    # changed file which isn't a carrier anymore
+                    if path in known:
+                        removed.append((path,))
+                    continue
+                stats['probed'] += 1
+                span['bytes'] += stat.st_size
+                carriers.append((path, stat.st_mtime, stat.st_size, params['format'], params['width'],
+                                 params['height'], params['frames'], params['channels'], params['sample_width'],
+                                 params['rate']))
+                capacities.extend((path, bits, capacity)
+                                  for bits, capacity in CarrierIndex.get_capacities(params).items())
+
+        if prune:
+            roots = [os.path.join(os.path.abspath(source), '') for source in sources if os.path.isdir(source)]
+            removed.extend((path,) for path in known if path not in seen and path.startswith(tuple(roots)))
+        stats['removed'] = len(removed)
+
+        with Profiler.span('index.write'):
+            with self.db:
+                changed = [(carrier[0],) for carrier in carriers] + removed
+                self.db.executemany('DELETE FROM capacities WHERE path = ?', changed)
+                self.db.executemany('DELETE FROM carriers WHERE path = ?', removed)
+                self.db.executemany('INSERT OR REPLACE INTO carriers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', carriers)
+                self.db.executemany('INSERT INTO capacities VALUES (?, ?, ?)', capacities)
+        return stats
+
+    def find(self, size, max_bits=1, carrier_format=None, limit=1):
+        """
+        Returns the smallest carriers holding size bytes with at most max_bits LSB.
+
+        :param size: secret size in bytes
+        :param max_bits: the highest allowed number of LSB
+        :param carrier_format: format name (wav, png, bmp, ppm, pgm, tiff), any by default
+        :param limit: maximal number of carriers
+        :return: list of Carrier ordered by capacity with max_bits LSB
+        """
+        query = ('SELECT c.path, c.format, c.size, c.width, c.height, c.frames, c.channels, c.sample_width, c.rate, '
+                 '(SELECT MIN(f.lsb_bits) FROM capacities f WHERE f.path = c.path AND f.bytes >= :size), k.bytes '
+                 'FROM capacities k JOIN carriers c ON c.path = k.path '
+                 'WHERE k.lsb_bits = :bits AND k.bytes >= :size AND c.format = :format '
+                 'ORDER BY k.bytes, c.path LIMIT :limit')
+
+        # one range scan of (lsb_bits, bytes) index per format, pictures hold at most 7 LSB
+        carriers = []
+        with Profiler.span('index.find'):
+            for name in ([carrier_format] if carrier_format else sorted(Plugins.FORMATS)):
+                bits = min(max_bits, CarrierIndex.MAX_BITS.get(name, CarrierIndex.PICTURE_BITS))
+                carriers.extend(Carrier(*row) for row in self.db.execute(
+                    query, {'size': size, 'bits': bits, 'format': name, 'limit': limit}))
+        return sorted(carriers, key=lambda carrier: (carrier.capacity, carrier.path))[:limit]
+
+    def get(self, path):
+        """
+        Returns indexed parameters and capacities of carrier.
+
+        :param path: carrier file
+        :return: dict or None if the file isn't indexed
+        """
+        cursor = self.db.execute('SELECT * FROM carriers WHERE path = ?', (os.path.abspath(path),))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        params = dict(zip([column[0] for column in cursor.description], row))
+        params['capacities'] = dict(self.db.execute('SELECT lsb_bits, bytes FROM capacities WHERE path = ? '
+                                                    'ORDER BY lsb_bits', (params['path'],)))
+        return params
+
+    def count(self):
+        return self.db.execute('SELECT COUNT(*) FROM carriers').fetchone()[0]
@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+
+import os
+import math
+import wave
+import collections
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from profiling import Profiler
+
+
+# rms - root mean square of differences scaled to 0..1, psnr in dB, ssim - mean of 8x8 block SSIM
+ImageMetrics = namedtuple('ImageMetrics', ['rms', 'psnr', 'ssim', 'values'])
+# snr in dB, rms - root mean square of differences scaled to full scale, peak_error - the largest difference
+AudioMetrics = namedtuple('AudioMetrics', ['snr', 'rms', 'peak_error', 'samples'])
+
+
+class Metrics(object):
+    """
+    Quality metrics of carrier and stego file: RMS, PSNR and SSIM for images, SNR for audio.
+
+    Files are compared in tiles (images) or blocks of frames (audio) on a thread pool, numpy releases GIL. Sums
+    of squares and products are accumulated as integers, floats are used only for per-block SSIM statistics.
+    Images are read in bands of TILE_SIZE rows, so memory doesn't depend on carrier size.
+
+    """
+    # tile edge in pixels, multiple of SSIM block
+    TILE_SIZE = 512
+    SSIM_BLOCK = 8
+    SSIM_C1 = (0.01 * 255) ** 2
+    SSIM_C2 = (0.03 * 255) ** 2
+    # frames per audio block
+    BLOCK_FRAMES = 1 << 16
+    # samples summed in int64 at once, squares of 24-bit differences don't overflow
+    CHUNK_SAMPLES = 1 << 14
+
+    @staticmethod
+    def get_workers(workers=None):
+        return workers or os.cpu_count()
+
+    @staticmethod
+    def open_bands(file_path, band_rows):
+        """
+        Opens picture as bands of rows of RGB values. PNG is decoded by streaming PngReader and uncompressed
+        pictures are mapped by Raster, so only the band being compared is in memory. Other pictures (16-bit or
+        interlaced PNG, other formats of PIL) are decoded whole by PIL.
+
+        :param file_path: picture file
+        :param band_rows: rows per band
+        :return: (width, height), iterator of uint8 arrays (rows, width, 3)
+        """
+        from pngstream import PngReader
+        from raster import Raster
+        try:
+            reader = PngReader(file_path)
+            return (reader.width, reader.height), Metrics.iter_png_bands(reader, band_rows)
+        except (IOError, ValueError):
+            pass
+        try:
+            raster = Raster(file_path)
+            return (raster.layout.width, raster.layout.height), Metrics.iter_raster_bands(raster, band_rows)
+        except (IOError, ValueError):
+            pass
+        from PIL import Image
+        image = Image.open(file_path)
+        return image.size, Metrics.iter_pil_bands(image, band_rows)
+
+    @staticmethod
+    def iter_png_bands(reader, band_rows):
+        try:
+            for band in reader.iter_strips(band_rows):
+                yield band
+        finally:
+            reader.close()
+
+    @staticmethod
+    def iter_raster_bands(raster, band_rows):
+        rows, pixels = raster.open_pixels()
+        for start in range(0, raster.layout.height, band_rows):
+            band = pixels[start:start + band_rows]
+            # greyscale is compared as RGB, as by PngReader
+            yield numpy.repeat(band, 3, axis=2) if band.shape[2] == 1 else band
+
+    @staticmethod
+    def iter_pil_bands(image, band_rows):
+        # palette, 16-bit and other modes are compared as RGB
+        values = numpy.asarray(image.convert('RGB'))
+        image.close()
+        for start in range(0, values.shape[0], band_rows):
+            yield values[start:start + band_rows]
+
+    @staticmethod
+    def get_blocks(values):
+        """
+        Returns values of SSIM blocks as the last axis.
+
+        :param values: array (rows, columns, bands), rows and columns are multiples of SSIM_BLOCK
+        :return: array (block rows, block columns, bands, SSIM_BLOCK ** 2)
+        """
+        block = Metrics.SSIM_BLOCK
+        rows, columns, bands = values.shape
+        return values.reshape(rows // block, block, columns // block, block, bands).transpose(0, 2, 4, 1, 3)\
+            .reshape(rows // block, columns // block, bands, block * block)
+
+    @staticmethod
+    def compare_tile(tile1, tile2):
+        """
+        Returns integer sum of squared differences and SSIM of 8x8 blocks of one tile.
+
+        :param tile1: uint8 array (rows, columns, 3)
+        :param tile2: uint8 array of the same shape
+        :return: sum of squared differences, number of values, sum of block SSIM, number of blocks
+        """
+        tile1 = tile1.astype(numpy.int32)
+        tile2 = tile2.astype(numpy.int32)
+        difference = tile1 - tile2
+        squared_error = int(numpy.square(difference).sum(dtype=numpy.int64))
+
+        # block sums are exact integers, edge pixels not filling a block are left out of SSIM
+        block = Metrics.SSIM_BLOCK
+        rows, columns = tile1.shape[0] // block * block, tile1.shape[1] // block * block
+        if not rows or not columns:
+            return squared_error, difference.size, 0.0, 0
+        x = Metrics.get_blocks(tile1[:rows, :columns])
+        y = Metrics.get_blocks(tile2[:rows, :columns])
+        # int32 is enough, 64 products of 8-bit values
+        sum_x = x.sum(axis=3)
+        sum_y = y.sum(axis=3)
+        sum_xx = (x * x).sum(axis=3)
+        sum_yy = (y * y).sum(axis=3)
+        sum_xy = (x * y).sum(axis=3)
+
+        count = block * block
+        mean_x = sum_x / count
+        mean_y = sum_y / count
+        variance_x = sum_xx / count - mean_x * mean_x
+        variance_y = sum_yy / count - mean_y * mean_y
+        covariance = sum_xy / count - mean_x * mean_y
+        ssim = ((2 * mean_x * mean_y + Metrics.SSIM_C1) * (2 * covariance + Metrics.SSIM_C2) /
+                ((mean_x * mean_x + mean_y * mean_y + Metrics.SSIM_C1) * (variance_x + variance_y + Metrics.SSIM_C2)))
+        return squared_error, difference.size, float(ssim.sum()), ssim.size
+
+    @staticmethod
+    def add_results(totals, futures):
+        for future in futures:
+            for index, value in enumerate(future.result()):
+                totals[index] += value
+
+    @staticmethod
+    def compare_images(file_path1, file_path2, workers=None, tile_size=None):
+        """
+        Computes RMS, PSNR and SSIM of two images of the same size.
+
+        :param file_path1: carrier
+        :param file_path2: stego file
+        :param workers: number of threads, number of cores by default
+        :param tile_size: tile edge in pixels
+        :return: ImageMetrics
+        """
+        tile_size = tile_size or Metrics.TILE_SIZE
+        size1, bands1 = Metrics.open_bands(file_path1, tile_size)
+        size2, bands2 = Metrics.open_bands(file_path2, tile_size)
+        if size1 != size2:
+            raise ValueError('Images have different size!')
+        totals = [0, 0, 0.0, 0]
+        with Profiler.span('metrics.images', size1[0] * size1[1] * 3):
+            with ThreadPoolExecutor(max_workers=Metrics.get_workers(workers)) as executor:
+                # tiles of one band are compared while the next band is decoded, a band is released once
+                # its sums are accumulated
+                pending = []
+                for band1, band2 in zip(bands1, bands2):
+                    tiles = [executor.submit(Metrics.compare_tile, band1[:, x:x + tile_size], band2[:, x:x + tile_size])
+                             for x in range(0, size1[0], tile_size)]
+                    Metrics.add_results(totals, pending)
+                    pending = tiles
+                Metrics.add_results(totals, pending)
+        squared_error, values, ssim, blocks = totals
+
+        mean_error = squared_error / values if values else 0
+        psnr = 10 * math.log10(255 ** 2 / mean_error) if mean_error else float('inf')
+        return ImageMetrics(math.sqrt(mean_error) / 255, psnr, ssim / blocks if blocks else 1.0, values)
+
+    @staticmethod
+    def get_samples(frames, sample_width):
+        """
+        Converts little-endian PCM frames to signed integer samples (8-bit WAV is unsigned).
+
+        :param frames: bytes
+        :param sample_width: sample width in bytes
+        :return: int64 array
+        """
+        if sample_width == 1:
+            return numpy.frombuffer(frames, dtype=numpy.uint8).astype(numpy.int64) - 128
+        if sample_width == 3:
+            data = numpy.frombuffer(frames, dtype=numpy.uint8).reshape(-1, 3).astype(numpy.int64)
+            samples = data[:, 0] | data[:, 1] << 8 | data[:, 2] << 16
+            return samples - ((samples & 0x800000) << 1)
+        return numpy.frombuffer(frames, dtype='<i{}'.format(sample_width)).astype(numpy.int64)
+
+    @staticmethod
+    def sum_squares(values):
+        """
+        Returns sum of squares (exact for values below 2^24) and the largest absolute value.
+
+        :param values: int64 array
+        """
+        peak = int(numpy.abs(values).max())
+        if peak < 1 << 24:
+            # int64 sums of CHUNK_SAMPLES squares below 2^48 can't overflow
+            squares = values * values
+            return sum(int(value) for value in numpy.add.reduceat(
+                squares, numpy.arange(0, len(squares), Metrics.CHUNK_SAMPLES))), peak
+        # squares of 32-bit samples reach 2^62, float sum is enough for signal energy
+        values = values.astype(numpy.float64)
+        return int(numpy.dot(values, values)), peak
+
+    @staticmethod
+    def compare_block(frames1, frames2, sample_width):
+        """
+        Returns integer sums of one block of frames.
+
+        :return: signal energy, noise energy, the largest difference, number of samples
+        """
+        signal = Metrics.get_samples(frames1, sample_width)
+        if not len(signal):
+            return 0, 0, 0, 0
+        noise = signal - Metrics.get_samples(frames2, sample_width)
+        energy = Metrics.sum_squares(signal)[0]
+        noise_energy, peak_error = Metrics.sum_squares(noise)
+        return energy, noise_energy, peak_error, len(signal)
+
+    @staticmethod
+    def compare_audio(file_path1, file_path2, workers=None, block_frames=None):
+        """
+        Computes SNR of stego audio against carrier, both files are read in blocks.
+
+        :param file_path1: carrier
+        :param file_path2: stego file
+        :param workers: number of threads, number of cores by default
+        :param block_frames: frames per block
+        :return: AudioMetrics
+        """
+        audio1 = wave.open(file_path1)
+        audio2 = wave.open(file_path2)
+        try:
+            if (audio1.getnchannels(), audio1.getsampwidth(), audio1.getnframes()) != \
+                    (audio2.getnchannels(), audio2.getsampwidth(), audio2.getnframes()):
+                raise ValueError('Audio files have different channels, sample width or length!')
+            sample_width = audio1.getsampwidth()
+            block_frames = block_frames or Metrics.BLOCK_FRAMES
+            workers = Metrics.get_workers(workers)
+
+            energy = noise_energy = peak_error = samples = 0
+            pending = collections.deque()
+            with Profiler.span('metrics.audio', audio1.getnframes() * audio1.getnchannels() * sample_width), \
+                    ThreadPoolExecutor(max_workers=workers) as executor:
+                while True:
+                    frames1 = audio1.readframes(block_frames)
+                    if not frames1:
+                        break
+                    pending.append(executor.submit(Metrics.compare_block, frames1, audio2.readframes(block_frames),
+                                                   sample_width))
+                    # at most two blocks per thread are in memory
+                    while len(pending) >= 2 * workers or pending and pending[0].done():
+                        result = pending.popleft().result()
+                        energy += result[0]
+                        noise_energy += result[1]
+                        peak_error = max(peak_error, result[2])
+                        samples += result[3]
+                for future in pending:
+                    result = future.result()
+                    energy += result[0]
+                    noise_energy += result[1]
+                    peak_error = max(peak_error, result[2])
+                    samples += result[3]
+        finally:
+            audio1.close()
+            audio2.close()
+
+        full_scale = 1 << (8 * sample_width - 1)
+        # identical files have infinite SNR, noise in a silent carrier has no signal at all
+        if not noise_energy:
+            snr = float('inf')
+        elif not energy:
+            snr = float('-inf')
+        else:
+            snr = 10 * math.log10(energy / noise_energy)
+        rms = math.sqrt(noise_energy / samples) / full_scale if samples else 0.0
+        return AudioMetrics(snr, rms, peak_error, samples)
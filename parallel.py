@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy
+
+
+class Parallel(object):
+    """
+    Processing of one carrier on a process pool. The carrier is split into contiguous segments, every segment
+    knows its offset in the payload up front, so workers embed or extract in place without talking to each
+    other. Audio frames are shared as numpy.memmap of the file, decoded pictures as SharedMemory.
+
+    """
+
+    @staticmethod
+    def get_workers(workers=None):
+        return workers or os.cpu_count()
+
+    @staticmethod
+    def split(count, parts, align=1):
+        """
+        Splits range of count items into at most parts contiguous segments starting at multiples of align.
+
+        :param count: number of items
+        :param parts: number of segments
+        :param align: segment size granularity
+        :return: list of (start, stop)
+        """
+        units = -(-count // align)
+        parts = max(1, min(parts, units))
+        bounds = [min(units * part // parts * align, count) for part in range(parts + 1)]
+        return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+    @staticmethod
+    def map(function, arguments, workers=None):
+        """
+        Runs function for every tuple of arguments on a process pool.
+
+        :return: list of results in order of arguments
+        """
+        with ProcessPoolExecutor(max_workers=min(Parallel.get_workers(workers), max(len(arguments), 1))) \
+                as executor:
+            futures = [executor.submit(function, *values) for values in arguments]
+            return [future.result() for future in futures]
+
+    @staticmethod
+    def share(array):
+        """
+        Copies array to new shared memory block.
+
+        :param array: numpy array
+        :return: SharedMemory (closed and unlinked by caller), array backed by it
+        """
+        memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = numpy.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+        shared[...] = array
+        return memory, shared
+
+    @staticmethod
+    def attach(name, shape, dtype):
+        """
+        Opens shared memory block created by share in worker.
+
+        :return: SharedMemory (closed by caller), array backed by it
+        """
+        memory = shared_memory.SharedMemory(name=name)
+        return memory, numpy.ndarray(shape, dtype=dtype, buffer=memory.buf)
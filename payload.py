@@ -0,0 +1,337 @@
+#!/usr/bin/python3
+
+import os
+import bz2
+import lzma
+import time
+import zlib
+import shutil
+import struct
+import tempfile
+from math import ceil
+from collections import namedtuple
+
+from profiling import Profiler
+
+
+Header = namedtuple('Header', ['version', 'lsb_bits', 'flags', 'length', 'checksum'])
+
+
+class Payload(object):
+    """
+    Binary framing of hidden data. The header is stored at the start of the LSB stream:
+    magic, version, number of LSB, flags, payload length and CRC32 of payload.
+
+    The lowest two bits of flags hold the compression codec of the payload (compressed before encryption).
+
+    """
+    MAGIC = b'PSTG'
+    VERSION = 1
+    HEADER = struct.Struct('<4sBBBQI')
+    HEADER_SIZE = HEADER.size
+
+    CODECS = {'none': 0, 'zlib': 1, 'bz2': 2, 'lzma': 3}
+    CODEC_MASK = 0x03
+    # codecs tried by auto mode, from the fastest
+    AUTO_CODECS = ('zlib', 'bz2', 'lzma')
+    # time budget of auto mode in seconds
+    AUTO_BUDGET = 1.0
+    # bigger payloads are estimated from a sample first
+    AUTO_SAMPLE = 256 * 1024
+    # size of blocks read from payload files and of in-memory spool of unseekable streams
+    FILE_BLOCK = 1024 * 1024
+    SPOOL_SIZE = 16 * 1024 * 1024
+
+    @staticmethod
+    def pack_header(data, lsb_bits, flags=0):
+        """
+        Creates header for payload.
+
+        :param data: payload bytes
+        :param lsb_bits: number of lsb bits used for the whole stream
+        :param flags: payload flags
+        :return: header bytes
+        """
+        return Payload.HEADER.pack(Payload.MAGIC, Payload.VERSION, lsb_bits, flags, len(data),
+                                   Payload.checksum(data))
+
+    @staticmethod
+    def pack(data, lsb_bits, flags=0):
+        """
+        Returns header followed by payload.
+
+        :param data: payload bytes
+        :param lsb_bits: number of lsb bits used for the whole stream
+        :param flags: payload flags
+        :return: framed bytes
+        """
+        return Payload.pack_header(data, lsb_bits, flags) + bytes(data)
+
+    @staticmethod
+    def checksum(data):
+        """
+        Returns CRC32 of payload, files are read in blocks.
+
+        :param data: bytes or PayloadFile
+        :return: CRC32
+        """
+        if not isinstance(data, PayloadFile):
+            return zlib.crc32(data) & 0xFFFFFFFF
+        checksum = 0
+        with Profiler.span('payload.checksum', len(data)):
+            for block in data.blocks():
+                checksum = zlib.crc32(block, checksum)
+        return checksum & 0xFFFFFFFF
+
+    @staticmethod
+    def parse_header(data):
+        """
+        Parses header from the start of recovered bytes.
+
+        :param data: at least HEADER_SIZE bytes
+        :return: Header or None if data doesn't start with header
+        """
+        if len(data) < Payload.HEADER_SIZE:
+            return None
+        magic, version, lsb_bits, flags, length, checksum = Payload.HEADER.unpack(bytes(data[:Payload.HEADER_SIZE]))
+        if magic != Payload.MAGIC:
+            return None
+        if version != Payload.VERSION:
+            raise ValueError('Unsupported payload version {}!'.format(str(version)))
+        if lsb_bits not in range(1, 9):
+            return None
+        return Header(version, lsb_bits, flags, length, checksum)
+
+    @staticmethod
+    def verify(header, data):
+        """
+        Checks recovered payload against header.
+
+        :param header: parsed Header
+        :param data: payload bytes
+        """
+        Payload.verify_checksum(header, len(data), zlib.crc32(data))
+
+    @staticmethod
+    def verify_checksum(header, length, checksum):
+        """
+        Checks length and CRC32 of payload recovered in blocks against header.
+
+        :param header: parsed Header
+        :param length: number of recovered bytes
+        :param checksum: CRC32 of recovered bytes
+        """
+        if length != header.length:
+            raise ValueError('Payload is truncated! Expected {} B, got {} B.'.format(str(header.length),
+                                                                                   str(length)))
+        if checksum & 0xFFFFFFFF != header.checksum:
+            raise ValueError('Payload checksum doesn\'t match!')
+
+    @staticmethod
+    def open_file(file):
+        """
+        Opens binary stream as payload, unseekable streams (stdin, pipes) are spooled to temporary file first.
+
+        :param file: binary file object
+        :return: PayloadFile
+        """
+        if not file.seekable():
+            spool = tempfile.SpooledTemporaryFile(max_size=Payload.SPOOL_SIZE)
+            with Profiler.span('payload.spool') as span:
+                shutil.copyfileobj(file, spool, Payload.FILE_BLOCK)
+                span['bytes'] = spool.tell()
+            spool.seek(0)
+            file = spool
+        return PayloadFile(file)
+
+    @staticmethod
+    def get_compressor(codec):
+        """
+        Returns incremental compressor of codec.
+
+        :param codec: codec name (zlib, bz2, lzma)
+        :return: object with compress and flush
+        """
+        if codec == 'zlib':
+            return zlib.compressobj(9)
+        elif codec == 'bz2':
+            return bz2.BZ2Compressor(9)
+        elif codec == 'lzma':
+            return lzma.LZMACompressor(preset=6)
+        raise ValueError('Unknown compression codec {}!'.format(str(codec)))
+
+    @staticmethod
+    def get_decompressor(flags):
+        """
+        Returns incremental decompressor of codec in flags.
+
+        :param flags: header flags
+        :return: object with decompress or None for uncompressed payload
+        """
+        codec = flags & Payload.CODEC_MASK
+        if codec == Payload.CODECS['zlib']:
+            return zlib.decompressobj()
+        elif codec == Payload.CODECS['bz2']:
+            return bz2.BZ2Decompressor()
+        elif codec == Payload.CODECS['lzma']:
+            return lzma.LZMADecompressor()
+        return None
+
+    @staticmethod
+    def compress_codec(data, codec):
+        """
+        Compresses data by codec.
+
+        :param data: bytes
+        :param codec: codec name (none, zlib, bz2, lzma)
+        :return: compressed bytes
+        """
+        if codec == 'none':
+            return data
+        compressor = Payload.get_compressor(codec)
+        return compressor.compress(data) + compressor.flush()
+
+    @staticmethod
+    def choose_codec(sample, length, capacity=None, budget=None):
+        """
+        Auto mode: tries codecs from the fastest while the time budget lasts and picks the one needing the least
+        LSB planes (then the smallest payload). Payloads longer than the sample are estimated from it.
+
+        :param sample: start of payload
+        :param length: payload length
+        :param capacity: bytes per LSB plane of carrier, payload size only by default
+        :param budget: time budget in seconds, AUTO_BUDGET by default
+        :return: codec name, compressed sample
+        """
+        budget = Payload.AUTO_BUDGET if budget is None else budget
+        scale = length / len(sample) if sample else 1
+
+        def cost(size):
+            planes = int(ceil((Payload.HEADER_SIZE + size) / capacity)) if capacity else 0
+            return planes, size
+
+        best, best_size, best_data = 'none', length, sample
+        start = time.perf_counter()
+        for name in Payload.AUTO_CODECS:
+            if time.perf_counter() - start > budget:
+                break
+            codec_start = time.perf_counter()
+            compressed = Payload.compress_codec(sample, name)
+            size = int(len(compressed) * scale)
+            # the whole payload is compressed once more by the chosen codec
+            if scale > 1 and time.perf_counter() - start + (time.perf_counter() - codec_start) * scale > budget:
+                continue
+            if cost(size) < cost(best_size):
+                best, best_size, best_data = name, size, compressed
+        return best, best_data
+
+    @staticmethod
+    def compress(data, codec='auto', capacity=None, budget=None):
+        """
+        Compresses payload before encryption and embedding, data which doesn't shrink is kept uncompressed.
+
+        :param data: bytes or PayloadFile (compressed to temporary file)
+        :param codec: codec name (none, zlib, bz2, lzma) or auto (see choose_codec)
+        :param capacity: bytes per LSB plane of carrier, payload size only by default
+        :param budget: time budget of auto mode in seconds, AUTO_BUDGET by default
+        :return: flags with codec, compressed bytes or PayloadFile
+        """
+        if codec not in Payload.CODECS and codec != 'auto':
+            raise ValueError('Unknown compression codec {}!'.format(str(codec)))
+        if isinstance(data, PayloadFile):
+            return Payload.compress_file(data, codec, capacity, budget)
+
+        data = bytes(data)
+        with Profiler.span('payload.compress', len(data)):
+            if codec == 'auto':
+                codec, compressed = Payload.choose_codec(data[:Payload.AUTO_SAMPLE], len(data), capacity, budget)
+                if len(data) > Payload.AUTO_SAMPLE:
+                    compressed = Payload.compress_codec(data, codec)
+            else:
+                compressed = Payload.compress_codec(data, codec)
+            if len(compressed) >= len(data):
+                codec, compressed = 'none', data
+        Profiler.count('payload.codec.' + codec)
+        return Payload.CODECS[codec], compressed
+
+    @staticmethod
+    def compress_file(data, codec='auto', capacity=None, budget=None):
+        """
+        Compresses payload file block by block to temporary file.
+
+        :param data: PayloadFile
+        :param codec: codec name (none, zlib, bz2, lzma) or auto (see choose_codec)
+        :param capacity: bytes per LSB plane of carrier, payload size only by default
+        :param budget: time budget of auto mode in seconds, AUTO_BUDGET by default
+        :return: flags with codec, PayloadFile
+        """
+        with Profiler.span('payload.compress', len(data)):
+            if codec == 'auto':
+                codec = Payload.choose_codec(data[0:Payload.AUTO_SAMPLE], len(data), capacity, budget)[0]
+            if codec != 'none':
+                compressor = Payload.get_compressor(codec)
+                output = tempfile.SpooledTemporaryFile(max_size=Payload.SPOOL_SIZE)
+                for block in data.blocks():
+                    output.write(compressor.compress(block))
+                output.write(compressor.flush())
+                if output.tell() < len(data):
+                    output.seek(0)
+                    data = PayloadFile(output)
+                else:
+                    codec = 'none'
+        Profiler.count('payload.codec.' + codec)
+        return Payload.CODECS[codec], data
+
+    @staticmethod
+    def decompress(data, flags):
+        """
+        Decompresses payload by codec in flags.
+
+        :param data: bytes
+        :param flags: header flags
+        :return: decompressed bytes
+        """
+        decompressor = Payload.get_decompressor(flags)
+        if decompressor is None:
+            return data
+        with Profiler.span('payload.decompress', len(data)):
+            return decompressor.decompress(data)
+
+
+class PayloadFile(object):
+    """
+    Seekable binary file used as payload bytes. Slices are read from the file while embedding, so the payload
+    isn't held in memory.
+
+    """
+
+    def __init__(self, file):
+        """
+        :param file: seekable binary file object, payload starts at its current position
+        """
+        self.file = file
+        self.start = file.tell()
+        file.seek(0, os.SEEK_END)
+        self.length = file.tell() - self.start
+        file.seek(self.start)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        start, stop, step = index.indices(self.length)
+        self.file.seek(self.start + start)
+        return self.file.read(max(stop - start, 0))
+
+    def blocks(self):
+        """
+        Yields payload in blocks of Payload.FILE_BLOCK bytes.
+        """
+        for position in range(0, self.length, Payload.FILE_BLOCK):
+            yield self[position:position + Payload.FILE_BLOCK]
+
+    def read(self):
+        """
+        Returns whole payload bytes.
+        """
+        return self[0:self.length]
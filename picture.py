@@ -1,29 +1,112 @@
-import math
+import io
+import os
+
 import numpy
 from PIL import Image
-from PIL import ImageChops
 from random import choice
 from binascii import b2a_hex, a2b_hex
 
+from buffers import Buffers
+from metrics import Metrics
+from parallel import Parallel
+from payload import Payload
+from profiling import Profiler
+from pngstream import PngReader, PngWriter
+from scatter import Scatter
+
 
 class Picture(object):
-    def __init__(self, path_to_image, secret=None, num_of_bits=1, auto_detect=False):
+    # rows per strip of engine='strips'
+    STRIP_ROWS = 256
+    # 'packed' stores payload header and secret bytes bit by bit, 'hex' (older versions) stores hex characters
+    # of the secret in 7 bits terminated by the buffer, both are read
+    CODECS = ('packed', 'hex')
+
+    def __init__(self, path_to_image, secret=None, num_of_bits=1, auto_detect=False, engine='numpy',
+                 strip_rows=None, scatter_key=None, workers=None, codec='packed', compression=None):
+        if codec not in Picture.CODECS:
+            raise ValueError('Unsupported codec {}!'.format(str(codec)))
+        if compression and codec == 'hex':
+            raise ValueError('Compression needs the packed codec!')
+        if not Buffers.is_path(path_to_image):
+            # picture held in memory (bytes, memoryview) or readable binary file object
+            path_to_image = Buffers.open(path_to_image)
         self.path_to_image = path_to_image
         self.secret = secret
-        self.image = Image.open(path_to_image)
-        self.max_image_size = self.image.size[1] * self.image.size[0]
-        self.img_width = self.image.size[1]
-        self.img_height = self.image.size[0]
+        # reader of stream positioned after the header, streams can't be opened again
+        self.reader = None
+        if engine == 'strips' and scatter_key is not None:
+            raise ValueError('Scattering needs random access to the picture, it can\'t be used with strips!')
+        if engine == 'strips':
+            # PIL refuses to open gigapixel pictures (decompression bomb check), only the header is read
+            reader = PngReader(path_to_image)
+            if Buffers.is_path(path_to_image):
+                reader.close()
+            else:
+                self.reader = reader
+            self.image = None
+            size = (reader.width, reader.height)
+        else:
+            self.image = Image.open(path_to_image)
+            size = self.image.size
+        self.max_image_size = size[1] * size[0]
+        self.img_width = size[1]
+        self.img_height = size[0]
         self.BUFFER = b'BUFFER'
         self.number_of_bits = num_of_bits
+        self.engine = engine
+        self.strip_rows = strip_rows or Picture.STRIP_ROWS
+        # colour values carrying the secret are chosen by the key (see Scatter)
+        self.scatter_key = scatter_key
+        # processes embedding and extracting segments of colour values (see Parallel)
+        self.workers = workers
+        self.codec = codec
+        # secret is compressed before embedding, the codec is stored in payload flags
+        self.flags = 0
+        if compression and secret is not None:
+            self.flags, self.secret = Payload.compress(self.get_secret_bytes(), compression,
+                                                       capacity=self.max_image_size * 3 // 8)
         if auto_detect:
             self.evaluate_space()
 
+    @staticmethod
+    def get_file_capacity(file_path, num_of_bits=1):
+        """
+        Returns number of secret bytes the picture holds with the packed codec (8 bits per byte after payload
+        header).
+
+        :param file_path: picture file, only the header is read
+        :param num_of_bits: number of LSB
+        :return: capacity in bytes
+        """
+        image = Image.open(file_path)
+        values = image.size[0] * image.size[1] * 3
+        image.close()
+
+        max_bytes = max((values * num_of_bits) // 8 - Payload.HEADER_SIZE, 0)
+        print('Available kB: ' + str(max_bytes / 1024))
+        return max_bytes
+
+    def get_secret_bytes(self):
+        """
+        Returns secret as bytes, strings are UTF-8 encoded.
+        """
+        if isinstance(self.secret, bytes):
+            return self.secret
+        return self.secret.encode("UTF-8")
+
+    def get_required_bits(self):
+        """
+        Returns number of LSB bits taken by the secret: 8 per byte of payload header and secret (packed), 14 per
+        byte of secret and buffer (hex).
+        """
+        if self.codec == 'hex':
+            return (len(self.get_secret_bytes()) + len(self.BUFFER)) * 14
+        return (Payload.HEADER_SIZE + len(self.get_secret_bytes())) * 8
+
     def evaluate_space(self):
-        if self.max_image_size * 3 * self.number_of_bits <= \
-                (len(self.secret.encode("UTF-8")) * 8) + (len(self.BUFFER) * 8):
-            self.number_of_bits = ((len(self.secret.encode("UTF-8")) * 8) +
-                                   (len(self.BUFFER) * 8)) / self.max_image_size * 3
+        if self.max_image_size * 3 * self.number_of_bits < self.get_required_bits():
+            self.number_of_bits = -(-self.get_required_bits() // (self.max_image_size * 3))
             if self.number_of_bits > 7:
                 raise Exception("Could not hide the message! Secret is too large!")
         print("INFO: Using %s bits to hide the secret" % self.number_of_bits)
@@ -58,13 +141,45 @@ class Picture(object):
         return bits
 
     def get_secret(self, raw_bits):
+        return self.decode_secret(self.get_chars(raw_bits))
+
+    def get_chars(self, raw_bits):
+        """
+        Groups bit string to 7-bit characters up to the hex encoded buffer.
+
+        :param raw_bits: string of '0'/'1' characters
+        :return: string of characters
+        """
+        bits = [raw_bits[i:i + 7] for i in range(0, len(raw_bits), 7)]
+        char = ''
         try:
-            bits = [raw_bits[i:i + 7] for i in range(0, len(raw_bits), 7)]
-            char = ''
             for bit in bits:
                 char += chr(int(bit, 2))
                 if self.BUFFER.hex() in char:
                     break
+        except Exception as e:
+            raise Exception(str(e))
+        return char
+
+    def decode_secret(self, char):
+        """
+        Decodes hex characters (terminated by the hex encoded buffer) to the secret.
+
+        :param char: string of hex characters read from the picture
+        :return: secret
+        """
+        secret = self.decode_bytes(char)
+        print("Secret found in the picture: %s" % secret.decode("UTF-8"))
+        return secret.decode("UTF-8")
+
+    def decode_bytes(self, char):
+        """
+        Decodes hex characters (terminated by the hex encoded buffer) to the secret bytes.
+
+        :param char: string of hex characters read from the picture
+        :return: secret bytes
+        """
+        try:
             if len(char) % 2 != 0:
                 char += 'A'
             as_ascii = a2b_hex(char.encode('ascii'))
@@ -74,16 +189,38 @@ class Picture(object):
             raise Exception(str(e))
 
         if buffer != -1:
-            secret = as_ascii[:buffer]
+            return as_ascii[:buffer]
         else:
             raise Exception('Failed to find message buffer...')
 
-        if buffer != -1:
-            print("Secret found in the picture: %s" % secret.decode("UTF-8"))
+    def get_stream(self):
+        """
+        Returns payload header followed by the secret (packed codec).
+        """
+        return Payload.pack(self.get_secret_bytes(), int(self.number_of_bits), self.flags)
+
+    @staticmethod
+    def get_stream_bits(stream, start, count):
+        """
+        Returns bits start .. start + count of stream bytes (MSB first), bits after the stream are random.
+
+        :param stream: bytes
+        :param start: index of the first bit
+        :param count: number of bits
+        :return: uint8 array of bits (0 or 1)
+        """
+        first = start // 8
+        size = -(-(start + count) // 8) - first
+        chunk = stream[first:first + size]
+        chunk += os.urandom(size - len(chunk))
+        offset = start - first * 8
+        return numpy.unpackbits(numpy.frombuffer(chunk, dtype=numpy.uint8))[offset:offset + count]
 
     def create_bitstream(self):
+        if self.codec == 'packed':
+            return (self.create_bit_array() + ord('0')).tobytes().decode('ascii')
         try:
-            text = b'%s' % self.secret.encode("UTF-8")
+            text = b'%s' % self.get_secret_bytes()
             text += self.BUFFER
 
             hex_text = b2a_hex(text).decode('ascii')
@@ -100,60 +237,652 @@ class Picture(object):
         except Exception as e:
             raise Exception('Text to binary conversion failed! %s' % str(e))
 
-    def hide_secret(self):
+    def create_bit_array(self):
+        """
+        Same bitstream as create_bitstream, built as numpy array of 0/1 values.
+
+        Packed codec stores bits of payload header and secret, hex codec 7 bits of every hex character of the
+        secret. The rest of the capacity is filled by random bits (random characters from 'abcdef' for hex).
+        """
+        capacity = self.max_image_size * 3 * self.number_of_bits
+        if self.codec == 'packed':
+            return Picture.get_stream_bits(self.get_stream(), 0, capacity)
+        try:
+            text = self.get_secret_bytes() + self.BUFFER
+            hex_text = numpy.frombuffer(b2a_hex(text), dtype=numpy.uint8)
+            filler_count = max(0, -(-(capacity - len(hex_text) * 7) // 7))
+            filler = numpy.frombuffer(b'abcdef', dtype=numpy.uint8)[numpy.random.randint(0, 6, filler_count)]
+            chars = numpy.concatenate((hex_text, filler))
+            return numpy.unpackbits(chars.reshape(-1, 1), axis=1)[:, 1:].reshape(-1)
+        except Exception as e:
+            raise Exception('Text to binary conversion failed! %s' % str(e))
+
+    def iter_bit_strips(self, counts):
+        """
+        Same bitstream as create_bit_array, generated lazily strip by strip. Characters are unpacked only for
+        the current strip, bits of a character crossing the end of strip are carried over.
+
+        :param counts: number of bits of every strip
+        :return: iterator of uint8 arrays of bits (0 or 1)
+        """
+        if self.codec == 'packed':
+            stream = self.get_stream()
+            position = 0
+            for count in counts:
+                yield Picture.get_stream_bits(stream, position, count)
+                position += count
+            return
+        hex_text = numpy.frombuffer(b2a_hex(self.get_secret_bytes() + self.BUFFER), dtype=numpy.uint8)
+        letters = numpy.frombuffer(b'abcdef', dtype=numpy.uint8)
+        position = 0
+        carry = numpy.empty(0, dtype=numpy.uint8)
+        for count in counts:
+            char_count = max(0, -(-(count - len(carry)) // 7))
+            chars = hex_text[position:position + char_count]
+            if len(chars) < char_count:
+                chars = numpy.concatenate((chars, letters[numpy.random.randint(0, 6, char_count - len(chars))]))
+            position += char_count
+            bits = numpy.concatenate((carry, numpy.unpackbits(chars.reshape(-1, 1), axis=1)[:, 1:].reshape(-1)))
+            carry = bits[count:]
+            yield bits[:count]
+
+    @staticmethod
+    def embed_bits(values, bits, num_of_bits):
+        """
+        Embeds bits into LSB planes of colour values. Every value takes num_of_bits bits, the first
+        one goes to the lowest bit (same order as set_bit in hide_secret loop).
+
+        :param values: flat uint8 array of colour values, modified in place
+        :param bits: uint8 array of bits (0 or 1)
+        :param num_of_bits: number of LSB planes
+        """
+        bits = bits[:len(values) * num_of_bits]
+        for plane in range(num_of_bits):
+            plane_bits = bits[plane::num_of_bits]
+            count = len(plane_bits)
+            values[:count] &= numpy.uint8(0xFF ^ (1 << plane))
+            values[:count] |= plane_bits.astype(numpy.uint8) << numpy.uint8(plane)
+
+    @staticmethod
+    def read_bits(values, num_of_bits):
+        """
+        Reads LSB planes of colour values, inverse of embed_bits.
+
+        :param values: flat uint8 array of colour values
+        :param num_of_bits: number of LSB planes
+        :return: uint8 array of bits
+        """
+        bits = numpy.empty((len(values), num_of_bits), dtype=numpy.uint8)
+        for plane in range(num_of_bits):
+            numpy.bitwise_and(values >> numpy.uint8(plane), 1, out=bits[:, plane])
+        return bits.reshape(-1)
+
+    def get_pixel_values(self):
+        """
+        Loads the picture once as flat array of R, G, B values (row by row).
+        """
+        with Profiler.span('picture.decode', self.max_image_size * 3):
+            image = self.image if self.image.mode == 'RGB' else self.image.convert('RGB')
+            return numpy.array(image, dtype=numpy.uint8).reshape(-1)
+
+    def embed_array(self, bits):
+        """
+        Array-backed engine, embeds all LSB planes with bitwise operations.
+
+        :param bits: uint8 array of bits (0 or 1)
+        :return: new image with the payload
+        """
+        values = self.get_pixel_values()
+        with Profiler.span('picture.embed', len(values)):
+            Picture.embed_bits(values, bits, self.number_of_bits)
+        return Image.fromarray(values.reshape(self.img_width, self.img_height, 3), 'RGB')
+
+    def get_payload_bits(self):
+        """
+        Bits of payload header and secret (hex characters of the secret and the buffer) without random filler.
+        """
+        if self.codec == 'packed':
+            return numpy.unpackbits(numpy.frombuffer(self.get_stream(), dtype=numpy.uint8))
+        hex_text = numpy.frombuffer(b2a_hex(self.get_secret_bytes() + self.BUFFER), dtype=numpy.uint8)
+        return numpy.unpackbits(hex_text.reshape(-1, 1), axis=1)[:, 1:].reshape(-1)
+
+    def embed_scattered(self):
+        """
+        Embeds the bitstream without filler into colour values chosen by the key, every value takes
+        num_of_bits bits. Other values are untouched.
+
+        :return: new image with the payload
+        """
+        bits = self.get_payload_bits()
+        values = self.get_pixel_values()
+        scatter = Scatter(self.scatter_key, len(values))
+        count = -(-len(bits) // self.number_of_bits)
+        with Profiler.span('picture.embed', count):
+            for start, positions in scatter.iter_positions(count):
+                selected = values[positions]
+                Picture.embed_bits(selected, bits[start * self.number_of_bits:], self.number_of_bits)
+                values[positions] = selected
+        return Image.fromarray(values.reshape(self.img_width, self.img_height, 3), 'RGB')
+
+    def embed_strips(self, output_file):
+        """
+        Strip engine, decodes, embeds and encodes the picture strip by strip (see pngstream), memory is bounded
+        by strip_rows and doesn't depend on height of the picture. Produces the same picture as engine='numpy'.
+
+        :param output_file: output PNG file
+        """
+        reader = self.reader or PngReader(self.path_to_image)
+        self.reader = None
+        writer = PngWriter(output_file, reader.width, reader.height)
+        try:
+            strip_values = reader.width * 3 * self.number_of_bits
+            counts = [min(self.strip_rows, reader.height - start) * strip_values
+                      for start in range(0, reader.height, self.strip_rows)]
+            with Profiler.span('picture.strips', self.max_image_size * 3):
+                for pixels, bits in zip(reader.iter_strips(self.strip_rows), self.iter_bit_strips(counts)):
+                    Picture.embed_bits(pixels.reshape(-1), bits, self.number_of_bits)
+                    writer.write_strip(pixels)
+            writer.close()
+        except Exception:
+            writer.close()
+            if Buffers.is_path(output_file):
+                os.remove(output_file)
+            raise
+        finally:
+            reader.close()
+
+    def embed_parallel(self):
+        """
+        Array-backed engine on a process pool. Colour values are copied to shared memory once, every worker
+        generates the bitstream of its segment and embeds it in place.
+
+        :return: new image with the payload
+        """
+        memory, values = Parallel.share(self.get_pixel_values())
+        try:
+            workers = Parallel.get_workers(self.workers)
+            if self.codec == 'packed':
+                # segments start at multiples of 8 values, so they hold whole bytes of the stream
+                stream = self.get_stream()
+                arguments = [(memory.name, len(values), start, stop,
+                              stream[start * self.number_of_bits // 8:-(-stop * self.number_of_bits // 8)],
+                              self.number_of_bits) for start, stop in Parallel.split(len(values), workers, 8)]
+                function = Picture.embed_packed_segment
+            else:
+                # segments start at multiples of 7 values, so they hold whole 7-bit characters
+                hex_text = b2a_hex(self.get_secret_bytes() + self.BUFFER)
+                arguments = [(memory.name, len(values), start, stop, hex_text, self.number_of_bits)
+                             for start, stop in Parallel.split(len(values), workers, 7)]
+                function = Picture.embed_segment
+            with Profiler.span('picture.embed', len(values)):
+                Parallel.map(function, arguments, self.workers)
+            return Image.fromarray(values.reshape(self.img_width, self.img_height, 3), 'RGB')
+        finally:
+            del values
+            memory.close()
+            memory.unlink()
+
+    @staticmethod
+    def embed_segment(name, size, start, stop, hex_text, num_of_bits):
+        """
+        Embeds bits start * num_of_bits .. stop * num_of_bits of the bitstream into shared colour values (in
+        worker process).
+
+        :param name: name of shared memory with colour values
+        :param size: number of colour values
+        :param start: the first value of segment, multiple of 7
+        :param stop: the end of segment
+        :param hex_text: hex encoded secret and buffer
+        :param num_of_bits: number of LSB planes
+        """
+        memory, values = Parallel.attach(name, (size,), numpy.uint8)
+        try:
+            first_char = start * num_of_bits // 7
+            char_count = -(-(stop - start) * num_of_bits // 7)
+            chars = numpy.frombuffer(hex_text[first_char:first_char + char_count], dtype=numpy.uint8)
+            if len(chars) < char_count:
+                letters = numpy.frombuffer(b'abcdef', dtype=numpy.uint8)
+                chars = numpy.concatenate((chars, letters[numpy.random.randint(0, 6, char_count - len(chars))]))
+            bits = numpy.unpackbits(chars.reshape(-1, 1), axis=1)[:, 1:].reshape(-1)
+            Picture.embed_bits(values[start:stop], bits, num_of_bits)
+        finally:
+            del values
+            memory.close()
+
+    @staticmethod
+    def embed_packed_segment(name, size, start, stop, payload, num_of_bits):
+        """
+        Embeds bytes of stream into segment of shared colour values (in worker process), the rest of the segment
+        after payload is filled by random bits.
+
+        :param name: name of shared memory with colour values
+        :param size: number of colour values
+        :param start: the first value of segment, multiple of 8
+        :param stop: the end of segment
+        :param payload: stream bytes of segment
+        :param num_of_bits: number of LSB planes
+        """
+        memory, values = Parallel.attach(name, (size,), numpy.uint8)
+        try:
+            Picture.embed_bits(values[start:stop], Picture.get_stream_bits(payload, 0, (stop - start) * num_of_bits),
+                               num_of_bits)
+        finally:
+            del values
+            memory.close()
+
+    def embed_loop(self, bitstream):
+        """
+        Pixel by pixel engine, embeds the bitstream with getpixel/putpixel.
+
+        :param bitstream: iterator of '0'/'1' characters
+        :return: new image with the payload
+        """
+        new_image = Image.new("RGB", (self.img_height, self.img_width), "white")
+        for row in range(self.img_width):
+            for col in range(self.img_height):
+                r, g, b = self.image.getpixel((col, row))
+                try:
+                    for i in range(1, self.number_of_bits + 1):
+                        next_bit = next(bitstream)
+                        r = Picture.set_bit(r, next_bit, i)
+                    for i in range(1, self.number_of_bits + 1):
+                        next_bit = next(bitstream)
+                        g = Picture.set_bit(g, next_bit, i)
+                    for i in range(1, self.number_of_bits + 1):
+                        next_bit = next(bitstream)
+                        b = Picture.set_bit(b, next_bit, i)
+                except StopIteration:
+                    pass
+                new_image.putpixel((col, row), (r, g, b))
+        return new_image
+
+    def hide_secret(self, output_file=None):
         if self.secret is None:
             raise Exception("Could not hide the message! Secret can't be %s" % self.secret)
-        if self.max_image_size * 3 * self.number_of_bits <= \
-                (len(self.secret.encode("UTF-8")) * 8) + (len(self.BUFFER) * 8):
+        if self.max_image_size * 3 * self.number_of_bits < self.get_required_bits():
             raise Exception('Message is too large!')
 
-        bitstream = iter(self.create_bitstream())
-
-        new_image = Image.new("RGB", (self.img_height, self.img_width), "white")
         try:
-            for row in range(self.img_width):
-                for col in range(self.img_height):
-                    r, g, b = self.image.getpixel((col, row))
-                    try:
-                        for i in range(1, self.number_of_bits + 1):
-                            next_bit = next(bitstream)
-                            r = Picture.set_bit(r, next_bit, i)
-                        for i in range(1, self.number_of_bits + 1):
-                            next_bit = next(bitstream)
-                            g = Picture.set_bit(g, next_bit, i)
-                        for i in range(1, self.number_of_bits + 1):
-                            next_bit = next(bitstream)
-                            b = Picture.set_bit(b, next_bit, i)
-                    except StopIteration:
-                        pass
-                    new_image.putpixel((col, row), (r, g, b))
-            new_image.save(self.path_to_image.replace(".png", "_secret.png"))
+            if not output_file:
+                if not Buffers.is_path(self.path_to_image):
+                    raise ValueError('Output file is required when picture isn\'t a file path!')
+                output_file = str(self.path_to_image).replace(".png", "_secret.png")
+            if self.engine == 'strips':
+                self.embed_strips(output_file)
+                return output_file
+            if self.scatter_key is not None:
+                new_image = self.embed_scattered()
+            elif self.workers and self.workers > 1 and self.engine == 'numpy':
+                new_image = self.embed_parallel()
+            elif self.engine == 'loop':
+                with Profiler.span('picture.bitstream'):
+                    bitstream = self.create_bitstream()
+                with Profiler.span('picture.embed', self.max_image_size * 3):
+                    new_image = self.embed_loop(iter(bitstream))
+            else:
+                with Profiler.span('picture.bitstream'):
+                    bits = self.create_bit_array()
+                new_image = self.embed_array(bits)
+            with Profiler.span('picture.encode', self.max_image_size * 3):
+                if Buffers.is_path(output_file):
+                    new_image.save(output_file)
+                else:
+                    new_image.save(output_file, format='PNG')
+            return output_file
         except Exception as e:
             raise Exception('Could not create a new file with a payload! %s' % str(e))
 
+    @staticmethod
+    def hide_buffer(secret, carrier, output=None, num_of_bits=1, engine='numpy', strip_rows=None, scatter_key=None,
+                    workers=None, codec='packed', compression=None):
+        """
+        Hides secret in PNG held in memory or read from a stream, nothing is written to disk. Engine 'strips'
+        decodes and encodes the stream strip by strip, other engines decode the whole picture.
+
+        :param secret: secret string or bytes
+        :param carrier: PNG as bytes, bytearray, memoryview or readable binary file object (BytesIO,
+                        socket.makefile('rb'), pipe)
+        :param output: writable binary file object the stego PNG is written to, returned buffer by default
+        :param compression: codec compressing the secret (zlib, bz2, lzma or auto), uncompressed by default
+        :return: stego PNG as memoryview, output if given
+        """
+        stream = output if output is not None else io.BytesIO()
+        Picture(carrier, secret, num_of_bits, engine=engine, strip_rows=strip_rows, scatter_key=scatter_key,
+                workers=workers, codec=codec, compression=compression).hide_secret(stream)
+        return output if output is not None else stream.getbuffer()
+
+    @staticmethod
+    def extract_buffer(carrier, num_of_bits=1, engine='numpy', strip_rows=None, scatter_key=None, workers=None):
+        """
+        Extracts secret from PNG held in memory or read from a stream.
+
+        :param carrier: PNG as bytes, bytearray, memoryview or readable binary file object
+        :return: secret bytes
+        """
+        return Picture(carrier, num_of_bits=num_of_bits, engine=engine, strip_rows=strip_rows,
+                       scatter_key=scatter_key, workers=workers).extract_bytes()
+
     def extract_secret(self):
-        hidden = ''
         try:
-            for row in range(self.image.size[1]):
-                for col in range(self.image.size[0]):
-                    r, g, b = self.image.getpixel((col, row))
-                    hidden += self.extract_bits(r)
-                    hidden += self.extract_bits(g)
-                    hidden += self.extract_bits(b)
-            try:
-                self.get_secret(hidden)
-                return True
-            except Exception as e:
-                raise Exception('Failed to extract message: %s' % str(e))
+            secret = self.read_secret().decode("UTF-8")
         except Exception as e:
             raise Exception('Failed to extract message: %s' % str(e))
+        print("Secret found in the picture: %s" % secret)
+        return secret
 
-    @staticmethod
-    def compare_pictures(file_path1, file_path2):
+    def extract_bytes(self):
+        """
+        Extracts secret as bytes (binary secrets, shards).
+
+        :return: secret bytes
+        """
         try:
-            im1 = Image.open(file_path1)
-            im2 = Image.open(file_path2)
+            return self.read_secret()
         except Exception as e:
+            raise Exception('Failed to extract message: %s' % str(e))
+
+    def read_secret(self):
+        """
+        Reads secret by the engine, the codec is recognised by payload header.
+
+        :return: secret bytes
+        """
+        if self.scatter_key is not None:
+            return self.extract_scattered()
+        if self.engine == 'loop':
+            hidden = self.extract_loop()
+            return self.read_payload(iter([numpy.frombuffer(hidden.encode('ascii'), dtype=numpy.uint8) - ord('0')]))
+        if self.engine == 'strips':
+            return self.extract_strips()
+        if self.workers and self.workers > 1:
+            return self.extract_parallel()
+        return self.extract_array()
+
+    def read_payload(self, blocks):
+        """
+        Reads secret from blocks of bits up to its end. Bitstream starting with payload header holds packed
+        secret, other bitstreams are read as hex characters up to the buffer (pictures hidden by older versions).
+
+        :param blocks: iterator of uint8 arrays of bits (0 or 1)
+        :return: secret bytes
+        """
+        packed = PayloadReader()
+        chars = None
+        for bits in blocks:
+            if chars is not None:
+                if chars.feed(bits):
+                    break
+            elif packed.feed(bits):
+                if packed.header is not None:
+                    break
+                chars = CharReader(self.BUFFER.hex().encode('ascii'))
+                if chars.feed(packed.get_bits()):
+                    break
+        if chars is None and packed.header is None:
+            # picture too small for payload header
+            chars = CharReader(self.BUFFER.hex().encode('ascii'))
+            chars.feed(packed.get_bits())
+        if chars is not None:
+            return self.decode_bytes(chars.get_chars())
+        return packed.get_payload()
+
+    def iter_value_bits(self, values, scatter=None):
+        """
+        Reads LSB planes of colour values in growing blocks, so reading can stop at the end of the secret.
+
+        :param values: flat uint8 array of colour values
+        :param scatter: Scatter choosing the values, values in order by default
+        :return: iterator of uint8 arrays of bits
+        """
+        start = 0
+        count = Scatter.BLOCK // 256
+        while start < len(values):
+            count = min(count, len(values) - start)
+            if scatter is not None:
+                selected = values[scatter.get_positions(start, count)]
+            else:
+                selected = values[start:start + count]
+            yield Picture.read_bits(selected, self.number_of_bits)
+            start += count
+            count = min(count * 2, Scatter.BLOCK)
+
+    def extract_loop(self):
+        """
+        Pixel by pixel engine, reads the bitstream with getpixel.
+
+        :return: string of '0'/'1' characters
+        """
+        hidden = ''
+        for row in range(self.image.size[1]):
+            for col in range(self.image.size[0]):
+                r, g, b = self.image.getpixel((col, row))
+                hidden += self.extract_bits(r)
+                hidden += self.extract_bits(g)
+                hidden += self.extract_bits(b)
+        return hidden
+
+    def extract_array(self):
+        """
+        Array-backed engine, reads LSB planes of colour values in growing blocks up to the end of the secret.
+
+        :return: secret bytes
+        """
+        values = self.get_pixel_values()
+        with Profiler.span('picture.extract', len(values)):
+            return self.read_payload(self.iter_value_bits(values))
+
+    def extract_parallel(self):
+        """
+        Array-backed engine on a process pool. Payload header is read first, workers read bytes of segments
+        of shared colour values holding the secret. Hex characters (older versions) are read from all values.
+
+        :return: secret bytes
+        """
+        memory, values = Parallel.share(self.get_pixel_values())
+        try:
+            workers = Parallel.get_workers(self.workers)
+            header_values = -(-Payload.HEADER_SIZE * 8 // self.number_of_bits)
+            header = Payload.parse_header(
+                numpy.packbits(Picture.read_bits(values[:header_values], self.number_of_bits)).tobytes())
+            if header is not None:
+                total_bytes = Payload.HEADER_SIZE + header.length
+                used_values = min(len(values), -(-total_bytes * 8 // self.number_of_bits))
+                # segments start at multiples of 8 values, so they hold whole bytes of the stream
+                arguments = [(memory.name, len(values), start, stop, self.number_of_bits)
+                             for start, stop in Parallel.split(used_values, workers, 8)]
+                with Profiler.span('picture.extract', used_values):
+                    stream = b''.join(Parallel.map(Picture.extract_packed_segment, arguments, self.workers))
+            else:
+                arguments = [(memory.name, len(values), start, stop, self.number_of_bits)
+                             for start, stop in Parallel.split(len(values), workers, 7)]
+                with Profiler.span('picture.extract', len(values)):
+                    chars = b''.join(Parallel.map(Picture.extract_segment, arguments, self.workers))
+        finally:
+            del values
+            memory.close()
+            memory.unlink()
+        if header is not None:
+            data = stream[Payload.HEADER_SIZE:total_bytes]
+            Payload.verify(header, data)
+            return Payload.decompress(data, header.flags)
+        end = chars.find(self.BUFFER.hex().encode('ascii'))
+        if end != -1:
+            chars = chars[:end + len(self.BUFFER.hex())]
+        return self.decode_bytes(chars.decode('latin-1'))
+
+    @staticmethod
+    def extract_segment(name, size, start, stop, num_of_bits):
+        """
+        Reads 7-bit characters of segment of shared colour values (in worker process).
+
+        :return: bytes of characters
+        """
+        memory, values = Parallel.attach(name, (size,), numpy.uint8)
+        try:
+            bits = Picture.read_bits(values[start:stop], num_of_bits)
+            bits = bits[:len(bits) // 7 * 7].reshape(-1, 7)
+            return (numpy.packbits(bits, axis=1) >> 1).reshape(-1).tobytes()
+        finally:
+            del values
+            memory.close()
+
+    @staticmethod
+    def extract_packed_segment(name, size, start, stop, num_of_bits):
+        """
+        Reads stream bytes of segment of shared colour values (in worker process).
+
+        :return: bytes
+        """
+        memory, values = Parallel.attach(name, (size,), numpy.uint8)
+        try:
+            return numpy.packbits(Picture.read_bits(values[start:stop], num_of_bits)).tobytes()
+        finally:
+            del values
+            memory.close()
+
+    def extract_scattered(self):
+        """
+        Reads colour values chosen by the key in growing blocks up to the end of the secret, so only the values
+        holding the secret are read.
+
+        :return: secret bytes
+        """
+        values = self.get_pixel_values()
+        scatter = Scatter(self.scatter_key, len(values))
+        with Profiler.span('picture.extract', len(values)):
+            return self.read_payload(self.iter_value_bits(values, scatter))
+
+    def extract_strips(self):
+        """
+        Strip engine, reads strips up to the one holding the end of the secret.
+
+        :return: secret bytes
+        """
+        with Profiler.span('picture.strips', self.max_image_size * 3):
+            return self.read_payload(self.iter_strip_bits())
+
+    def iter_strip_bits(self):
+        """
+        :return: iterator of uint8 arrays of bits of strips
+        """
+        png = self.reader or PngReader(self.path_to_image)
+        self.reader = None
+        try:
+            for pixels in png.iter_strips(self.strip_rows):
+                yield Picture.read_bits(pixels.reshape(-1), self.number_of_bits)
+        finally:
+            png.close()
+
+    @staticmethod
+    def compare_pictures(file_path1, file_path2, workers=None):
+        """
+        Prints RMS, PSNR and SSIM of two pictures, computed in tiles on a thread pool (see Metrics).
+
+        :param workers: number of threads, number of cores by default
+        :return: ImageMetrics
+        """
+        try:
+            metrics = Metrics.compare_images(file_path1, file_path2, workers)
+        except IOError as e:
             raise Exception('Failed to open images: %s' % str(e))
-        errors = numpy.asarray(ImageChops.difference(im1, im2)) / 255
-        print("Root mean square is: %s" % math.sqrt(numpy.mean(numpy.square(errors))))
+        print("Root mean square is: %s" % metrics.rms)
+        print("PSNR is: %s dB" % metrics.psnr)
+        print("SSIM is: %s" % metrics.ssim)
+        return metrics
+
+
+class CharReader(object):
+    """
+    Groups bits read in blocks to 7-bit characters up to the hex encoded buffer. Reading is done at the buffer
+    or at the first character which isn't hex, such picture holds no secret.
+
+    """
+    HEX_CHARS = numpy.zeros(256, dtype=bool)
+    HEX_CHARS[numpy.frombuffer(b'0123456789abcdefABCDEF', dtype=numpy.uint8)] = True
+
+    def __init__(self, terminator):
+        """
+        :param terminator: hex encoded buffer
+        """
+        self.terminator = terminator
+        self.chars = bytearray()
+        self.carry = numpy.empty(0, dtype=numpy.uint8)
+        self.end = None
+
+    def feed(self, bits):
+        """
+        :param bits: uint8 array of bits (0 or 1) following the previous block
+        :return: True when reading is done
+        """
+        bits = numpy.concatenate((self.carry, bits))
+        usable = len(bits) // 7 * 7
+        self.carry = bits[usable:]
+        chars = (numpy.packbits(bits[:usable].reshape(-1, 7), axis=1) >> 1).reshape(-1)
+        # the buffer may start in the previous block
+        start = max(0, len(self.chars) - len(self.terminator) + 1)
+        self.chars += chars.tobytes()
+        end = self.chars.find(self.terminator, start)
+        if end != -1:
+            self.end = end + len(self.terminator)
+            return True
+        invalid = numpy.flatnonzero(~CharReader.HEX_CHARS[chars])
+        if len(invalid):
+            self.end = len(self.chars) - len(chars) + invalid[0] + 1
+            return True
+        return False
+
+    def get_chars(self):
+        """
+        :return: string of characters read so far, up to the buffer
+        """
+        return self.chars[:self.end].decode('latin-1')
+
+
+class PayloadReader(object):
+    """
+    Groups bits read in blocks to bytes of payload header and secret (packed codec). Reading is done at the end of
+    the secret, or as soon as the bitstream turns out not to start with payload header.
+
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.carry = numpy.empty(0, dtype=numpy.uint8)
+        self.header = None
+        self.end = None
+
+    def feed(self, bits):
+        """
+        :param bits: uint8 array of bits (0 or 1) following the previous block
+        :return: True when reading is done
+        """
+        bits = numpy.concatenate((self.carry, bits))
+        usable = len(bits) // 8 * 8
+        self.carry = bits[usable:]
+        self.data += numpy.packbits(bits[:usable]).tobytes()
+        if self.header is None:
+            if len(self.data) < Payload.HEADER_SIZE:
+                return False
+            self.header = Payload.parse_header(self.data)
+            if self.header is None:
+                return True
+            self.end = Payload.HEADER_SIZE + self.header.length
+        if len(self.data) >= self.end:
+            del self.data[self.end:]
+            return True
+        return False
+
+    def get_bits(self):
+        """
+        :return: all bits read so far (before the header is recognised)
+        """
+        return numpy.concatenate((numpy.unpackbits(numpy.frombuffer(bytes(self.data), dtype=numpy.uint8)),
+                                  self.carry))
+
+    def get_payload(self):
+        """
+        :return: secret bytes, checked against payload header
+        """
+        data = bytes(self.data[Payload.HEADER_SIZE:self.end])
+        Payload.verify(self.header, data)
+        return Payload.decompress(data, self.header.flags)
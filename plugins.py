@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+import os
+import importlib
+
+
+class Plugins(object):
+    """
+    Registry of carrier formats and ciphers. Plugins are 'module:attribute' strings imported on first use, so a
+    command pays only for the formats and ciphers it touches (numpy and PIL for carriers, pycryptodome and
+    pyelliptic for ciphers). Carrier format of existing file is detected by magic bytes, by extension otherwise.
+
+    Other formats and ciphers are registered by register_format and register_cipher.
+
+    """
+    # name -> plugin, magic bytes as (offset, bytes) pairs, extensions
+    FORMATS = {
+        'wav': {'plugin': 'audio:Audio', 'magic': ((0, b'RIFF'), (8, b'WAVE')), 'extensions': ('.wav',)},
+        'png': {'plugin': 'picture:Picture', 'magic': ((0, b'\x89PNG\r\n\x1a\n'),), 'extensions': ('.png',)},
+        # uncompressed pictures with the interface of Picture, mapped without decoding
+        'bmp': {'plugin': 'raster:Raster', 'magic': ((0, b'BM'),), 'extensions': ('.bmp',)},
+        'ppm': {'plugin': 'raster:Raster', 'magic': ((0, b'P6'),), 'extensions': ('.ppm',)},
+        'pgm': {'plugin': 'raster:Raster', 'magic': ((0, b'P5'),), 'extensions': ('.pgm',)},
+        'tiff': {'plugin': 'raster:Raster', 'magic': ((0, b'II*\x00'),), 'extensions': ('.tif', '.tiff')},
+        'tiff-be': {'plugin': 'raster:Raster', 'magic': ((0, b'MM\x00*'),), 'extensions': ()},
+    }
+    CIPHERS = {'aes': 'crypto:Crypto', 'aead': 'crypto:Crypto', 'ecc': 'crypto:Crypto'}
+    MAGIC_SIZE = 16
+    loaded = {}
+
+    @staticmethod
+    def register_format(name, plugin, magic, extensions=()):
+        """
+        :param name: format name
+        :param plugin: 'module:attribute' of carrier class
+        :param magic: list of (offset, bytes) identifying the format
+        :param extensions: file extensions used when the file doesn't exist yet
+        """
+        Plugins.FORMATS[name] = {'plugin': plugin, 'magic': tuple(magic), 'extensions': tuple(extensions)}
+        Plugins.MAGIC_SIZE = max([Plugins.MAGIC_SIZE] + [offset + len(value) for offset, value in magic])
+
+    @staticmethod
+    def register_cipher(name, plugin):
+        """
+        :param name: algorithm name
+        :param plugin: 'module:attribute' implementing the algorithm
+        """
+        Plugins.CIPHERS[name] = plugin
+
+    @staticmethod
+    def load(plugin):
+        """
+        Imports plugin on first use.
+
+        :param plugin: 'module:attribute'
+        :return: attribute of module
+        """
+        if plugin not in Plugins.loaded:
+            module, attribute = plugin.split(':')
+            Plugins.loaded[plugin] = getattr(importlib.import_module(module), attribute)
+        return Plugins.loaded[plugin]
+
+    @staticmethod
+    def get_format(name):
+        if name not in Plugins.FORMATS:
+            raise IOError('Unsupported file format {}!'.format(str(name)))
+        return Plugins.load(Plugins.FORMATS[name]['plugin'])
+
+    @staticmethod
+    def get_cipher(name):
+        if name not in Plugins.CIPHERS:
+            raise ValueError('Unsupported algorithm {}!'.format(str(name)))
+        return Plugins.load(Plugins.CIPHERS[name])
+
+    @staticmethod
+    def get_extensions():
+        """
+        Returns file extensions of all registered carrier formats (scanning directories for carriers).
+
+        :return: tuple of lower case extensions
+        """
+        return tuple(extension for spec in Plugins.FORMATS.values() for extension in spec['extensions'])
+
+    @staticmethod
+    def detect_format(file_path):
+        """
+        Returns carrier format of file by magic bytes, by extension when the file can't be read.
+
+        :param file_path: carrier file or carrier held in memory (bytes, bytearray, memoryview)
+        :return: format name
+        """
+        if isinstance(file_path, (bytes, bytearray, memoryview)):
+            head = bytes(memoryview(file_path)[:Plugins.MAGIC_SIZE])
+        else:
+            try:
+                with open(file_path, 'rb') as file:
+                    head = file.read(Plugins.MAGIC_SIZE)
+            except (IOError, OSError):
+                head = None
+
+        for name, spec in Plugins.FORMATS.items():
+            if head is not None and all(head[offset:offset + len(value)] == value for offset, value in spec['magic']):
+                return name
+            if head is None and os.path.splitext(file_path)[1].lower() in spec['extensions']:
+                return name
+        raise IOError('Unsupported file format!')
@@ -0,0 +1,339 @@
+#!/usr/bin/python3
+
+import os
+import zlib
+import struct
+
+import numpy
+
+
+class PngReader(object):
+    """
+    Streaming PNG decoder, yields the picture in horizontal strips of RGB values. IDAT data is inflated as it is
+    needed and only the strip being decoded is held in memory, so reading can stop at any row.
+
+    Supports non-interlaced 8-bit greyscale, RGB, palette, greyscale with alpha and RGBA pictures (alpha is
+    dropped, as by Image.convert('RGB')).
+
+    """
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    # bytes per pixel by colour type
+    CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+    # compressed bytes read at once
+    READ_SIZE = 1 << 16
+
+    def __init__(self, file_path):
+        """
+        :param file_path: PNG file path or readable binary file object, only the header is read
+        """
+        # file objects (streams) are closed by caller
+        self.own_file = isinstance(file_path, (str, os.PathLike))
+        self.file = open(file_path, 'rb') if self.own_file else file_path
+        try:
+            if self.file.read(len(PngReader.SIGNATURE)) != PngReader.SIGNATURE:
+                raise IOError('Not a PNG file!')
+            chunk_type, data = self.read_chunk()
+            if chunk_type != b'IHDR':
+                raise IOError('PNG file doesn\'t start with IHDR!')
+            self.width, self.height, depth, self.color_type, _, _, interlace = struct.unpack('>IIBBBBB', data)
+            if depth != 8 or interlace or self.color_type not in PngReader.CHANNELS:
+                raise ValueError('Only non-interlaced 8-bit PNG can be read in strips!')
+        except Exception:
+            self.close()
+            raise
+        self.bpp = PngReader.CHANNELS[self.color_type]
+        self.stride = self.width * self.bpp
+        self.palette = None
+        self.remaining = 0
+        self.crc = 0
+        self.started = False
+        self.finished = False
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
+
+    def read_chunk(self):
+        """
+        Reads the next chunk and checks its CRC.
+
+        :return: chunk type, data
+        """
+        header = self.file.read(8)
+        if len(header) < 8:
+            raise IOError('Unexpected end of PNG file!')
+        length, chunk_type = struct.unpack('>I4s', header)
+        data = self.file.read(length)
+        crc = self.file.read(4)
+        if len(data) < length or len(crc) < 4:
+            raise IOError('Unexpected end of PNG file!')
+        if struct.unpack('>I', crc)[0] != zlib.crc32(chunk_type + data) & 0xFFFFFFFF:
+            raise IOError('Corrupted PNG chunk {}!'.format(chunk_type.decode('latin-1')))
+        return chunk_type, data
+
+    def read_compressed(self):
+        """
+        Returns the next piece of IDAT data, empty bytes after the last IDAT chunk.
+        """
+        while not self.remaining:
+            if self.finished:
+                return b''
+            header = self.file.read(8)
+            if len(header) < 8:
+                raise IOError('Unexpected end of PNG file!')
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type == b'IDAT':
+                self.remaining = length
+                self.crc = zlib.crc32(chunk_type)
+                self.started = True
+                if not length:
+                    self.check_crc()
+                continue
+            # image data ends with the first chunk after IDAT chunks
+            if self.started or chunk_type == b'IEND':
+                self.finished = True
+                return b''
+            data = self.file.read(length)
+            self.file.read(4)
+            if chunk_type == b'PLTE':
+                self.palette = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 3)
+        data = self.file.read(min(self.remaining, PngReader.READ_SIZE))
+        if not data:
+            raise IOError('Unexpected end of PNG file!')
+        self.crc = zlib.crc32(data, self.crc)
+        self.remaining -= len(data)
+        if not self.remaining:
+            self.check_crc()
+        return data
+
+    def check_crc(self):
+        if struct.unpack('>I', self.file.read(4))[0] != self.crc & 0xFFFFFFFF:
+            raise IOError('Corrupted PNG chunk IDAT!')
+
+    @staticmethod
+    def paeth(left, up, up_left):
+        up_difference = up - up_left
+        left_difference = left - up_left
+        distance_left = numpy.abs(up_difference)
+        distance_up = numpy.abs(left_difference)
+        distance_up_left = numpy.abs(up_difference + left_difference)
+        return numpy.where((distance_left <= distance_up) & (distance_left <= distance_up_left), left,
+                           numpy.where(distance_up <= distance_up_left, up, up_left))
+
+    @staticmethod
+    def predict(filter_type, left, up, up_left):
+        if filter_type == 0:
+            return 0
+        if filter_type == 1:
+            return left
+        if filter_type == 2:
+            return up
+        if filter_type == 3:
+            return (left + up) >> 1
+        return PngReader.paeth(left, up, up_left)
+
+    def unfilter_row(self, filter_type, row, prior):
+        """
+        Reverses filter None, Sub or Up of one row.
+        """
+        if filter_type == 0:
+            return row
+        if filter_type == 1:
+            return row.reshape(-1, self.bpp).cumsum(axis=0, dtype=numpy.uint8).reshape(-1)
+        return row + prior
+
+    def unfilter_wavefront(self, filter_types, rows, prior):
+        """
+        Reverses any filters of consecutive rows. Average and Paeth depend on the decoded left neighbour, so the
+        rows are skewed and pixels on one anti-diagonal (independent of each other) are decoded at once.
+
+        :param filter_types: uint8 array of filter types of rows
+        :param rows: uint8 array (rows, stride) of filtered bytes
+        :param prior: uint8 array (stride) of the row above
+        :return: uint8 array (rows, stride)
+        """
+        count = len(rows)
+        width = self.width
+        # skewed[r + 1, c + r + 2] is pixel c of row r, row 0 is the row above, missing neighbours are zero
+        skewed = numpy.zeros((count + 1, width + count + 2, self.bpp), dtype=numpy.int16)
+        skewed[0, 1:width + 1] = prior.reshape(width, self.bpp)
+        row_index = numpy.arange(count)[:, numpy.newaxis]
+        column_index = row_index + numpy.arange(width)[numpy.newaxis, :] + 2
+        filtered = numpy.zeros((count, width + count + 2, self.bpp), dtype=numpy.int16)
+        filtered[row_index, column_index] = rows.reshape(count, width, self.bpp)
+
+        # the last filter type is the default, rows of other types are selected by masks
+        filter_kinds = numpy.unique(filter_types)
+        masks = [(filter_type, (filter_types == filter_type)[:, numpy.newaxis]) for filter_type in filter_kinds[:-1]]
+        for diagonal in range(2, width + count + 1):
+            # rows having a pixel on the diagonal
+            first = max(0, diagonal - width - 1)
+            last = min(count, diagonal - 1)
+            left = skewed[first + 1:last + 1, diagonal - 1]
+            up = skewed[first:last, diagonal - 1]
+            up_left = skewed[first:last, diagonal - 2]
+            predicted = PngReader.predict(filter_kinds[-1], left, up, up_left)
+            for filter_type, mask in masks:
+                predicted = numpy.where(mask[first:last], PngReader.predict(filter_type, left, up, up_left),
+                                        predicted)
+            skewed[first + 1:last + 1, diagonal] = (filtered[first:last, diagonal] + predicted) & 0xFF
+        return skewed[row_index + 1, column_index].astype(numpy.uint8).reshape(count, self.stride)
+
+    def get_rgb(self, rows):
+        """
+        Converts decoded rows to RGB values.
+
+        :param rows: uint8 array (rows, stride)
+        :return: uint8 array (rows, width, 3)
+        """
+        pixels = rows.reshape(len(rows), self.width, self.bpp)
+        if self.color_type == 3:
+            if self.palette is None:
+                raise IOError('PNG palette is missing!')
+            return self.palette[pixels[:, :, 0]]
+        if self.color_type in (0, 4):
+            return numpy.repeat(pixels[:, :, :1], 3, axis=2)
+        return numpy.ascontiguousarray(pixels[:, :, :3])
+
+    def iter_strips(self, strip_rows):
+        """
+        Decodes the picture strip by strip.
+
+        :param strip_rows: rows per strip
+        :return: iterator of uint8 arrays (rows, width, 3)
+        """
+        inflater = zlib.decompressobj()
+        row_size = self.stride + 1
+        prior = numpy.zeros(self.stride, dtype=numpy.uint8)
+        buffer = b''
+        for start in range(0, self.height, strip_rows):
+            needed = min(strip_rows, self.height - start) * row_size
+            pieces = [buffer]
+            size = len(buffer)
+            while size < needed:
+                data = inflater.unconsumed_tail or self.read_compressed()
+                if not data:
+                    raise IOError('PNG image data is truncated!')
+                piece = inflater.decompress(data, needed - size)
+                pieces.append(piece)
+                size += len(piece)
+            buffer = b''.join(pieces)
+            data = numpy.frombuffer(buffer, dtype=numpy.uint8, count=needed).reshape(-1, row_size)
+            buffer = buffer[needed:]
+
+            filter_types = data[:, 0]
+            if filter_types.max() > 4:
+                raise IOError('Unknown PNG filter type!')
+            if filter_types.max() < 3:
+                decoded = numpy.empty((len(data), self.stride), dtype=numpy.uint8)
+                for row in range(len(data)):
+                    decoded[row] = prior = self.unfilter_row(filter_types[row], data[row, 1:], prior)
+            else:
+                # Average and Paeth depend on the left neighbour
+                decoded = self.unfilter_wavefront(filter_types, data[:, 1:], prior)
+            prior = decoded[-1].copy()
+            yield self.get_rgb(decoded)
+
+
+class PngWriter(object):
+    """
+    Streaming PNG encoder of 8-bit RGB pictures, strips of rows are filtered and deflated as they come and
+    written in IDAT chunks, so the whole picture never is in memory.
+
+    """
+    # uncompressed bytes of IDAT chunk
+    CHUNK_SIZE = 1 << 18
+    COMPRESS_LEVEL = 6
+    # rows filtered at once, filtering needs several int16 copies of rows
+    FILTER_ROWS = 16
+
+    def __init__(self, file_path, width, height):
+        """
+        :param file_path: output PNG file path or writable binary file object
+        :param width: width in pixels
+        :param height: height in pixels
+        """
+        self.own_file = isinstance(file_path, (str, os.PathLike))
+        self.file = open(file_path, 'wb') if self.own_file else file_path
+        self.width = width
+        self.height = height
+        self.stride = width * 3
+        self.rows = 0
+        self.prior = numpy.zeros(self.stride, dtype=numpy.uint8)
+        self.deflater = zlib.compressobj(PngWriter.COMPRESS_LEVEL)
+        self.pending = []
+        self.pending_size = 0
+        self.file.write(PngReader.SIGNATURE)
+        self.write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def write_chunk(self, chunk_type, data):
+        self.file.write(struct.pack('>I', len(data)) + chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    def write_compressed(self, data, flush=False):
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+        if self.pending_size >= PngWriter.CHUNK_SIZE or flush and self.pending:
+            self.write_chunk(b'IDAT', b''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def filter_rows(self, rows):
+        """
+        Filters rows by the filter with the smallest sum of absolute differences (heuristic of libpng).
+
+        :param rows: uint8 array (rows, stride)
+        :return: uint8 array (rows, stride + 1) with filter type in the first column
+        """
+        values = rows.astype(numpy.int16)
+        up = numpy.vstack((self.prior[numpy.newaxis, :], rows[:-1])).astype(numpy.int16)
+        left = numpy.zeros_like(values)
+        left[:, 3:] = values[:, :-3]
+        up_left = numpy.zeros_like(values)
+        up_left[:, 3:] = up[:, :-3]
+
+        best = numpy.empty((len(rows), self.stride + 1), dtype=numpy.uint8)
+        best_score = numpy.full(len(rows), numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+        for filter_type, predicted in enumerate((0, left, up, (left + up) >> 1)):
+            filtered = ((values - predicted) & 0xFF).astype(numpy.uint8)
+            self.choose_filter(best, best_score, filter_type, filtered)
+        filtered = ((values - PngReader.paeth(left, up, up_left)) & 0xFF).astype(numpy.uint8)
+        self.choose_filter(best, best_score, 4, filtered)
+        return best
+
+    @staticmethod
+    def choose_filter(best, best_score, filter_type, filtered):
+        # bytes as signed differences
+        score = numpy.abs(filtered.view(numpy.int8).astype(numpy.int16)).sum(axis=1, dtype=numpy.int64)
+        better = score < best_score
+        best_score[better] = score[better]
+        best[better, 0] = filter_type
+        best[better, 1:] = filtered[better]
+
+    def write_strip(self, pixels):
+        """
+        Appends rows to the picture.
+
+        :param pixels: uint8 array (rows, width, 3)
+        """
+        rows = pixels.reshape(-1, self.stride)
+        if self.rows + len(rows) > self.height:
+            raise ValueError('Too many rows for PNG of height {}!'.format(self.height))
+        for start in range(0, len(rows), PngWriter.FILTER_ROWS):
+            part = rows[start:start + PngWriter.FILTER_ROWS]
+            self.write_compressed(self.deflater.compress(self.filter_rows(part).tobytes()))
+            self.prior = part[-1].copy()
+        self.rows += len(rows)
+
+    def close(self):
+        try:
+            if self.rows == self.height:
+                self.write_compressed(self.deflater.flush(), flush=True)
+                self.write_chunk(b'IEND', b'')
+        finally:
+            if self.own_file:
+                self.file.close()
+        if self.rows != self.height:
+            raise ValueError('PNG has {} of {} rows!'.format(self.rows, self.height))
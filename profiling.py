@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+
+import sys
+import time
+import json
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Profiler(object):
+    """
+    Lightweight instrumentation of named spans (elapsed time, bytes processed, peak allocations) and counters.
+
+    Disabled by default, spans cost only one function call then. Host applications can collect metrics
+    with add_hook or report.
+
+    """
+    enabled = False
+    trace_memory = False
+    spans = {}
+    counters = {}
+    hooks = []
+    stack = []
+
+    @staticmethod
+    def enable(trace_memory=True):
+        """
+        Starts collecting metrics.
+
+        :param trace_memory: record peak allocations by tracemalloc (slower)
+        """
+        Profiler.enabled = True
+        Profiler.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @staticmethod
+    def disable():
+        Profiler.enabled = False
+        if Profiler.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        Profiler.trace_memory = False
+
+    @staticmethod
+    def reset():
+        Profiler.spans = {}
+        Profiler.counters = {}
+        Profiler.stack = []
+
+    @staticmethod
+    def add_hook(callback):
+        """
+        Registers callback called with name and metrics dict of every finished span.
+
+        :param callback: function(name, metrics)
+        """
+        Profiler.hooks.append(callback)
+
+    @staticmethod
+    def remove_hook(callback):
+        Profiler.hooks.remove(callback)
+
+    @staticmethod
+    def count(name, value=1):
+        """
+        Increments counter.
+
+        :param name: counter name
+        :param value: increment
+        """
+        if Profiler.enabled:
+            Profiler.counters[name] = Profiler.counters.get(name, 0) + value
+
+    @staticmethod
+    @contextmanager
+    def span(name, size=0):
+        """
+        Measures the block of code as named span.
+
+        :param name: span name, e.g. 'audio.embed'
+        :param size: number of bytes processed in the span, can be set later as span['bytes']
+        """
+        frame = {'peak': 0, 'bytes': size}
+        if not Profiler.enabled:
+            yield frame
+            return
+
+        # tracemalloc has one peak, nested spans keep peaks of their parents
+        if Profiler.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if Profiler.stack:
+                Profiler.stack[-1]['peak'] = max(Profiler.stack[-1]['peak'], peak)
+            frame['start'] = current
+            tracemalloc.reset_peak()
+        Profiler.stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield frame
+        finally:
+            elapsed = time.perf_counter() - start
+            Profiler.stack.pop()
+            peak_bytes = 0
+            if Profiler.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame['peak'])
+                peak_bytes = peak - frame['start']
+                if Profiler.stack:
+                    Profiler.stack[-1]['peak'] = max(Profiler.stack[-1]['peak'], peak)
+
+            metrics = Profiler.spans.setdefault(name, {'count': 0, 'seconds': 0.0, 'bytes': 0, 'peak_bytes': 0})
+            metrics['count'] += 1
+            metrics['seconds'] += elapsed
+            metrics['bytes'] += frame['bytes']
+            metrics['peak_bytes'] = max(metrics['peak_bytes'], peak_bytes)
+
+            for hook in Profiler.hooks:
+                hook(name, {'seconds': elapsed, 'bytes': frame['bytes'], 'peak_bytes': peak_bytes})
+
+    @staticmethod
+    def report():
+        """
+        Returns collected metrics.
+
+        :return: dict with spans (count, seconds, bytes, MB/s, peak_bytes) and counters
+        """
+        spans = {}
+        for name, metrics in Profiler.spans.items():
+            spans[name] = dict(metrics)
+            if metrics['bytes'] and metrics['seconds']:
+                spans[name]['mb_per_s'] = metrics['bytes'] / 1024 / 1024 / metrics['seconds']
+        return {'spans': spans, 'counters': dict(Profiler.counters)}
+
+    @staticmethod
+    def write_report(output=None):
+        """
+        Writes JSON report.
+
+        :param output: file path, stderr by default
+        """
+        report = json.dumps(Profiler.report(), indent=2, sort_keys=True)
+        if output and output != '-':
+            with open(output, 'w') as file:
+                file.write(report + '\n')
+        else:
+            sys.stderr.write(report + '\n')
@@ -1,23 +1,33 @@
 #!/usr/bin/python3
 
 import sys
+import atexit
 import logging
 import argparse
 
-from crypto import Crypto
-from audio import Audio
-from picture import Picture
+# carrier formats, ciphers and subcommands are imported on first use, see Plugins
+from plugins import Plugins
 
 
 class Pystego(object):
-    def __init__(self, file_path, secret, algorithm=None, bits=1):
+    def __init__(self, file_path, secret, algorithm=None, bits=1, max_memory=None, fill=False, mmap=False,
+                 key_provider=None, pub_key=None, compression=None, output=None, scatter_key=None, workers=None):
         """
         The constructor function that provides all unnecessary inputs.
 
         :param file_path: The input file for hiding secret.
-        :param secret: The secret to be hidden in file.
+        :param secret: The secret to be hidden in file, '@' followed by path of file with secret or '-' for stdin.
         :param algorithm: The encryption algorithm for secret.
         :param bits: The number of LSB
+        :param max_memory: Memory limit for audio processing in MB, whole file at once by default
+        :param fill: Fill the rest of audio capacity by random bytes
+        :param mmap: Copy audio file and rewrite only samples holding the secret
+        :param key_provider: KeyProvider of passphrase or private key, interactive prompt by default
+        :param pub_key: ECC recipient public key (hex or file), new key pair per secret by default
+        :param compression: codec compressing the secret before encryption (zlib, bz2, lzma, auto)
+        :param output: file for recovered secret or '-' for stdout, secret is printed by default
+        :param scatter_key: key bytes scattering the secret over samples (see Scatter), sequential by default
+        :param workers: number of processes embedding or extracting segments of the audio file
 
         """
 
@@ -28,11 +38,22 @@ class Pystego(object):
         self.file_path = file_path
         self.algorithm = algorithm
 
+        # LSB bits are detected from the payload header while recovering
         if not bits:
-            self.bits = 1
+            self.bits = None
         else:
             self.bits = int(str(bits))
 
+        self.max_memory = max_memory
+        self.fill = fill
+        self.mmap = mmap
+        self.key_provider = key_provider
+        self.pub_key = pub_key
+        self.compression = compression
+        self.output = output
+        self.scatter_key = scatter_key
+        self.workers = workers
+
         try:
             file = open(file_path)
         except Exception as e:
@@ -44,112 +65,564 @@ class Pystego(object):
         level = logging.INFO
         logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=level)
 
+    @staticmethod
+    def open_source(secret):
+        """
+        Opens secret argument: '-' is stdin, '@path' is read from the file, anything else is the secret itself.
+
+        :param secret: secret argument
+        :return: binary file object or secret string
+        """
+        if secret == '-':
+            return sys.stdin.buffer
+        if secret.startswith('@'):
+            return open(secret[1:], 'rb')
+        return secret
+
+    def open_secret(self):
+        return Pystego.open_source(self.secret)
+
+    def read_secret(self):
+        """
+        Reads whole secret (ciphers, pictures).
+
+        :return: secret bytes
+        """
+        secret = self.open_secret()
+        if isinstance(secret, str):
+            return secret.encode()
+        data = secret.read()
+        if secret is not sys.stdin.buffer:
+            secret.close()
+        return data
+
+    def compress_secret(self):
+        """
+        Reads and compresses secret before encryption.
+
+        :return: payload flags with codec, secret bytes
+        """
+        from payload import Payload
+        secret = self.read_secret()
+        if not self.compression:
+            return 0, secret
+        return Payload.compress(secret, self.compression)
+
+    def open_output(self):
+        """
+        Opens output of recovered secret.
+
+        :return: binary file object
+        """
+        if self.output == '-':
+            return sys.__stdout__.buffer
+        return open(self.output, 'wb')
+
+    def write_secret(self, secret):
+        """
+        Writes decrypted secret bytes to output or prints it.
+
+        :param secret: secret bytes
+        """
+        if not self.output:
+            print('Decrypted secret: {}'.format(secret.decode()))
+            return
+        output = self.open_output()
+        output.write(secret)
+        output.flush()
+        if self.output != '-':
+            output.close()
+            print('Decrypted secret was written to {}.'.format(str(self.output)))
+
     def manage_audio(self):
         """
         Function takes care about Audio, encrypts and decrypts secret.
 
         """
+        from payload import Payload
+        Audio = Plugins.get_format('wav')
+        Crypto = Plugins.get_cipher(self.algorithm) if self.algorithm else None
+
+        block_frames = None
+        if self.max_memory:
+            block_frames = Audio.get_block_frames(self.file_path, float(self.max_memory) * 1024 * 1024)
 
-        if self.algorithm == 'aes':
+        if self.algorithm == 'aead':
+            if self.secret:
+                flags, secret = self.compress_secret()
+                encrypted_secret = Crypto.aead_encrypt(secret, self.key_provider)
+                Audio.hide_data(encrypted_secret, self.file_path, lsb_bits=self.bits or 1,
+                                block_frames=block_frames, fill=self.fill,
+                                mmap=self.mmap, flags=flags, scatter_key=self.scatter_key, workers=self.workers)
+            else:
+                frame = Audio.recover_frame(self.file_path, lsb_bits=self.bits, block_frames=block_frames,
+                                            scatter_key=self.scatter_key, workers=self.workers)
+                if frame is None:
+                    raise ValueError('This file doesn\'t contain any hidden secret!')
+                header, encrypted_secret = frame
+                decrypted_secret = Crypto.aead_decrypt(encrypted_secret, self.key_provider)
+                self.write_secret(Payload.decompress(decrypted_secret, header.flags))
+        elif self.algorithm == 'aes':
             if self.secret:
-                encrypted_secret = Crypto.aes_encrypt(self.secret)
+                if self.compression:
+                    print('Compression is not supported for aes, the secret is stored uncompressed.')
+                encrypted_secret = Crypto.aes_encrypt(self.read_secret().decode(), self.key_provider)
                 print('Ciphertext: {}'.format(str(encrypted_secret)))
-                Audio.hide_data(str(encrypted_secret), self.file_path, lsb_bits=self.bits)
+                Audio.hide_data(str(encrypted_secret), self.file_path, lsb_bits=self.bits or 1,
+                                block_frames=block_frames, fill=self.fill,
+                                mmap=self.mmap, scatter_key=self.scatter_key, workers=self.workers)
             else:
-                encrypted_secret = Audio.recover_data(self.file_path, lsb_bits=self.bits)
-                decrypted_secret = Crypto.aes_decrypt(encrypted_secret)
+                encrypted_secret = Audio.recover_data(self.file_path, lsb_bits=self.bits, block_frames=block_frames,
+                                                      scatter_key=self.scatter_key, workers=self.workers)
+                decrypted_secret = Crypto.aes_decrypt(encrypted_secret, self.key_provider)
                 print('Decrypted secret: {}'.format(str(decrypted_secret)))
         elif self.algorithm == 'ecc':
-            if self.secret:
-                pub_key, encrypted_secret = Crypto.ecc_encrypt(self.secret)
-                Audio.hide_data(pub_key + encrypted_secret, self.file_path, lsb_bits=self.bits)
+            if self.secret and self.pub_key:
+                flags, secret = self.compress_secret()
+                encrypted_secret = Crypto.ecc_encrypt_bytes(secret, self.pub_key)
+                Audio.hide_data(encrypted_secret, self.file_path, lsb_bits=self.bits or 1,
+                                block_frames=block_frames, fill=self.fill,
+                                mmap=self.mmap, flags=flags, scatter_key=self.scatter_key, workers=self.workers)
+            elif self.secret:
+                if self.compression:
+                    print('Compression needs --pubkey for ecc, the secret is stored uncompressed.')
+                pub_key, encrypted_secret = Crypto.ecc_encrypt(self.read_secret().decode())
+                Audio.hide_data(pub_key + encrypted_secret, self.file_path, lsb_bits=self.bits or 1,
+                                block_frames=block_frames, fill=self.fill,
+                                mmap=self.mmap, scatter_key=self.scatter_key, workers=self.workers)
             else:
-                cipher = Audio.recover_data(self.file_path, lsb_bits=self.bits)
+                frame = Audio.recover_frame(self.file_path, lsb_bits=self.bits, block_frames=block_frames,
+                                            scatter_key=self.scatter_key, workers=self.workers)
+                if frame is not None and Crypto.is_ecc_bytes(frame[1]):
+                    header, cipher = frame
+                    decrypted_secret = Crypto.ecc_decrypt_bytes(cipher, self.key_provider)
+                    self.write_secret(Payload.decompress(decrypted_secret, header.flags))
+                    return
+
+                # older ciphers - hex public key (194 characters) followed by hex cipher
+                if frame is not None:
+                    cipher = frame[1].decode()
+                else:
+                    cipher = Audio.recover_data(self.file_path, lsb_bits=self.bits, block_frames=block_frames,
+                                                scatter_key=self.scatter_key, workers=self.workers)
                 pub_key, encrypted_secret = cipher[:194], cipher[194:]
                 print('Public key: {}'.format(str(pub_key)))
                 print('Ciphertext: {}'.format(str(encrypted_secret)))
-                decrypted_secret = Crypto.ecc_decrypt(pub_key, encrypted_secret)
+                decrypted_secret = Crypto.ecc_decrypt(pub_key, encrypted_secret, self.key_provider)
 
                 print('Decrypted secret: {}'.format(str(decrypted_secret)))
         else:
             if self.secret:
-                Audio.hide_data(self.secret, self.file_path, lsb_bits=self.bits)
+                Audio.hide_data(self.open_secret(), self.file_path, lsb_bits=self.bits or 1,
+                                block_frames=block_frames, fill=self.fill, mmap=self.mmap,
+                                compression=self.compression, scatter_key=self.scatter_key, workers=self.workers)
+            elif self.output:
+                output = self.open_output()
+                written = Audio.recover_to_file(self.file_path, output, lsb_bits=self.bits, block_frames=block_frames,
+                                                scatter_key=self.scatter_key)
+                if self.output != '-':
+                    output.close()
+                    print('Hidden secret ({} B) was written to {}.'.format(str(written), str(self.output)))
             else:
-                Audio.recover_data(self.file_path, lsb_bits=self.bits)  # LSB bits = 1 by default
+                # LSB bits are detected by default
+                Audio.recover_data(self.file_path, lsb_bits=self.bits, block_frames=block_frames,
+                                   scatter_key=self.scatter_key, workers=self.workers)
+
+    def manage_picture(self, Picture, auto_detect=False, **options):
+        """
+        Hides secret in picture or extracts it, the same way for PNG and uncompressed pictures (see Raster).
+
+        :param Picture: carrier class of the picture format
+        :param auto_detect: increase number of LSB when the secret doesn't fit
+        :param options: options of the carrier class (engine, scatter_key, codec, fill, png, ...)
+        """
+        if self.bits is not None and not 0 < self.bits < 8:
+            raise ValueError('Number of LSB must be between 1 and 7!')
+        if self.bits is None:
+            print("INFO: Using default value(1) for LSB method.")
+        bits = self.bits or 1
+
+        if self.secret:
+            Picture(self.file_path, self.read_secret(), bits, auto_detect, compression=self.compression,
+                    **options).hide_secret()
+        elif self.output:
+            secret = Picture(self.file_path, num_of_bits=bits, **options).extract_bytes()
+            output = self.open_output()
+            output.write(secret)
+            output.flush()
+            if self.output != '-':
+                output.close()
+                print('Hidden secret ({} B) was written to {}.'.format(str(len(secret)), str(self.output)))
+        else:
+            Picture(self.file_path, num_of_bits=bits, **options).extract_secret()
+
+
+def batch_main(argv):
+    """
+    Batch subcommand, runs jobs for many carriers on a process pool.
+
+    :param argv: command line arguments after 'batch'
+    """
+    from batch import Batch
+    parser = argparse.ArgumentParser(prog='pystego.py batch', description='Steganography tool - batch mode',
+                                     add_help=True)
+    parser.add_argument('source', action='store', help='directory, glob or manifest (JSON lines with carrier, secret, '
+                                                       'output)')
+    parser.add_argument('-a', '--action', action='store', dest='action', choices=Batch.ACTIONS, default='recover',
+                        help='-a action for all jobs (hide, recover, detect)', required=False)
+    parser.add_argument('-s', '--secret', action='store', dest='secret', help='-s secret for hide jobs',
+                        required=False)
+    parser.add_argument('-b', '--bits', action='store', dest='bits', help='-b number of LSB', required=False)
+    parser.add_argument('--algorithm', action='store', dest='algorithm', choices=('aead', 'ecc'),
+                        help='--algorithm encrypt secrets (aead, ecc)', required=False)
+    parser.add_argument('--key-env', action='store', dest='key_env', help='--key-env NAME passphrase from environment '
+                                                                          'variable', required=False)
+    parser.add_argument('--key-file', action='store', dest='key_file', help='--key-file FILE passphrase or private key '
+                                                                            'from file', required=False)
+    parser.add_argument('--pubkey', action='store', dest='pub_key', help='--pubkey HEX_OR_FILE ECC recipient public '
+                                                                          'key', required=False)
+    parser.add_argument('-z', '--compress', action='store', dest='compression', choices=('zlib', 'bz2', 'lzma', 'auto'),
+                        help='-z compress secrets of hide jobs (zlib, bz2, lzma, auto)', required=False)
+    parser.add_argument('-j', '--jobs', action='store', dest='workers', type=int,
+                        help='-j number of processes, number of cores by default', required=False)
+    parser.add_argument('-l', '--log', action='store', dest='log', default='batch.jsonl',
+                        help='-l JSON lines result log', required=False)
+    args = parser.parse_args(argv)
+
+    jobs = Batch.load_jobs(args.source, args.action, args.secret, args.bits, args.algorithm, args.key_env,
+                           args.key_file, args.pub_key, args.compression)
+    results = Batch.run(jobs, args.log, args.workers)
+    failed = len([result for result in results if result['status'] != 'ok'])
+    print('Finished {} jobs, {} failed. Results: {}'.format(str(len(results)), str(failed), str(args.log)))
+    sys.exit(1 if failed else 0)
+
+
+def shard_main(argv):
+    """
+    Shard subcommand, splits secret across many carriers and reassembles it.
+
+    :param argv: command line arguments after 'shard'
+    """
+    from shard import Shard
+    parser = argparse.ArgumentParser(prog='pystego.py shard', description='Steganography tool - sharding',
+                                     add_help=True)
+    parser.add_argument('action', action='store', choices=('hide', 'recover'), help='hide or recover secret')
+    parser.add_argument('files', action='store', nargs='+', help='carriers (hide), stego files or manifest '
+                                                                 '(recover); directories and globs are expanded')
+    parser.add_argument('-s', '--secret', action='store', dest='secret', help='-s <string>, @file or - for stdin',
+                        required=False)
+    parser.add_argument('-o', '--output', action='store', dest='output', help='-o directory of stego files (hide), '
+                                                                              'file or - for stdout (recover)',
+                        required=False)
+    parser.add_argument('--manifest', action='store', dest='manifest', help='--manifest FILE write reassembly '
+                                                                            'manifest (hide)', required=False)
+    parser.add_argument('-b', '--max-bits', action='store', dest='max_bits', type=int, default=8,
+                        help='-b the highest number of LSB', required=False)
+    parser.add_argument('-z', '--compress', action='store', dest='compression', choices=('zlib', 'bz2', 'lzma', 'auto'),
+                        help='-z compress secret (zlib, bz2, lzma, auto)', required=False)
+    parser.add_argument('-j', '--jobs', action='store', dest='workers', type=int,
+                        help='-j number of processes, number of cores by default', required=False)
+    args = parser.parse_args(argv)
+
+    if args.action == 'hide':
+        if not args.secret:
+            parser.error('hide needs -s secret')
+        secret = Pystego.open_source(args.secret)
+        outputs = Shard.hide(secret, args.files, args.output, args.manifest, args.workers, args.compression,
+                             args.max_bits)
+        for output in outputs:
+            print(output)
+    elif not args.output or args.output == '-':
+        # stdout carries the secret, messages go to stderr
+        sys.stdout = sys.stderr
+        Shard.recover(args.files, sys.__stdout__.buffer, args.workers)
+    else:
+        with open(args.output, 'wb') as output:
+            written = Shard.recover(args.files, output, args.workers)
+        print('Secret ({} B) was written to {}.'.format(str(written), str(args.output)))
+    sys.exit(0)
+
+
+def index_main(argv):
+    """
+    Index subcommand, keeps SQLite index of carriers and finds carriers for secret size.
+
+    :param argv: command line arguments after 'index'
+    """
+    from index import CarrierIndex
+    parser = argparse.ArgumentParser(prog='pystego.py index', description='Steganography tool - carrier index',
+                                     add_help=True)
+    parser.add_argument('action', action='store', choices=('update', 'find', 'info'),
+                        help='update index, find carriers or show indexed file')
+    parser.add_argument('paths', action='store', nargs='*', help='files or directories (update), file (info)')
+    parser.add_argument('--db', action='store', dest='db', default='carriers.sqlite', help='--db index file',
+                        required=False)
+    parser.add_argument('-n', '--size', action='store', dest='size', type=int, default=0,
+                        help='-n secret size in bytes (find)', required=False)
+    parser.add_argument('-b', '--bits', action='store', dest='bits', type=int, default=1,
+                        help='-b the highest number of LSB (find)', required=False)
+    parser.add_argument('--format', action='store', dest='format', choices=sorted(Plugins.FORMATS),
+                        help='--format carrier format (find)', required=False)
+    parser.add_argument('-l', '--limit', action='store', dest='limit', type=int, default=1,
+                        help='-l number of carriers (find)', required=False)
+    args = parser.parse_args(argv)
+
+    carrier_index = CarrierIndex(args.db)
+    if args.action == 'update':
+        stats = carrier_index.update(args.paths)
+        print('Probed {probed}, unchanged {unchanged}, failed {failed}, removed {removed} files.'.format(**stats))
+    elif args.action == 'find':
+        carriers = carrier_index.find(args.size, args.bits, args.format, args.limit)
+        if not carriers:
+            print('No carrier holds {} B with {} LSB!'.format(str(args.size), str(args.bits)))
+        for carrier in carriers:
+            print('{} LSB: {} capacity: {} B'.format(carrier.path, str(carrier.lsb_bits), str(carrier.capacity)))
+    else:
+        for path in args.paths:
+            print(carrier_index.get(path))
+    carrier_index.close()
+    sys.exit(0)
+
+
+def serve_main(argv):
+    """
+    Serve subcommand, runs daemon answering hide/recover/detect requests over Unix socket (see client.py).
+
+    :param argv: command line arguments after 'serve'
+    """
+    from server import Server
+    parser = argparse.ArgumentParser(prog='pystego.py serve', description='Steganography tool - daemon',
+                                     add_help=True)
+    parser.add_argument('--socket', action='store', dest='socket', default='pystego.sock',
+                        help='--socket PATH Unix socket', required=False)
+    parser.add_argument('-j', '--jobs', action='store', dest='workers', type=int,
+                        help='-j number of processes, number of cores by default', required=False)
+    parser.add_argument('--max-pending', action='store', dest='max_pending', type=int,
+                        help='--max-pending requests in progress before the server stops reading, 2 per process '
+                             'by default', required=False)
+    parser.add_argument('-t', '--timeout', action='store', dest='timeout', type=float, default=60,
+                        help='-t default request timeout in seconds', required=False)
+    parser.add_argument('--key-env', action='store', dest='key_env', help='--key-env NAME default passphrase from '
+                                                                          'environment variable', required=False)
+    parser.add_argument('--key-file', action='store', dest='key_file', help='--key-file FILE default passphrase or '
+                                                                            'private key from file', required=False)
+    args = parser.parse_args(argv)
+
+    Server(args.socket, args.workers, args.max_pending, args.timeout, args.key_env, args.key_file).run()
+    sys.exit(0)
+
+
+def analyze_main(argv):
+    """
+    Analyze subcommand, estimates LSB embedding rate of many PNG and WAV files on a process pool.
+
+    :param argv: command line arguments after 'analyze'
+    """
+    from index import CarrierIndex
+    from steganalysis import Steganalysis
+    parser = argparse.ArgumentParser(prog='pystego.py analyze', description='Steganography tool - steganalysis',
+                                     add_help=True)
+    parser.add_argument('paths', action='store', nargs='+', help='files or directories (recursively)')
+    parser.add_argument('-t', '--threshold', action='store', dest='threshold', type=float,
+                        default=Steganalysis.THRESHOLD, help='-t embedding rate reported as suspicious',
+                        required=False)
+    parser.add_argument('--max-frames', action='store', dest='max_frames', type=int,
+                        help='--max-frames audio frames analysed from the start', required=False)
+    parser.add_argument('-j', '--jobs', action='store', dest='workers', type=int,
+                        help='-j number of processes, number of cores by default', required=False)
+    parser.add_argument('-l', '--log', action='store', dest='log', help='-l JSON lines result log', required=False)
+    args = parser.parse_args(argv)
+
+    files = [path for path, stat in CarrierIndex.scan(args.paths)]
+    results = Steganalysis.run(files, args.log, args.workers, args.max_frames)
+    suspicious = failed = 0
+    for result in results:
+        if result['status'] != 'ok':
+            failed += 1
+            print('{} error: {}'.format(result['file'], result['error']))
+            continue
+        flag = result['rate'] >= args.threshold
+        suspicious += flag
+        print('{} rate: {:.3f} (RS {:.3f}, SPA {:.3f}, chi-square {:.2f}){}'.format(
+            result['file'], result['rate'], result['rs'], result['spa'], result['chi_square'],
+            ' SUSPICIOUS' if flag else ''))
+    print('Analysed {} files, {} suspicious, {} failed.'.format(str(len(results)), str(suspicious), str(failed)))
+    sys.exit(0)
+
+
+def keygen_main(argv):
+    """
+    Keygen subcommand, generates reusable ECC recipient keys.
+
+    :param argv: command line arguments after 'keygen'
+    """
+    parser = argparse.ArgumentParser(prog='pystego.py keygen', description='Steganography tool - ECC keys',
+                                     add_help=True)
+    parser.add_argument('prefix', action='store', help='keys are written to <prefix>.pub and <prefix>.key')
+    args = parser.parse_args(argv)
+
+    pub_key, priv_key = Plugins.get_cipher('ecc').ecc_generate_keys(args.prefix)
+    print('Public key: {}'.format(pub_key))
+    print('Keys saved to {0}.pub and {0}.key'.format(args.prefix))
+    sys.exit(0)
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        batch_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'keygen':
+        keygen_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'shard':
+        shard_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'index':
+        index_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'analyze':
+        analyze_main(sys.argv[2:])
+
     # optional arguments
     parser = argparse.ArgumentParser(usage='$prog [options] -f <file> -s <secret>', description='Steganography tool',
                                      add_help=True, epilog='Steganography tool. Written by group number 3, BUT FEEC, '
                                                            'MKRI project, 2019')
     parser.add_argument('-f', '--file', action='store', dest='file', help='-f dusk.png (target file)', required=True)
-    parser.add_argument('-c', '--compare', action='store', dest='file2', help='-f dusk.png (file with the secret)',
+    parser.add_argument('-c', '--compare', action='store', dest='file2', help='-c dusk_secret.png (file with the '
+                                                                              'secret, PNG or WAV)',
+                        required=False)
+    parser.add_argument('-s', '--secret', action='store', dest='secret', help='-s <string>, @file or - for stdin',
                         required=False)
-    parser.add_argument('-s', '--secret', action='store', dest='secret', help='-s <file_or_string>', required=False)
     parser.add_argument('-i', '--investigate', action='store_true', dest='investigate',
                         help='-c Returns audio info and capacity', required=False)
-    parser.add_argument('-a', '--algorithm', action='store', dest='algorithm', help='-a Choose algorithm (aes, ecc)',
-                        required=False)
-    parser.add_argument('-d', '--detect', action='store_true', dest='detection', help='-d Detect steganography method',
+    parser.add_argument('-a', '--algorithm', action='store', dest='algorithm',
+                        help='-a Choose algorithm (aes, aead, ecc)', required=False)
+    parser.add_argument('-d', '--detect', action='store_true', dest='detection', help='-d Detect hidden secret and '
+                                                                                     'estimate LSB embedding rate',
                         required=False)
     parser.add_argument('-b', '--bits', action='store', dest='bits', help='-b number of bits in which the secret '
                                                                           'will be stored', required=False)
+    parser.add_argument('-m', '--max-memory', action='store', dest='max_memory', help='-m memory limit in MB for '
+                                                                                      'audio processing, audio is '
+                                                                                      'processed in blocks',
+                        required=False)
+    parser.add_argument('--fill', action='store_true', dest='fill', help='--fill fill the rest of capacity of audio '
+                                                                         'or BMP, PPM, TIFF by random bytes',
+                        required=False)
+    parser.add_argument('--mmap', action='store_true', dest='mmap', help='--mmap copy audio file and rewrite only '
+                                                                         'samples holding the secret', required=False)
+    parser.add_argument('--key-env', action='store', dest='key_env', help='--key-env NAME passphrase or private key '
+                                                                          'from environment variable', required=False)
+    parser.add_argument('--key-file', action='store', dest='key_file', help='--key-file FILE passphrase or private key '
+                                                                            'from file', required=False)
+    parser.add_argument('--pubkey', action='store', dest='pub_key', help='--pubkey HEX_OR_FILE ECC recipient public '
+                                                                          'key', required=False)
+    parser.add_argument('-z', '--compress', action='store', dest='compression', choices=('zlib', 'bz2', 'lzma', 'auto'),
+                        help='-z compress secret (zlib, bz2, lzma, auto)', required=False)
+    parser.add_argument('-o', '--output', action='store', dest='output', help='-o FILE write recovered secret to file '
+                                                                              '(- for stdout)', required=False)
+    parser.add_argument('--scatter', action='store_true', dest='scatter', help='--scatter hide the secret in samples '
+                                                                               'or pixels chosen by the passphrase',
+                        required=False)
+    parser.add_argument('-j', '--jobs', action='store', dest='workers', type=int,
+                        help='-j number of processes embedding or extracting parts of one file', required=False)
+    parser.add_argument('--strips', action='store', dest='strip_rows', type=int, nargs='?', const=0,
+                        help='--strips [ROWS] process PNG in strips of rows (256 by default), memory doesn\'t depend '
+                             'on size of picture', required=False)
+    parser.add_argument('--png', action='store_true', dest='png', help='--png write BMP, PPM or TIFF with secret '
+                                                                       'as PNG', required=False)
+    parser.add_argument('--codec', action='store', dest='codec', choices=('packed', 'hex'),
+                        help='--codec CODEC bitstream of PNG secret, hex is readable by older versions', required=False)
+    parser.add_argument('--profile', action='store', dest='profile', nargs='?', const='-',
+                        help='--profile [FILE] JSON report of time, bytes and peak allocations per phase (stderr by '
+                             'default)', required=False)
     parser.set_defaults(auto=False)
     args = parser.parse_args()
 
+    if args.output == '-':
+        # stdout carries the secret, messages go to stderr
+        sys.stdout = sys.stderr
+
+    if args.profile:
+        from profiling import Profiler
+        Profiler.enable()
+        atexit.register(Profiler.write_report, args.profile)
+
     # instance of the class Pystego
-    pystego = Pystego(args.file, args.secret, args.algorithm, args.bits)
+    key_provider = None
+    if args.key_env or args.key_file:
+        from crypto import KeyProvider
+        key_provider = KeyProvider.from_env(args.key_env) if args.key_env else KeyProvider.from_file(args.key_file)
+    scatter_key = None
+    if args.scatter:
+        # positions are derived from the same passphrase as encryption keys, with own salt
+        from crypto import KeyProvider
+        from scatter import Scatter
+        key_provider = key_provider or KeyProvider.prompt()
+        scatter_key = key_provider.derive_key(Scatter.SALT)
+
+    pystego = Pystego(args.file, args.secret, args.algorithm, args.bits, args.max_memory, args.fill,
+                      args.mmap, key_provider, args.pub_key, args.compression, args.output, scatter_key,
+                      args.workers)
     logging.info('Created pystego instance successfully. Entering decision tree.')
 
+    # carrier format is detected by magic bytes, only its module is imported
+    carrier_format = Plugins.detect_format(args.file)
+    Audio = Plugins.get_format('wav') if carrier_format == 'wav' else None
+    # PNG and uncompressed pictures (BMP, PPM, PGM, TIFF, see Raster) share the interface of Picture
+    Picture = Plugins.get_format(carrier_format) if carrier_format != 'wav' else None
+    picture_options = {'engine': 'strips', 'strip_rows': args.strip_rows} if args.strip_rows is not None else {}
+    if scatter_key is not None:
+        picture_options['scatter_key'] = scatter_key
+    if args.workers:
+        picture_options['workers'] = args.workers
+    if args.codec:
+        picture_options['codec'] = args.codec
+    if Picture is not None and carrier_format != 'png':
+        if args.strip_rows is not None or scatter_key is not None or args.codec:
+            raise ValueError('--strips, --scatter and --codec apply to PNG only!')
+        picture_options = {'fill': args.fill, 'png': args.png}
+
     # decision tree of function calling
     if args.file:
         if args.file2:
-            if '.png' in args.file and '.png' in args.file2:
+            if Picture is not None and Plugins.detect_format(args.file2) != 'wav':
                 try:
                     Picture.compare_pictures(args.file, args.file2)
                     sys.exit(0)
                 except Exception as e:
                     print("FAIL: Could not compare images: %s" % str(e))
                     sys.exit(1)
+            elif carrier_format == 'wav' and Plugins.detect_format(args.file2) == 'wav':
+                try:
+                    Audio.compare_audio(args.file, args.file2)
+                    sys.exit(0)
+                except Exception as e:
+                    print('FAIL: Could not compare audio: {}'.format(str(e)))
+                    sys.exit(1)
         if args.investigate:
-            if '.wav' in args.file:
+            if carrier_format == 'wav':
                 Audio.get_info(args.file)
                 Audio.get_file_capacity(args.file)
+            else:
+                Picture.get_file_capacity(args.file, int(args.bits or 1))
         elif args.detection:
-            if '.wav' in args.file:
+            if carrier_format == 'wav':
                 Audio.detect_data(args.file)
+            # LSB embedding by any tool
+            from steganalysis import Steganalysis
+            Steganalysis.detect(args.file)
         elif args.secret or not args.secret:
             # hiding or recovering secret from file
-            if '.wav' in args.file:
+            if carrier_format == 'wav':
                 pystego.manage_audio()
-            elif '.png' in args.file:
-                if args.secret:
-                    try:
-                        if args.bits is not None:
-                            if 0 < int(args.bits) < 8:
-                                Picture(args.file, args.secret, int(args.bits), args.auto).hide_secret()
-                        else:
-                            print("INFO: Using default value(1) for LSB method.")
-                            Picture(args.file, args.secret, auto_detect=args.auto).hide_secret()
-                        sys.exit(0)
-                    except Exception as e:
-                        print(e)
-                        sys.exit(1)
-                else:
-                    try:
-                        if args.bits is not None:
-                            if 0 < int(args.bits) < 8:
-                                Picture(args.file, num_of_bits=int(args.bits)).extract_secret()
-                        else:
-                            print("INFO: Using default value(1) for LSB method.")
-                            Picture(args.file).extract_secret()
-                        sys.exit(0)
-                    except Exception as e:
-                        print(e)
-                        sys.exit(1)
+            elif Picture is not None:
+                try:
+                    pystego.manage_picture(Picture, args.auto, **picture_options)
+                    sys.exit(0)
+                except Exception as e:
+                    print(e)
+                    sys.exit(1)
             else:
-                raise IOError('Unsupported file extension!')
+                raise IOError('Unsupported file format!')
     else:
         raise IOError('File is not specified!')
 
@@ -0,0 +1,318 @@
+#!/usr/bin/python3
+
+import os
+import struct
+from collections import namedtuple
+
+import numpy
+
+from files import Files
+from payload import Payload
+from picture import Picture, PayloadReader
+
+
+# offset - file offset of the first stored row, row_size - bytes per stored row (with padding), pixel_size - bytes
+# per stored pixel, channels - colour values per pixel (3 RGB, 1 grey), bgr - colours stored in reversed order
+Layout = namedtuple('Layout', ['format', 'width', 'height', 'offset', 'row_size', 'pixel_size', 'channels',
+                               'bottom_up', 'bgr'])
+
+
+class Raster(object):
+    """
+    Uncompressed pictures (BMP, binary PPM and PGM, uncompressed TIFF) used without decoding. The pixel region is
+    located from the header and mapped by numpy.memmap, hiding copies the file and rewrites only rows holding the
+    secret, extraction reads only rows up to the end of the secret.
+
+    Colour values are taken in the order of Picture (rows from the top, R, G, B) and the secret is stored by the
+    packed codec of Picture, so PNG written from an RGB raster as the final step is read by Picture.
+
+    """
+    # colour values processed at once
+    BLOCK_VALUES = 1 << 20
+    # TIFF tags
+    TIFF_TAGS = {256: 'width', 257: 'height', 258: 'bits', 259: 'compression', 273: 'strip_offsets',
+                 277: 'samples', 278: 'rows_per_strip', 279: 'strip_counts', 284: 'planar'}
+    # TIFF field types: SHORT, LONG
+    TIFF_TYPES = {3: 'H', 4: 'I'}
+
+    def __init__(self, path_to_image, secret=None, num_of_bits=1, auto_detect=False, fill=False, png=False,
+                 compression=None):
+        """
+        :param path_to_image: BMP, PPM, PGM or TIFF file
+        :param secret: secret string or bytes to hide
+        :param num_of_bits: number of LSB
+        :param auto_detect: increase number of LSB when the secret doesn't fit
+        :param fill: fill the rest of the capacity by random bits, values after the secret are untouched by default
+        :param png: write PNG by default (encoded once from the mapped pixels)
+        :param compression: codec compressing the secret (zlib, bz2, lzma or auto), uncompressed by default
+        """
+        self.path_to_image = path_to_image
+        self.secret = secret
+        self.number_of_bits = num_of_bits
+        self.fill = fill
+        self.png = png
+        self.layout = Raster.read_layout(path_to_image)
+        self.max_image_size = self.layout.width * self.layout.height
+        # the codec is stored in payload flags, extraction decompresses
+        self.flags = 0
+        if compression and secret is not None:
+            self.flags, self.secret = Payload.compress(self.get_secret_bytes(), compression,
+                                                       capacity=self.max_image_size * self.layout.channels // 8)
+        if auto_detect:
+            self.evaluate_space()
+
+    @staticmethod
+    def read_layout(file_path):
+        """
+        Parses header of picture.
+
+        :param file_path: BMP, PPM, PGM or TIFF file
+        :return: Layout
+        """
+        with open(file_path, 'rb') as file:
+            head = file.read(2)
+            file.seek(0)
+            if head == b'BM':
+                layout = Raster.read_bmp(file)
+            elif head in (b'P5', b'P6'):
+                layout = Raster.read_pnm(file)
+            elif head in (b'II', b'MM'):
+                layout = Raster.read_tiff(file)
+            else:
+                raise IOError('Unsupported raster format!')
+            file.seek(0, os.SEEK_END)
+            if layout.offset + layout.row_size * layout.height > file.tell():
+                raise IOError('Pixel data of {} is truncated!'.format(layout.format))
+        return layout
+
+    @staticmethod
+    def read_bmp(file):
+        header = file.read(54)
+        if len(header) < 54:
+            raise IOError('BMP header is truncated!')
+        offset, = struct.unpack('<I', header[10:14])
+        dib_size, width, height, planes, bits, compression = struct.unpack('<IiiHHI', header[14:34])
+        if dib_size < 40:
+            raise ValueError('OS/2 BMP isn\'t supported!')
+        if bits not in (24, 32) or compression != 0:
+            raise ValueError('Only uncompressed 24 and 32-bit BMP is supported!')
+        pixel_size = bits // 8
+        # rows are padded to 4 bytes, negative height is top-down picture
+        return Layout('bmp', width, abs(height), offset, (width * pixel_size + 3) // 4 * 4, pixel_size, 3,
+                      height > 0, True)
+
+    @staticmethod
+    def read_pnm(file):
+        head = file.read(1024)
+        fields = []
+        position = 2
+        while len(fields) < 3:
+            while position < len(head) and head[position:position + 1].isspace():
+                position += 1
+            if head[position:position + 1] == b'#':
+                position = head.find(b'\n', position)
+                if position == -1:
+                    raise IOError('PNM header is truncated!')
+                continue
+            end = position
+            while end < len(head) and head[end:end + 1].isdigit():
+                end += 1
+            if end == position or end == len(head):
+                raise IOError('PNM header is truncated!')
+            fields.append(int(head[position:end]))
+            position = end
+        width, height, max_value = fields
+        if max_value > 255:
+            raise ValueError('Only 8-bit PPM and PGM is supported!')
+        # single whitespace separates header and pixels
+        channels = 3 if head[:2] == b'P6' else 1
+        return Layout('ppm' if channels == 3 else 'pgm', width, height, position + 1, width * channels, channels,
+                      channels, False, False)
+
+    @staticmethod
+    def read_tiff(file):
+        order = '<' if file.read(2) == b'II' else '>'
+        magic, ifd_offset = struct.unpack(order + 'HI', file.read(6))
+        if magic != 42:
+            raise IOError('Not a TIFF file!')
+        file.seek(ifd_offset)
+        count, = struct.unpack(order + 'H', file.read(2))
+        tags = {}
+        for entry in range(count):
+            tag, field_type, value_count, value = struct.unpack(order + 'HHI4s', file.read(12))
+            if tag not in Raster.TIFF_TAGS or field_type not in Raster.TIFF_TYPES:
+                continue
+            code = Raster.TIFF_TYPES[field_type]
+            size = struct.calcsize(code) * value_count
+            if size > 4:
+                position = file.tell()
+                file.seek(struct.unpack(order + 'I', value)[0])
+                value = file.read(size)
+                file.seek(position)
+            tags[Raster.TIFF_TAGS[tag]] = struct.unpack(order + code * value_count, value[:size])
+
+        width, height = tags['width'][0], tags['height'][0]
+        samples = tags.get('samples', (1,))[0]
+        if tags.get('compression', (1,))[0] != 1:
+            raise ValueError('Only uncompressed TIFF is supported!')
+        if set(tags.get('bits', (8,))) != {8} or samples not in (1, 3, 4):
+            raise ValueError('Only 8-bit grey, RGB and RGBA TIFF is supported!')
+        if samples > 1 and tags.get('planar', (1,))[0] != 1:
+            raise ValueError('Only TIFF with interleaved channels is supported!')
+        offsets, counts = tags['strip_offsets'], tags['strip_counts']
+        # strips following each other are one region of rows
+        if any(offset + size != following for offset, size, following in zip(offsets, counts, offsets[1:])):
+            raise ValueError('TIFF strips aren\'t contiguous!')
+        return Layout('tiff', width, height, offsets[0], width * samples, samples, 1 if samples == 1 else 3,
+                      False, False)
+
+    @staticmethod
+    def get_file_capacity(file_path, num_of_bits=1):
+        """
+        Returns number of secret bytes the picture holds, only the header is read.
+
+        :param file_path: BMP, PPM, PGM or TIFF file
+        :param num_of_bits: number of LSB
+        :return: capacity in bytes
+        """
+        layout = Raster.read_layout(file_path)
+        values = layout.width * layout.height * layout.channels
+        max_bytes = max((values * num_of_bits) // 8 - Payload.HEADER_SIZE, 0)
+        print('Available kB: ' + str(max_bytes / 1024))
+        return max_bytes
+
+    def get_secret_bytes(self):
+        if isinstance(self.secret, bytes):
+            return self.secret
+        return self.secret.encode('UTF-8')
+
+    def get_required_bits(self):
+        return (Payload.HEADER_SIZE + len(self.get_secret_bytes())) * 8
+
+    def evaluate_space(self):
+        values = self.max_image_size * self.layout.channels
+        if values * self.number_of_bits < self.get_required_bits():
+            self.number_of_bits = -(-self.get_required_bits() // values)
+            if self.number_of_bits > 7:
+                raise ValueError('Could not hide the message! Secret is too large!')
+        print('INFO: Using {} bits to hide the secret'.format(self.number_of_bits))
+
+    def open_pixels(self, file_path=None, mode='r'):
+        """
+        Maps pixel region of file.
+
+        :param file_path: file with the layout of the picture, the picture by default
+        :param mode: 'r' or 'r+'
+        :return: memmap of stored rows, view (height, width, channels) of colour values in the order of Picture
+        """
+        layout = self.layout
+        rows = numpy.memmap(file_path or self.path_to_image, dtype=numpy.uint8, mode=mode, offset=layout.offset,
+                            shape=(layout.height, layout.row_size))
+        pixels = rows[:, :layout.width * layout.pixel_size].reshape(layout.height, layout.width, layout.pixel_size)
+        if layout.bottom_up:
+            pixels = pixels[::-1]
+        if layout.bgr:
+            pixels = pixels[:, :, 2::-1]
+        else:
+            pixels = pixels[:, :, :layout.channels]
+        return rows, pixels
+
+    def iter_rows(self, row_count, first_rows=None):
+        """
+        Splits rows to blocks of about BLOCK_VALUES colour values, blocks grow from first_rows.
+
+        :return: iterator of (first, last) rows
+        """
+        values_per_row = self.layout.width * self.layout.channels
+        block_rows = max(1, Raster.BLOCK_VALUES // values_per_row)
+        count = min(first_rows or block_rows, block_rows)
+        first = 0
+        while first < row_count:
+            last = min(first + count, row_count)
+            yield first, last
+            first = last
+            count = min(count * 2, block_rows)
+
+    def embed_rows(self, pixels, stream):
+        """
+        Embeds stream into colour values, only rows holding the stream are read and written (all rows with fill).
+
+        :param pixels: writable view of colour values
+        :param stream: payload header and secret
+        """
+        values_per_row = self.layout.width * self.layout.channels
+        capacity = self.layout.height * values_per_row
+        used = capacity if self.fill else min(capacity, -(-len(stream) * 8 // self.number_of_bits))
+        for first, last in self.iter_rows(-(-used // values_per_row)):
+            block = numpy.ascontiguousarray(pixels[first:last])
+            values = block.reshape(-1)[:used - first * values_per_row]
+            bits = Picture.get_stream_bits(stream, first * values_per_row * self.number_of_bits,
+                                           len(values) * self.number_of_bits)
+            Picture.embed_bits(values, bits, self.number_of_bits)
+            pixels[first:last] = block
+
+    def hide_secret(self, output_file=None):
+        """
+        Hides secret in copy of the picture, or in PNG when output_file ends with .png.
+
+        :param output_file: output file, *_secret with extension of the picture (.png with png) by default
+        :return: output file
+        """
+        if self.secret is None:
+            raise ValueError('Could not hide the message! Secret can\'t be None')
+        if self.max_image_size * self.layout.channels * self.number_of_bits < self.get_required_bits():
+            raise ValueError('Message is too large!')
+        if not output_file:
+            root, extension = os.path.splitext(self.path_to_image)
+            output_file = root + '_secret' + ('.png' if self.png else extension)
+        stream = Payload.pack(self.get_secret_bytes(), int(self.number_of_bits), self.flags)
+
+        if output_file.lower().endswith('.png'):
+            if self.layout.channels != 3:
+                raise ValueError('PNG is read by Picture as RGB, grey pictures are kept in their format!')
+            from PIL import Image
+            rows, pixels = self.open_pixels()
+            pixels = numpy.array(pixels)
+            del rows
+            self.embed_rows(pixels, stream)
+            Image.fromarray(pixels, 'RGB').save(output_file)
+        else:
+            if os.path.abspath(self.path_to_image) == os.path.abspath(output_file):
+                raise ValueError('Output file must differ from input file!')
+            Files.copy_file(self.path_to_image, output_file)
+            rows, pixels = self.open_pixels(output_file, 'r+')
+            self.embed_rows(pixels, stream)
+            rows.flush()
+            del rows, pixels
+        print('Secret was successfully hidden! LSB: {}. Destination file: {}.'.format(str(self.number_of_bits),
+                                                                                  str(output_file)))
+        return output_file
+
+    def extract_bytes(self):
+        """
+        Reads rows in growing blocks up to the end of the secret.
+
+        :return: secret bytes
+        """
+        rows, pixels = self.open_pixels()
+        header_rows = -(-Payload.HEADER_SIZE * 8 // (self.number_of_bits * self.layout.width * self.layout.channels))
+        reader = PayloadReader()
+        try:
+            for first, last in self.iter_rows(self.layout.height, header_rows):
+                values = numpy.ascontiguousarray(pixels[first:last]).reshape(-1)
+                if reader.feed(Picture.read_bits(values, self.number_of_bits)):
+                    break
+        finally:
+            del rows, pixels
+        if reader.header is None:
+            raise ValueError('This file doesn\'t contain any hidden secret!')
+        return reader.get_payload()
+
+    def extract_secret(self):
+        secret = self.extract_bytes().decode('UTF-8')
+        print('Secret found in the picture: {}'.format(secret))
+        return secret
+
+    @staticmethod
+    def compare_pictures(file_path1, file_path2, workers=None):
+        return Picture.compare_pictures(file_path1, file_path2, workers)
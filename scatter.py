@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+import hashlib
+
+import numpy
+
+
+class Scatter(object):
+    """
+    Keyed pseudo-random order of carrier positions (samples or colour values). Position of the i-th payload unit
+    is a keyed permutation of i: balanced Feistel network on the smallest power of 4 covering the carrier,
+    indices falling outside the carrier are walked through the permutation again (cycle walking).
+
+    Any range of positions is computed on its own with numpy, so hiding and recovery cost depends on the payload
+    size, not on the carrier size, and no table of positions is kept.
+
+    """
+    # salt of key derived from passphrase by KeyProvider.derive_key
+    SALT = b'pystego-scatter!'
+    ROUNDS = 6
+    # positions computed at once
+    BLOCK = 1 << 20
+
+    def __init__(self, key, size):
+        """
+        :param key: secret key bytes
+        :param size: number of carrier positions
+        """
+        if size < 1:
+            raise ValueError('Carrier has no positions to scatter!')
+        self.size = size
+        # half of the bits of the smallest even-width domain covering size
+        self.half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self.mask = numpy.uint64((1 << self.half_bits) - 1)
+        digest = hashlib.sha512(b'pystego-scatter' + bytes(key)).digest()
+        self.round_keys = numpy.frombuffer(digest[:8 * Scatter.ROUNDS], dtype='<u8').copy()
+
+    @staticmethod
+    def mix(values):
+        """
+        Finalizer of splitmix64, every input bit affects every output bit.
+
+        :param values: uint64 array, modified in place
+        """
+        values ^= values >> numpy.uint64(30)
+        values *= numpy.uint64(0xBF58476D1CE4E5B9)
+        values ^= values >> numpy.uint64(27)
+        values *= numpy.uint64(0x94D049BB133111EB)
+        values ^= values >> numpy.uint64(31)
+        return values
+
+    def permute(self, indices):
+        """
+        One pass of the Feistel network over the power of 4 domain.
+
+        :param indices: uint64 array
+        :return: uint64 array of permuted indices
+        """
+        shift = numpy.uint64(self.half_bits)
+        left = indices >> shift
+        right = indices & self.mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ (Scatter.mix(right ^ round_key) & self.mask)
+        return (left << shift) | right
+
+    def get_positions(self, start, count):
+        """
+        Returns carrier positions of payload units start .. start + count.
+
+        :param start: index of the first payload unit
+        :param count: number of payload units
+        :return: int64 array of distinct positions below size
+        """
+        if start + count > self.size:
+            raise ValueError('Payload doesn\'t fit into the carrier!')
+        positions = self.permute(numpy.arange(start, start + count, dtype=numpy.uint64))
+        outside = numpy.flatnonzero(positions >= self.size)
+        # at most 3/4 of the domain is outside, so few passes are needed
+        while len(outside):
+            positions[outside] = self.permute(positions[outside])
+            outside = outside[positions[outside] >= self.size]
+        return positions.astype(numpy.int64)
+
+    def iter_positions(self, count, block=None):
+        """
+        Returns positions of payload units 0 .. count in blocks.
+
+        :param count: number of payload units
+        :param block: units per block, multiple of 8 keeps whole bytes of payload in a block
+        :return: iterator of (index of the first unit, int64 array of positions)
+        """
+        block = block or Scatter.BLOCK
+        for start in range(0, count, block):
+            yield start, self.get_positions(start, min(block, count - start))
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+
+import os
+import json
+import time
+import signal
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import Batch
+from crypto import KeyProvider
+
+
+class Server(object):
+    """
+    Daemon serving hide/recover/detect requests over Unix domain socket, modules and keys stay loaded.
+
+    Protocol is JSON lines: every request is a batch job (see Batch) with optional id and timeout in seconds,
+    every response is the job result with the same id. Requests of one connection run concurrently and responses
+    come in order of completion. Action ping answers without a worker.
+
+    CPU-bound work runs on a process pool. When max_pending requests are in progress, the server stops reading
+    requests, so clients are slowed down by the socket instead of queueing without limit. A request which timed out
+    holds its slot until its worker finishes the job.
+
+    """
+
+    def __init__(self, socket_path, workers=None, max_pending=None, timeout=60, key_env=None, key_file=None):
+        """
+        :param socket_path: path of Unix domain socket
+        :param workers: number of processes, number of cores by default
+        :param max_pending: maximal number of requests in progress, 2 per worker by default
+        :param timeout: default request timeout in seconds
+        :param key_env: environment variable with passphrase derived in advance in every worker
+        :param key_file: file with passphrase derived in advance in every worker
+        """
+        self.socket_path = socket_path
+        self.workers = workers or os.cpu_count()
+        self.max_pending = max_pending or 2 * self.workers
+        self.timeout = timeout
+        self.key_env = key_env
+        self.key_file = key_file
+        self.executor = None
+        self.pending = None
+        self.stats = {'requests': 0, 'errors': 0, 'timeouts': 0}
+
+    @staticmethod
+    def warm_up(key_env=None, key_file=None):
+        """
+        Initializer of worker processes: imports numpy, PIL and crypto modules and derives keys in advance.
+
+        :param key_env: environment variable with passphrase
+        :param key_file: file with passphrase
+        """
+        import numpy  # noqa: F401
+        import audio  # noqa: F401
+        import picture  # noqa: F401
+        if key_env:
+            KeyProvider.from_env(key_env).derive_key()
+        if key_file:
+            KeyProvider.from_file(key_file).derive_key()
+
+    @staticmethod
+    def ping():
+        return os.getpid()
+
+    async def execute(self, job):
+        """
+        Runs one request on the process pool, the slot of the request is released when the job is finished.
+
+        :param job: request dict
+        :return: response dict
+        """
+        self.stats['requests'] += 1
+        if job.get('action') == 'ping':
+            self.pending.release()
+            return {'id': job.get('id'), 'action': 'ping', 'status': 'ok', 'result': self.stats}
+        if self.key_env and not job.get('key_file'):
+            job.setdefault('key_env', self.key_env)
+        if self.key_file and not job.get('key_env'):
+            job.setdefault('key_file', self.key_file)
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            future = loop.run_in_executor(self.executor, Batch.run_job, job)
+        except Exception:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda _: self.pending.release())
+        try:
+            # timeout doesn't cancel the job, it keeps the worker busy
+            result = await asyncio.wait_for(asyncio.shield(future), job.get('timeout') or self.timeout)
+        except asyncio.TimeoutError:
+            # the worker finishes the job and frees the slot, only the answer is dropped
+            self.stats['timeouts'] += 1
+            result = {'carrier': job.get('carrier'), 'action': job.get('action'), 'status': 'timeout',
+                      'error': 'Request timed out!', 'elapsed': time.perf_counter() - start}
+        if result['status'] == 'error':
+            self.stats['errors'] += 1
+        result['id'] = job.get('id')
+        return result
+
+    async def respond(self, job, writer, lock):
+        try:
+            response = await self.execute(job)
+        except Exception as e:
+            # broken pool or job which can't be sent to a worker, pipelined clients still get the answer
+            self.stats['errors'] += 1
+            response = {'id': job.get('id'), 'carrier': job.get('carrier'), 'action': job.get('action'),
+                        'status': 'error', 'error': str(e)}
+        try:
+            async with lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+
+    async def handle(self, reader, writer):
+        """
+        Serves one client connection.
+        """
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                # idle connections hold no slot, a request waits for a slot before the next one is read
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    job = json.loads(line)
+                    if not isinstance(job, dict):
+                        raise ValueError('Request must be JSON object!')
+                except ValueError as e:
+                    async with lock:
+                        writer.write(json.dumps({'status': 'error', 'error': str(e)}).encode() + b'\n')
+                        await writer.drain()
+                    continue
+                await self.pending.acquire()
+                task = asyncio.ensure_future(self.respond(job, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """
+        Starts workers and serves until SIGINT/SIGTERM.
+        """
+        self.pending = asyncio.Semaphore(self.max_pending)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=Server.warm_up,
+                                            initargs=(self.key_env, self.key_file))
+        loop = asyncio.get_running_loop()
+        # start all workers before the first request
+        await asyncio.gather(*[loop.run_in_executor(self.executor, Server.ping) for _ in range(self.workers)])
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        # socket is created accessible by the owner only, there is no window between bind and chmod
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        finally:
+            os.umask(umask)
+
+        stop = loop.create_future()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set_result, None)
+        print('Listening on {} with {} workers.'.format(str(self.socket_path), str(self.workers)), flush=True)
+        try:
+            await stop
+        finally:
+            server.close()
+            await server.wait_closed()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def run(self):
+        asyncio.run(self.serve())
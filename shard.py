@@ -0,0 +1,307 @@
+#!/usr/bin/python3
+
+import io
+import os
+import glob
+import json
+import zlib
+import struct
+import tempfile
+import contextlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from payload import Payload, PayloadFile
+from plugins import Plugins
+from profiling import Profiler
+
+
+# index - position of shard, count - number of shards, offset/length/checksum - whole payload, payload_id - random
+# id shared by shards of one payload, shard_checksum - CRC32 of shard data
+ShardHeader = namedtuple('ShardHeader', ['version', 'flags', 'index', 'count', 'offset', 'length', 'checksum',
+                                         'payload_id', 'shard_checksum'])
+
+
+class Shard(object):
+    """
+    Splits payload across many carriers (WAV, PNG and uncompressed pictures) and reassembles it from the stego
+    files in any order.
+
+    Every shard starts with sequence/integrity header: magic, version, flags (compression codec of the whole
+    payload), shard index and count, offset in payload, payload length and CRC32, payload id and CRC32 of shard.
+
+    """
+    MAGIC = b'PSHD'
+    VERSION = 1
+    HEADER = struct.Struct('<4sBBIIQQI8sI')
+    HEADER_SIZE = HEADER.size
+    # pictures (Picture, Raster) store at most 7 LSB
+    MAX_BITS = {'wav': 8}
+    PICTURE_BITS = 7
+
+    @staticmethod
+    def expand(sources):
+        """
+        Expands directories and glob patterns to carrier files.
+
+        :param sources: list of files, directories or globs
+        :return: sorted list of carrier files
+        """
+        extensions = Plugins.get_extensions()
+        carriers = []
+        for source in sources:
+            if os.path.isdir(source):
+                carriers.extend(os.path.join(source, name) for name in os.listdir(source))
+            else:
+                carriers.extend(glob.glob(source) or [source])
+        return sorted(set(carrier for carrier in carriers if carrier.lower().endswith(extensions)))
+
+    @staticmethod
+    def get_max_bits(carrier_format):
+        return Shard.MAX_BITS.get(carrier_format, Shard.PICTURE_BITS)
+
+    @staticmethod
+    def get_capacity(file_path, lsb_bits):
+        """
+        Returns number of payload bytes a shard in carrier can hold.
+
+        :param file_path: carrier file
+        :param lsb_bits: number of LSB
+        :return: bytes, can be negative for carriers too small for headers
+        """
+        carrier_format = Plugins.detect_format(file_path)
+        if lsb_bits > Shard.get_max_bits(carrier_format):
+            return 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            if carrier_format == 'wav':
+                capacity = int(Plugins.get_format('wav').get_file_capacity(file_path, lsb_bits)) - Payload.HEADER_SIZE
+            else:
+                capacity = Plugins.get_format(carrier_format).get_file_capacity(file_path, lsb_bits)
+        return capacity - Shard.HEADER_SIZE
+
+    @staticmethod
+    def plan(carriers, length, max_bits=8):
+        """
+        Splits payload across carriers with the lowest common number of LSB. Shard sizes are proportional to
+        capacities, so every carrier is used in the same ratio.
+
+        :param carriers: list of carrier files
+        :param length: payload length in bytes
+        :param max_bits: the highest allowed number of LSB
+        :return: number of LSB, list of (carrier, offset, size)
+        """
+        for lsb_bits in range(1, max_bits + 1):
+            capacities = [max(Shard.get_capacity(carrier, lsb_bits), 0) for carrier in carriers]
+            total = sum(capacities)
+            if total >= max(length, 1):
+                break
+        else:
+            raise ValueError('Carriers capacity is not sufficient!')
+
+        sizes = [length * capacity // total for capacity in capacities]
+        # rounding remainder goes to carriers with free capacity
+        remainder = length - sum(sizes)
+        for index, capacity in enumerate(capacities):
+            extra = min(remainder, capacity - sizes[index])
+            sizes[index] += extra
+            remainder -= extra
+
+        shards = []
+        offset = 0
+        for carrier, size in zip(carriers, sizes):
+            if size or not length:
+                shards.append((carrier, offset, size))
+                offset += size
+            if not length:
+                break
+        return lsb_bits, shards
+
+    @staticmethod
+    def pack_header(header):
+        return Shard.HEADER.pack(Shard.MAGIC, *header)
+
+    @staticmethod
+    def parse_header(data):
+        """
+        Parses shard header from the start of recovered shard.
+
+        :param data: recovered bytes
+        :return: ShardHeader or None
+        """
+        if len(data) < Shard.HEADER_SIZE or data[:len(Shard.MAGIC)] != Shard.MAGIC:
+            return None
+        header = ShardHeader(*Shard.HEADER.unpack(bytes(data[:Shard.HEADER_SIZE]))[1:])
+        if header.version != Shard.VERSION:
+            raise ValueError('Unsupported shard version {}!'.format(str(header.version)))
+        return header
+
+    @staticmethod
+    def get_output(carrier, output_dir=None):
+        """
+        Returns stego file path of carrier, *_secret.<ext> by default.
+        """
+        name, extension = os.path.splitext(carrier)
+        if output_dir:
+            return os.path.join(output_dir, os.path.basename(carrier))
+        return name + '_secret' + extension
+
+    @staticmethod
+    def hide_shard(carrier, shard, output, lsb_bits):
+        """
+        Hides one shard (in a worker process).
+
+        :return: stego file path
+        """
+        carrier_format = Plugins.detect_format(carrier)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if carrier_format == 'wav':
+                return Plugins.get_format('wav').hide_data(shard, carrier, output, lsb_bits=lsb_bits)
+            return Plugins.get_format(carrier_format)(carrier, shard, lsb_bits).hide_secret(output)
+
+    @staticmethod
+    def hide(secret, carriers, output_dir=None, manifest=None, workers=None, compression=None, max_bits=8):
+        """
+        Splits secret to shards and hides them in carriers concurrently.
+
+        :param secret: string, bytes or binary file object
+        :param carriers: list of carrier files, directories or globs
+        :param output_dir: directory of stego files, *_secret.<ext> next to carriers by default
+        :param manifest: path of JSON reassembly manifest (stego files, shard indices, LSB), not written by default
+        :param workers: number of processes, number of cores by default
+        :param compression: codec compressing the secret (zlib, bz2, lzma, auto)
+        :param max_bits: the highest allowed number of LSB
+        :return: list of stego files in order of shards
+        """
+        if isinstance(secret, str):
+            data = secret.encode()
+        elif hasattr(secret, 'read'):
+            data = Payload.open_file(secret)
+        else:
+            data = bytes(secret)
+        flags = 0
+        if compression:
+            flags, data = Payload.compress(data, compression)
+
+        carriers = Shard.expand(carriers)
+        if not carriers:
+            raise ValueError('No carriers found!')
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        lsb_bits, shards = Shard.plan(carriers, len(data), max_bits)
+        checksum = Payload.checksum(data)
+        payload_id = os.urandom(8)
+
+        outputs = [None] * len(shards)
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = {}
+            for index, (carrier, offset, size) in enumerate(shards):
+                with Profiler.span('shard.pack', size):
+                    shard = data[offset:offset + size]
+                    header = ShardHeader(Shard.VERSION, flags, index, len(shards), offset, len(data), checksum,
+                                         payload_id, zlib.crc32(shard) & 0xFFFFFFFF)
+                    shard = Shard.pack_header(header) + shard
+                future = executor.submit(Shard.hide_shard, carrier, shard, Shard.get_output(carrier, output_dir),
+                                         lsb_bits)
+                futures[future] = index
+            for future in as_completed(futures):
+                outputs[futures[future]] = future.result()
+
+        if manifest:
+            with open(manifest, 'w') as file:
+                json.dump({'payload_id': payload_id.hex(), 'length': len(data), 'checksum': checksum,
+                           'flags': flags, 'lsb_bits': lsb_bits,
+                           'shards': [{'file': output, 'index': index, 'offset': offset, 'size': size}
+                                      for index, (output, (carrier, offset, size)) in enumerate(zip(outputs, shards))]},
+                          file, indent=2)
+        print('Secret was split to {} shards! LSB: {}.'.format(str(len(shards)), str(lsb_bits)))
+        return outputs
+
+    @staticmethod
+    def recover_shard(stego_file, lsb_bits=None):
+        """
+        Recovers one shard (in a worker process). Picture LSB count is tried from 1 unless given.
+
+        :return: stego file path, ShardHeader, shard data
+        """
+        carrier_format = Plugins.detect_format(stego_file)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if carrier_format == 'wav':
+                data = Plugins.get_format('wav').recover_payload(stego_file, lsb_bits)
+            else:
+                Picture = Plugins.get_format(carrier_format)
+                data = None
+                for bits in ([lsb_bits] if lsb_bits else range(1, Shard.PICTURE_BITS + 1)):
+                    try:
+                        data = Picture(stego_file, num_of_bits=bits).extract_bytes()
+                    except Exception:
+                        continue
+                    if data[:len(Shard.MAGIC)] == Shard.MAGIC:
+                        break
+        header = Shard.parse_header(data or b'')
+        if header is None:
+            raise ValueError('{} doesn\'t contain any shard!'.format(str(stego_file)))
+        data = data[Shard.HEADER_SIZE:]
+        if zlib.crc32(data) & 0xFFFFFFFF != header.shard_checksum:
+            raise ValueError('Shard {} in {} is corrupted!'.format(str(header.index), str(stego_file)))
+        return stego_file, header, data
+
+    @staticmethod
+    def recover(stego_files, output, workers=None):
+        """
+        Recovers shards concurrently and reassembles the payload, the stego files can be in any order.
+
+        :param stego_files: list of stego files, directories, globs or path of manifest (.json)
+        :param output: binary file object
+        :param workers: number of processes, number of cores by default
+        :return: number of written bytes
+        """
+        bits = {}
+        if len(stego_files) == 1 and stego_files[0].lower().endswith('.json'):
+            with open(stego_files[0]) as file:
+                manifest = json.load(file)
+            stego_files = [shard['file'] for shard in manifest['shards']]
+            bits = dict((stego_file, manifest['lsb_bits']) for stego_file in stego_files)
+        stego_files = Shard.expand(stego_files)
+
+        # shards are written at their offsets as they come
+        spool = tempfile.SpooledTemporaryFile(max_size=Payload.SPOOL_SIZE)
+        first = None
+        indices = set()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = [executor.submit(Shard.recover_shard, stego_file, bits.get(stego_file))
+                       for stego_file in stego_files]
+            for future in as_completed(futures):
+                stego_file, header, data = future.result()
+                first = first or header
+                if header.payload_id != first.payload_id:
+                    raise ValueError('{} belongs to another payload!'.format(str(stego_file)))
+                indices.add(header.index)
+                with Profiler.span('shard.write', len(data)):
+                    spool.seek(header.offset)
+                    spool.write(data)
+
+        if first is None:
+            raise ValueError('No shards found!')
+        missing = sorted(set(range(first.count)) - indices)
+        if missing:
+            raise ValueError('Missing shards: {}!'.format(', '.join(str(index) for index in missing)))
+
+        spool.seek(0)
+        data = PayloadFile(spool)
+        if len(data) != first.length or Payload.checksum(data) != first.checksum:
+            raise ValueError('Reassembled payload checksum doesn\'t match!')
+
+        written = 0
+        decompressor = Payload.get_decompressor(first.flags)
+        for block in data.blocks():
+            if decompressor is not None:
+                block = decompressor.decompress(block)
+            output.write(block)
+            written += len(block)
+        if hasattr(decompressor, 'flush'):
+            block = decompressor.flush()
+            output.write(block)
+            written += len(block)
+        output.flush()
+        print('Secret was reassembled from {} shards.'.format(str(first.count)))
+        return written
@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+
+import os
+import math
+import json
+import time
+import wave
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy
+
+from metrics import Metrics
+from plugins import Plugins
+from profiling import Profiler
+
+
+# chi_square - estimated length of sequential embedding (fraction of values), rs and spa - estimated embedding rate
+# (fraction of LSB carrying message) by RS and sample pair analysis, rate - the larger of rs and spa within 0..1
+Analysis = namedtuple('Analysis', ['file', 'format', 'chi_square', 'rs', 'spa', 'rate'])
+
+
+class Steganalysis(object):
+    """
+    Statistical detection of LSB replacement by any tool in PNG, WAV and uncompressed pictures: chi-square attack
+    on pairs of values, RS analysis and sample pair analysis (SPA). Every channel is analysed as numpy array,
+    estimates are averaged over channels. Neighbouring pixels in rows and consecutive samples of a channel form
+    groups and pairs.
+
+    """
+    # prefixes of chi-square attack (5 % steps)
+    CHI_SEGMENTS = 20
+    # pairs of values with smaller expected count are left out of chi-square
+    CHI_MIN_EXPECTED = 5
+    # RS groups of 4 values, mask flips the inner two
+    RS_MASK = numpy.array([0, 1, 1, 0], dtype=bool)
+    # audio frames analysed from the start of file
+    MAX_FRAMES = 1 << 22
+    # uncompressed pictures mapped by Raster
+    RASTER_FORMATS = ('bmp', 'ppm', 'pgm', 'tiff', 'tiff-be')
+    # embedding rate reported as suspicious
+    THRESHOLD = 0.1
+
+    @staticmethod
+    def load_channels(file_path, max_frames=None):
+        """
+        Reads channels of carrier.
+
+        :param file_path: PNG, WAV or uncompressed picture (see Raster)
+        :param max_frames: audio frames read from the start
+        :return: format, list of 2D int32 arrays (rows of pixels, or one row of samples), number of histogram bins
+        """
+        carrier_format = Plugins.detect_format(file_path)
+        if carrier_format == 'png':
+            from PIL import Image
+            image = Image.open(file_path)
+            if image.mode not in ('L', 'RGB', 'RGBA'):
+                image = image.convert('RGB')
+            pixels = numpy.asarray(image)
+            if pixels.ndim == 2:
+                pixels = pixels[:, :, numpy.newaxis]
+            # alpha isn't used by LSB embedding
+            bands = min(pixels.shape[2], 3)
+            return carrier_format, [pixels[:, :, band].astype(numpy.int32) for band in range(bands)], 256
+        if carrier_format in Steganalysis.RASTER_FORMATS:
+            # colour values are read from the mapped rows without decoding
+            from raster import Raster
+            pixels = Raster(file_path).open_pixels()[1]
+            return carrier_format, [pixels[:, :, band].astype(numpy.int32) for band in range(pixels.shape[2])], 256
+        if carrier_format == 'wav':
+            audio = wave.open(file_path)
+            try:
+                channel_count = audio.getnchannels()
+                sample_width = audio.getsampwidth()
+                frames = audio.readframes(max_frames or Steganalysis.MAX_FRAMES)
+            finally:
+                audio.close()
+            samples = Metrics.get_samples(frames, sample_width).reshape(-1, channel_count)
+            return carrier_format, [samples[numpy.newaxis, :, channel] for channel in range(channel_count)], \
+                256 if sample_width == 1 else 1 << 16
+        raise IOError('Steganalysis doesn\'t support {} files!'.format(str(carrier_format)))
+
+    @staticmethod
+    def chi_square(values, bins=256):
+        """
+        Chi-square attack: LSB replacement equalizes counts of values 2k and 2k+1. Probability of embedding is
+        computed for growing prefixes at once from cumulative histograms.
+
+        :param values: int array
+        :param bins: histogram size, values are taken modulo bins
+        :return: fraction of values in the longest prefix with probability of embedding above 0.5
+        """
+        values = values.ravel() & (bins - 1)
+        segments = numpy.arange(len(values), dtype=numpy.int64) * Steganalysis.CHI_SEGMENTS // max(len(values), 1)
+        histograms = numpy.bincount(segments * bins + values, minlength=Steganalysis.CHI_SEGMENTS * bins)\
+            .reshape(Steganalysis.CHI_SEGMENTS, bins).cumsum(axis=0)
+        expected = (histograms[:, 0::2] + histograms[:, 1::2]) / 2
+        used = expected >= Steganalysis.CHI_MIN_EXPECTED
+        statistics = numpy.where(used, (histograms[:, 0::2] - expected) ** 2 / numpy.maximum(expected, 1), 0)\
+            .sum(axis=1)
+        freedoms = used.sum(axis=1) - 1
+
+        length = 0.0
+        for segment, (statistic, freedom) in enumerate(zip(statistics, freedoms)):
+            if freedom > 0 and Steganalysis.chi_square_survival(statistic, freedom) > 0.5:
+                length = (segment + 1) / Steganalysis.CHI_SEGMENTS
+        return length
+
+    @staticmethod
+    def chi_square_survival(statistic, freedom):
+        """
+        Returns P(X > statistic) of chi-square distribution (Wilson-Hilferty approximation).
+        """
+        scale = 2 / (9 * freedom)
+        z = ((statistic / freedom) ** (1 / 3) - (1 - scale)) / math.sqrt(scale)
+        return 0.5 * math.erfc(z / math.sqrt(2))
+
+    @staticmethod
+    def get_rs_counts(groups):
+        """
+        Returns relative counts of regular and singular groups for mask M and -M.
+        """
+        smoothness = numpy.abs(numpy.diff(groups, axis=1)).sum(axis=1)
+        positive = numpy.abs(numpy.diff(numpy.where(Steganalysis.RS_MASK, groups ^ 1, groups), axis=1)).sum(axis=1)
+        negative = numpy.abs(numpy.diff(numpy.where(Steganalysis.RS_MASK, ((groups + 1) ^ 1) - 1, groups),
+                                        axis=1)).sum(axis=1)
+        return ((positive > smoothness).mean(), (positive < smoothness).mean(),
+                (negative > smoothness).mean(), (negative < smoothness).mean())
+
+    @staticmethod
+    def rs(values):
+        """
+        RS analysis (Fridrich, Goljan, Du): regular/singular groups under flipping of the values and of the values
+        with all LSB flipped.
+
+        :param values: 2D int array, groups are taken along rows
+        :return: estimated embedding rate
+        """
+        size = len(Steganalysis.RS_MASK)
+        groups = values[:, :values.shape[1] // size * size].reshape(-1, size)
+        if not len(groups):
+            return 0.0
+        regular, singular, regular_negative, singular_negative = Steganalysis.get_rs_counts(groups)
+        regular_flipped, singular_flipped, regular_negative_flipped, singular_negative_flipped = \
+            Steganalysis.get_rs_counts(groups ^ 1)
+
+        d0 = regular - singular
+        d1 = regular_flipped - singular_flipped
+        n0 = regular_negative - singular_negative
+        n1 = regular_negative_flipped - singular_negative_flipped
+        a = 2 * (d1 + d0)
+        b = n0 - n1 - d1 - 3 * d0
+        c = d0 - n0
+        z = Steganalysis.solve_quadratic(a, b, c)
+        return z / (z - 0.5) if z != 0.5 else 1.0
+
+    @staticmethod
+    def spa(values):
+        """
+        Sample pair analysis (Dumitrescu, Wu, Wang) of horizontally adjacent pairs.
+
+        :param values: 2D int array
+        :return: estimated embedding rate
+        """
+        u = values[:, :-1]
+        v = values[:, 1:]
+        pairs = u.size
+        if not pairs:
+            return 0.0
+        even = (v & 1) == 0
+        x = int(numpy.count_nonzero(even & (u < v) | ~even & (u > v)))
+        y = int(numpy.count_nonzero(even & (u > v) | ~even & (u < v)))
+        # pairs differing only in LSB or equal
+        gamma = int(numpy.count_nonzero((u >> 1) == (v >> 1)))
+        if not gamma:
+            return 0.0
+        return Steganalysis.solve_quadratic(gamma / 2, 2 * x - pairs, y - x, smaller=True)
+
+    @staticmethod
+    def solve_quadratic(a, b, c, smaller=False):
+        """
+        Returns root of a*z^2 + b*z + c with the smaller absolute value (or the smaller root), the extreme when
+        there are no real roots.
+        """
+        if a == 0:
+            return -c / b if b else 0.0
+        discriminant = b * b - 4 * a * c
+        if discriminant < 0:
+            return -b / (2 * a)
+        roots = ((-b + math.sqrt(discriminant)) / (2 * a), (-b - math.sqrt(discriminant)) / (2 * a))
+        return min(roots) if smaller else min(roots, key=abs)
+
+    @staticmethod
+    def analyze(file_path, max_frames=None):
+        """
+        Estimates LSB embedding rate of one file.
+
+        :param file_path: PNG, WAV or uncompressed picture
+        :param max_frames: audio frames analysed from the start
+        :return: Analysis
+        """
+        carrier_format, channels, bins = Steganalysis.load_channels(file_path, max_frames)
+        with Profiler.span('steganalysis.analyze', sum(channel.size for channel in channels)):
+            chi_square = numpy.mean([Steganalysis.chi_square(channel, bins) for channel in channels])
+            rs = numpy.mean([Steganalysis.rs(channel) for channel in channels])
+            spa = numpy.mean([Steganalysis.spa(channel) for channel in channels])
+        # RS degenerates near full embedding, SPA doesn't
+        return Analysis(file_path, carrier_format, float(chi_square), float(rs), float(spa),
+                        float(min(max(rs, spa, 0.0), 1.0)))
+
+    @staticmethod
+    def detect(file_path, threshold=None, max_frames=None):
+        """
+        Prints statistical analysis of one file.
+
+        :param threshold: embedding rate reported as suspicious
+        :return: Analysis
+        """
+        analysis = Steganalysis.analyze(file_path, max_frames)
+        print('Estimated LSB embedding rate: {:.3f} (RS {:.3f}, SPA {:.3f}, chi-square length {:.2f})'
+              .format(analysis.rate, analysis.rs, analysis.spa, analysis.chi_square))
+        if analysis.rate >= (Steganalysis.THRESHOLD if threshold is None else threshold):
+            print('LSB embedding is likely.')
+        else:
+            print('No LSB embedding was detected.')
+        return analysis
+
+    @staticmethod
+    def run_file(file_path, max_frames=None):
+        """
+        Analyses one file (in a worker process), errors are captured in result.
+
+        :return: result dict with status, analysis or error and elapsed time in seconds
+        """
+        result = {'file': file_path}
+        start = time.perf_counter()
+        try:
+            result.update(Steganalysis.analyze(file_path, max_frames)._asdict())
+            result['status'] = 'ok'
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        result['elapsed'] = time.perf_counter() - start
+        return result
+
+    @staticmethod
+    def run(files, log_file=None, workers=None, max_frames=None):
+        """
+        Analyses files on a process pool, results are written to log_file as JSON lines when files finish.
+
+        :param files: list of PNG, WAV and uncompressed picture files
+        :param log_file: path of JSON lines result log
+        :param workers: number of processes, number of cores by default
+        :param max_frames: audio frames analysed from the start
+        :return: list of results in order of files
+        """
+        results = [None] * len(files)
+        log = open(log_file, 'a') if log_file else None
+        try:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                futures = {executor.submit(Steganalysis.run_file, file_path, max_frames): index
+                           for index, file_path in enumerate(files)}
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[futures[future]] = result
+                    if log:
+                        log.write(json.dumps(result) + '\n')
+                        log.flush()
+        finally:
+            if log:
+                log.close()
+        return results
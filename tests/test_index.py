@@ -0,0 +1,70 @@
+import os
+import wave
+import sqlite3
+
+import pytest
+from PIL import Image
+
+from index import CarrierIndex
+from payload import Payload
+
+
+def create_wav(path, frames=1000):
+    with wave.open(path, 'wb') as audio:
+        audio.setnchannels(2)
+        audio.setsampwidth(2)
+        audio.setframerate(44100)
+        audio.writeframes(bytes(frames * 4))
+
+
+@pytest.fixture
+def carriers(tmp_path):
+    create_wav(str(tmp_path / 'audio.wav'))
+    Image.new('RGB', (20, 10)).save(str(tmp_path / 'picture.png'))
+    Image.new('L', (20, 10)).save(str(tmp_path / 'grey.pgm'))
+    return tmp_path
+
+
+def test_capacities(carriers, tmp_path):
+    index = CarrierIndex(str(tmp_path / 'index.sqlite'))
+    assert index.update([str(carriers)])['probed'] == 3
+    assert index.get(str(carriers / 'audio.wav'))['capacities'][2] == 2000 * 2 // 8 - Payload.HEADER_SIZE
+    assert index.get(str(carriers / 'picture.png'))['capacities'][7] == 600 * 7 // 8 - Payload.HEADER_SIZE
+    assert index.get(str(carriers / 'grey.pgm'))['capacities'][4] == 200 * 4 // 8 - Payload.HEADER_SIZE
+    assert 8 not in index.get(str(carriers / 'grey.pgm'))['capacities']
+    index.close()
+
+
+def test_migrate_recomputes_capacities(carriers, tmp_path):
+    db_path = str(tmp_path / 'index.sqlite')
+    index = CarrierIndex(db_path)
+    index.update([str(carriers)])
+    expected = index.get(str(carriers / 'picture.png'))['capacities']
+    index.close()
+
+    # index of an older version with other capacity formulas
+    db = sqlite3.connect(db_path)
+    with db:
+        db.execute('UPDATE capacities SET bytes = 1')
+        db.execute('PRAGMA user_version = 0')
+    db.close()
+    # files aren't probed again
+    os.remove(str(carriers / 'picture.png'))
+
+    index = CarrierIndex(db_path)
+    assert index.db.execute('PRAGMA user_version').fetchone()[0] == CarrierIndex.VERSION
+    assert index.get(str(carriers / 'picture.png'))['capacities'] == expected
+    assert index.find(100, max_bits=7, carrier_format='png')[0].capacity == expected[7]
+    index.close()
+
+
+def test_changed_file_which_is_not_carrier_is_removed(carriers, tmp_path):
+    index = CarrierIndex(str(tmp_path / 'index.sqlite'))
+    index.update([str(carriers)])
+    with open(str(carriers / 'audio.wav'), 'wb') as file:
+        file.write(b'not a carrier anymore')
+    stats = index.update([str(carriers)])
+    assert (stats['failed'], stats['removed']) == (1, 1)
+    assert index.get(str(carriers / 'audio.wav')) is None
+    assert index.count() == 2
+    index.close()
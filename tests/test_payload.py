@@ -0,0 +1,79 @@
+import zlib
+
+import pytest
+
+from payload import Payload
+
+
+def test_pack_round_trip():
+    secret = b'secret message' * 10
+    packed = Payload.pack(secret, 3, Payload.CODECS['zlib'])
+    header = Payload.parse_header(packed)
+    assert len(packed) == Payload.HEADER_SIZE + len(secret)
+    assert header == (Payload.VERSION, 3, Payload.CODECS['zlib'], len(secret), zlib.crc32(secret))
+    data = packed[Payload.HEADER_SIZE:]
+    Payload.verify(header, data)
+    assert data == secret
+
+
+def test_empty_secret():
+    packed = Payload.pack(b'', 1)
+    header = Payload.parse_header(packed)
+    assert header.length == 0
+    Payload.verify(header, packed[Payload.HEADER_SIZE:])
+
+
+@pytest.mark.parametrize('data', [b'', b'PSTG', b'RIFF' + bytes(Payload.HEADER_SIZE), bytes(Payload.HEADER_SIZE)])
+def test_not_payload(data):
+    assert Payload.parse_header(data) is None
+
+
+@pytest.mark.parametrize('lsb_bits', [0, 9])
+def test_invalid_lsb_bits(lsb_bits):
+    packed = bytearray(Payload.pack(b'secret', 1))
+    packed[5] = lsb_bits
+    assert Payload.parse_header(bytes(packed)) is None
+
+
+def test_unsupported_version():
+    packed = bytearray(Payload.pack(b'secret', 1))
+    packed[4] = Payload.VERSION + 1
+    with pytest.raises(ValueError):
+        Payload.parse_header(bytes(packed))
+
+
+def test_truncated():
+    packed = Payload.pack(b'secret message', 2)
+    with pytest.raises(ValueError, match='truncated'):
+        Payload.verify(Payload.parse_header(packed), packed[Payload.HEADER_SIZE:-1])
+
+
+def test_corrupted():
+    packed = bytearray(Payload.pack(b'secret message', 2))
+    packed[-1] ^= 1
+    with pytest.raises(ValueError, match='checksum'):
+        Payload.verify(Payload.parse_header(bytes(packed)), bytes(packed[Payload.HEADER_SIZE:]))
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'bz2', 'lzma'])
+def test_compression_round_trip(codec):
+    secret = b'compressible secret ' * 100
+    flags, data = Payload.compress(secret, codec)
+    assert flags & Payload.CODEC_MASK == Payload.CODECS[codec]
+    assert len(data) < len(secret)
+    assert Payload.decompress(data, flags) == secret
+
+
+def test_incompressible_stays_raw():
+    secret = bytes(range(256))
+    flags, data = Payload.compress(secret, 'zlib')
+    assert flags == Payload.CODECS['none']
+    assert data == secret
+    assert Payload.decompress(data, flags) == secret
+
+
+def test_auto_picks_codec():
+    secret = b'compressible secret ' * 100
+    flags, data = Payload.compress(secret)
+    assert flags != Payload.CODECS['none']
+    assert Payload.decompress(data, flags) == secret
@@ -0,0 +1,39 @@
+import numpy
+import pytest
+
+from scatter import Scatter
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1000, 4097])
+def test_permutation_is_bijective(size):
+    positions = Scatter(b'key', size).get_positions(0, size)
+    assert numpy.array_equal(numpy.sort(positions), numpy.arange(size))
+
+
+def test_positions_depend_on_key():
+    first = Scatter(b'key', 1000).get_positions(0, 1000)
+    assert numpy.array_equal(first, Scatter(b'key', 1000).get_positions(0, 1000))
+    assert not numpy.array_equal(first, Scatter(b'other key', 1000).get_positions(0, 1000))
+
+
+def test_blocks_match_whole_range():
+    scatter = Scatter(b'key', 5000)
+    whole = scatter.get_positions(0, 3000)
+    starts = []
+    parts = []
+    for start, positions in scatter.iter_positions(3000, block=256):
+        starts.append(start)
+        parts.append(positions)
+    assert starts == list(range(0, 3000, 256))
+    assert numpy.array_equal(numpy.concatenate(parts), whole)
+
+
+def test_range_beyond_size():
+    scatter = Scatter(b'key', 100)
+    with pytest.raises(ValueError):
+        scatter.get_positions(90, 11)
+
+
+def test_empty_carrier():
+    with pytest.raises(ValueError):
+        Scatter(b'key', 0)
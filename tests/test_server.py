@@ -0,0 +1,94 @@
+import os
+import sys
+import wave
+import subprocess
+
+import pytest
+
+from client import Client
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def create_wav(path, seconds=2, rate=44100):
+    with wave.open(path, 'wb') as audio:
+        audio.setnchannels(2)
+        audio.setsampwidth(2)
+        audio.setframerate(rate)
+        audio.writeframes(os.urandom(seconds * rate * 4))
+
+
+@pytest.fixture
+def server(tmp_path):
+    """
+    Server with one worker and one slot on a temporary socket.
+    """
+    socket_path = str(tmp_path / 'pystego.sock')
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'pystego.py'), 'serve', '--socket', socket_path,
+                                '-j', '1', '--max-pending', '1'], stdout=subprocess.PIPE, cwd=str(tmp_path))
+    try:
+        assert process.stdout.readline().startswith(b'Listening on')
+        yield socket_path
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+def test_socket_is_private(server):
+    assert os.stat(server).st_mode & 0o777 == 0o600
+
+
+def test_hide_recover(server, tmp_path):
+    carrier = str(tmp_path / 'carrier.wav')
+    output = str(tmp_path / 'carrier_secret.wav')
+    create_wav(carrier)
+    client = Client(server, timeout=60)
+    try:
+        response = client.hide(carrier, 'secret message', output, bits=2)
+        assert response['status'] == 'ok'
+        assert response['result'] == output
+        response = client.recover(output)
+        assert response['status'] == 'ok'
+        assert response['result'] == 'secret message'
+        assert client.detect(output)['result']['lsb_bits'] == 2
+    finally:
+        client.close()
+
+
+def test_idle_connection_holds_no_slot(server):
+    idle = Client(server, timeout=60)
+    client = Client(server, timeout=60)
+    try:
+        assert client.ping()['status'] == 'ok'
+    finally:
+        client.close()
+        idle.close()
+
+
+def test_timed_out_job_holds_slot(server, tmp_path):
+    carrier = str(tmp_path / 'carrier.wav')
+    output = str(tmp_path / 'carrier_secret.wav')
+    create_wav(carrier, seconds=60)
+    client = Client(server, timeout=60)
+    other = Client(server, timeout=60)
+    try:
+        response = client.hide(carrier, 'secret message', output, timeout=1e-6)
+        assert response['status'] == 'timeout'
+        # the only slot is free again when the worker has finished the job
+        response = other.ping()
+        assert response['result']['timeouts'] == 1
+        assert os.path.getsize(output) == os.path.getsize(carrier)
+    finally:
+        other.close()
+        client.close()
+
+
+def test_invalid_request(server):
+    client = Client(server, timeout=60)
+    try:
+        client.file.write(b'[1, 2]\n')
+        client.file.flush()
+        assert client.receive()['status'] == 'error'
+        assert client.ping()['status'] == 'ok'
+    finally:
+        client.close()
@@ -0,0 +1,65 @@
+import pytest
+
+from shard import Shard, ShardHeader
+
+CAPACITIES = {'a.wav': 10, 'b.wav': 7, 'c.wav': 3}
+
+
+@pytest.fixture
+def capacities(monkeypatch):
+    """
+    Carrier capacities growing linearly with the number of LSB.
+    """
+    monkeypatch.setattr(Shard, 'get_capacity', staticmethod(lambda carrier, lsb_bits: CAPACITIES[carrier] * lsb_bits))
+
+
+def check_plan(carriers, length, lsb_bits, shards):
+    offset = 0
+    for carrier, shard_offset, size in shards:
+        assert shard_offset == offset
+        assert 0 < size <= CAPACITIES[carrier] * lsb_bits
+        offset += size
+    assert offset == length
+
+
+@pytest.mark.parametrize('length', [1, 13, 19, 20])
+def test_remainder_is_distributed(capacities, length):
+    carriers = sorted(CAPACITIES)
+    lsb_bits, shards = Shard.plan(carriers, length)
+    assert lsb_bits == 1
+    check_plan(carriers, length, lsb_bits, shards)
+
+
+def test_remainder_skips_full_carriers(capacities):
+    lsb_bits, shards = Shard.plan(sorted(CAPACITIES), 19)
+    assert [size for _, _, size in shards] == [10, 7, 2]
+
+
+def test_lowest_bits(capacities):
+    carriers = sorted(CAPACITIES)
+    lsb_bits, shards = Shard.plan(carriers, 41)
+    assert lsb_bits == 3
+    check_plan(carriers, 41, lsb_bits, shards)
+    assert [size for _, _, size in shards] == [21, 14, 6]
+
+
+def test_full_capacity(capacities):
+    lsb_bits, shards = Shard.plan(sorted(CAPACITIES), 40)
+    assert lsb_bits == 2
+    assert [size for _, _, size in shards] == [20, 14, 6]
+
+
+def test_empty_payload(capacities):
+    assert Shard.plan(sorted(CAPACITIES), 0) == (1, [('a.wav', 0, 0)])
+
+
+def test_insufficient_capacity(capacities):
+    with pytest.raises(ValueError, match='not sufficient'):
+        Shard.plan(sorted(CAPACITIES), 41, max_bits=2)
+
+
+def test_header_round_trip():
+    header = ShardHeader(Shard.VERSION, 1, 2, 3, 100, 300, 12345, b'payload1', 678)
+    data = Shard.pack_header(header) + b'shard'
+    assert Shard.parse_header(data) == header
+    assert Shard.parse_header(b'PSTG' + data[4:]) is None